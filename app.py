@@ -1,23 +1,209 @@
-from flask import Flask, render_template, request, jsonify
+from flask import Flask, render_template, request, jsonify, Response, g
+import asyncio
 import numpy as np
-import joblib
+import json
 import logging
-from werkzeug.exceptions import HTTPException
+import os
+import time
+from werkzeug.exceptions import HTTPException, BadRequest
+from src.batching import MicroBatcher
+from src.cache import PredictionCache
+from src.config import DATA_PATHS
+from src.drift import DriftMonitor, state_path
+from src.logs import restart_after_fork, setup_async_logging
+from src.metrics import METRICS, merge_saved, state_path as metrics_path
+from src.registry import ModelRegistry
+
+# Set up logging: records are queued and written to app.log by a background thread
+setup_async_logging('app.log', level=getattr(logging, os.environ.get('LOG_LEVEL', 'INFO').upper()))
 
 app = Flask(__name__)
 
-# Set up logging
-logging.basicConfig(filename='app.log', level=logging.DEBUG)
+# Request instrumentation, exported on /metrics
+REQUEST_SECONDS = METRICS.histogram('churn_request_seconds', 'Request latency by endpoint')
+REQUESTS = METRICS.counter('churn_requests_total', 'Requests by endpoint and status code')
+STAGE_SECONDS = METRICS.histogram('churn_stage_seconds', 'Time spent per request stage')
+ROWS_SCORED = METRICS.counter('churn_rows_scored_total', 'Rows scored by the model')
+# Each worker of a multi-process server saves its metrics to METRICS_DIR every METRICS_SAVE_SECONDS;
+# /metrics sums the counters and histograms of all of them (gauges are those of the answering worker)
+METRICS_DIR = os.environ.get('METRICS_DIR', DATA_PATHS['metrics'])
+METRICS_SAVE_SECONDS = float(os.environ.get('METRICS_SAVE_SECONDS', 15))
 
-# Load the trained model
+# Load the trained model and the feature transformer fitted alongside it
 MODEL_PATH = 'customer_churn_gbm_model.pkl'
+TRANSFORMER_PATH = 'customer_churn_feature_transformer.pkl'
+MANIFEST_PATH = 'customer_churn_model.json'  # written last by save_model: the pair reloads as one unit
+
+# Upper bound on the number of records accepted by a single /predict/batch call
+MAX_BATCH_ROWS = 100_000
+
+# Numerical form inputs (the state code is posted as 'state')
+NUMERIC_FIELDS = [
+    'Account_length',
+    'International_plan',
+    'Number_vmail_messages',
+    'Total_day_calls',
+    'Total_day_charge',
+    'Total_eve_calls',
+    'Total_eve_charge',
+    'Total_night_calls',
+    'Total_night_charge',
+    'Total_intl_calls',
+    'Total_intl_charge',
+    'Customer_service_calls',
+]
+
+# Category of states not seen in training (Low, Medium or High; unset: the transformer's default)
+UNKNOWN_STATE_CATEGORY = os.environ.get('UNKNOWN_STATE_CATEGORY') or None
+if UNKNOWN_STATE_CATEGORY not in (None, 'Low', 'Medium', 'High'):
+    raise ValueError(f"UNKNOWN_STATE_CATEGORY must be Low, Medium or High, got '{UNKNOWN_STATE_CATEGORY}'")
+
+# Prediction cache, keyed on the engineered features and the model version (0 disables it). Only
+# calls of up to PREDICTION_CACHE_MAX_ROWS rows use it: hashing and locking every row of a large
+# batch costs more than the vectorized ensemble saves on hits
+PREDICTION_CACHE_SIZE = int(os.environ.get('PREDICTION_CACHE_SIZE', 100_000))
+PREDICTION_CACHE_TTL = float(os.environ.get('PREDICTION_CACHE_TTL', 3600))
+PREDICTION_CACHE_MAX_ROWS = int(os.environ.get('PREDICTION_CACHE_MAX_ROWS', 64))
+cache = PredictionCache(PREDICTION_CACHE_SIZE, PREDICTION_CACHE_TTL) if PREDICTION_CACHE_SIZE > 0 else None
+
+# Drift monitoring of the scored features against the training set (DRIFT=0 disables it); each
+# worker saves its counts to DRIFT_DIR every DRIFT_SAVE_SECONDS, and /drift reports on all of them
+DRIFT = os.environ.get('DRIFT', '1') == '1'
+DRIFT_DIR = os.environ.get('DRIFT_DIR', DATA_PATHS['drift'])
+DRIFT_SAVE_SECONDS = float(os.environ.get('DRIFT_SAVE_SECONDS', 30))
+drift = DriftMonitor(
+    window_seconds=float(os.environ.get('DRIFT_WINDOW_SECONDS', 3600)),
+    n_windows=int(os.environ.get('DRIFT_WINDOWS', 24)),
+)
+
 
-try:
-    model = joblib.load(MODEL_PATH)
+def reset_drift(bundle):
+    # Counts only carry over while the reference bins stay the same
+    reference = getattr(bundle.transformer, 'drift_reference', None)
+    current = drift.reference
+    if reference is None or current is None or reference.fingerprint != current.fingerprint:
+        drift.reset(reference)
+
+
+# Model registry: reloads the artifacts in the background when they change on disk
+registry = ModelRegistry(
+    MODEL_PATH, TRANSFORMER_PATH, poll_interval=float(os.environ.get('MODEL_POLL_SECONDS', 5)), manifest_path=MANIFEST_PATH
+)
+if cache is not None:
+    registry.add_listener(cache.clear)
+if DRIFT:
+    registry.add_listener(reset_drift)
+if registry.reload():
     app.logger.info("Model loaded successfully.")
-except Exception as e:
-    app.logger.error(f"Error loading model: {e}")
-    model = None
+else:
+    app.logger.error(f"Error loading model: {registry.last_error}")
+MODEL_WATCH = os.environ.get('MODEL_WATCH', '1') == '1'
+
+# Optional micro-batching: concurrent /predict calls are scored together
+MICROBATCH = os.environ.get('MICROBATCH', '0') == '1'
+MICROBATCH_MAX_SIZE = int(os.environ.get('MICROBATCH_MAX_SIZE', 64))
+MICROBATCH_WINDOW_MS = float(os.environ.get('MICROBATCH_WINDOW_MS', 2))
+
+
+def current_bundle():
+    bundle = registry.current()
+    if bundle is None:
+        app.logger.error("Model could not be loaded.")
+        raise HTTPException(description="The model could not be loaded. Please check the logs.", code=500)
+    return bundle
+
+
+def build_features(records, transformer):
+    """Build the (n, 14) float64 feature matrix for a list of input records."""
+    with STAGE_SECONDS.time(stage='features'):
+        return transformer.transform_records(records, UNKNOWN_STATE_CATEGORY)
+
+
+def score(model, features):
+    """Score a feature matrix with a single predict_proba pass.
+
+    The label is derived from the probabilities the same way the model's
+    own predict() does, so the trees are only traversed once.
+    """
+    with STAGE_SECONDS.time(stage='predict_proba'):
+        probabilities = model.predict_proba(features)
+    ROWS_SCORED.inc(len(features))
+    predictions = model.classes_[np.argmax(probabilities, axis=1)]
+    return predictions, probabilities[:, 1]
+
+
+def score_records(bundle, records):
+    """(prediction, probability) for each record, scored as one matrix."""
+    features = build_features(records, bundle.transformer)
+    if DRIFT:
+        drift.update(features)
+    if cache is not None and len(features) <= PREDICTION_CACHE_MAX_ROWS:
+        with STAGE_SECONDS.time(stage='cache'):
+            return cache.score(bundle.version, features, lambda X: score(bundle.model, X))
+    predictions, probabilities = score(bundle.model, features)
+    return list(zip(predictions.tolist(), probabilities.tolist()))
+
+
+batcher = MicroBatcher(score_records, MICROBATCH_MAX_SIZE, MICROBATCH_WINDOW_MS) if MICROBATCH else None
+
+
+def start_background_tasks(after_fork=False):
+    """Start the model watcher, micro-batcher, metrics and drift saver threads of this process.
+
+    Threads don't survive fork(), so with a preloading server (gunicorn.conf.py)
+    this runs in every worker after the fork instead of at import.
+    """
+    if after_fork:
+        restart_after_fork()
+    if MODEL_WATCH:
+        registry.start_watching()
+    if batcher is not None:
+        batcher.start()
+    if METRICS.enabled:
+        METRICS.start_saving(metrics_path(METRICS_DIR), METRICS_SAVE_SECONDS)
+    if DRIFT:
+        drift.start_saving(state_path('serve', DRIFT_DIR), DRIFT_SAVE_SECONDS)
+
+
+if os.environ.get('DEFER_BACKGROUND_TASKS', '0') != '1':
+    start_background_tasks()
+
+
+def read_batch_records():
+    """Read the records of a /predict/batch call from a JSON or NDJSON body."""
+    if request.mimetype in ('application/x-ndjson', 'application/jsonl'):
+        records = []
+        for number, line in enumerate(request.get_data(as_text=True).splitlines(), 1):
+            if not line.strip():
+                continue
+            try:
+                records.append(json.loads(line))
+            except ValueError as e:
+                raise BadRequest(description=f"Invalid JSON on line {number}: {e}")
+    else:
+        payload = request.get_json(force=True)
+        records = payload.get('records') if isinstance(payload, dict) else payload
+    if not isinstance(records, list):
+        raise BadRequest(description="Expected a JSON list of records or an object with a 'records' list.")
+    if len(records) > MAX_BATCH_ROWS:
+        raise BadRequest(description=f"A batch may contain at most {MAX_BATCH_ROWS} records.")
+    return records
+
+
+@app.before_request
+def start_timer():
+    g.request_start = time.perf_counter()
+
+
+@app.after_request
+def record_request(response):
+    endpoint = request.endpoint or 'unknown'
+    start = g.pop('request_start', None)
+    if start is not None:
+        REQUEST_SECONDS.observe(time.perf_counter() - start, endpoint=endpoint)
+    REQUESTS.inc(endpoint=endpoint, status=response.status_code)
+    return response
+
 
 @app.route('/')
 def home():
@@ -26,73 +212,126 @@ def home():
 @app.route('/predict', methods=['POST'])
 def predict():
     try:
-        if model is None:
-            app.logger.error("Model could not be loaded.")
-            raise HTTPException(description="The model could not be loaded. Please check the logs.", code=500)
+        bundle = current_bundle()
 
         # Get form data from the frontend
-        Account_length = float(request.form['Account_length'])
-        International_plan = float(request.form['International_plan'])
-        Number_vmail_messages = float(request.form['Number_vmail_messages'])
-        Total_day_calls = float(request.form['Total_day_calls'])
-        Total_day_charge = float(request.form['Total_day_charge'])
-        Total_eve_calls = float(request.form['Total_eve_calls'])
-        Total_eve_charge = float(request.form['Total_eve_charge'])
-        Total_night_calls = float(request.form['Total_night_calls'])
-        Total_night_charge = float(request.form['Total_night_charge'])
-        Total_intl_calls = float(request.form['Total_intl_calls'])
-        Total_intl_charge = float(request.form['Total_intl_charge'])
-        Customer_service_calls = float(request.form['Customer_service_calls'])
-        state = request.form['state']
-
-        # Handle state encoding
-        if state in ['AR', 'CA', 'MD', 'ME', 'MI', 'NJ', 'MS', 'MT', 'NV', 'SC', 'TX', 'WA']:
-            state_value = 2
-        elif state in ['AK', 'AL', 'AZ', 'DC', 'HI', 'IA', 'IL', 'LA', 'MO', 'MD', 'NE', 'NM', 'RI', 'TN', 'VA', 'VT', 'WI', 'WV', 'WY']:
-            state_value = 0
-        else:
-            state_value = 1
-
-        # Define the weights for the Usage Score
-        weights = [0.4, 0.3, 0.2, 0.1]  # Example weights (adjust according to your actual values)
-
-        # Calculate Usage Score
-        usage_score = (
-            Total_day_charge * weights[0] +
-            Total_eve_charge * weights[1] +
-            Total_night_charge * weights[2] +
-            Total_intl_charge * weights[3]
-        )
-
-        features = np.array([Account_length, 
-                             International_plan, 
-                             Number_vmail_messages, 
-                             Total_day_calls,
-                             Total_day_charge,
-                             Total_eve_calls,
-                             Total_eve_charge,
-                             Total_night_calls,
-                             Total_night_charge,
-                             Total_intl_calls,
-                             Total_intl_charge,
-                             Customer_service_calls,
-                             state_value,
-                             usage_score
-                             ]).reshape(1, -1)
+        with STAGE_SECONDS.time(stage='parse'):
+            record = {field: float(request.form[field]) for field in NUMERIC_FIELDS}
+            record['state'] = request.form['state']
 
         # Make prediction
-        prediction = model.predict(features)
-        probability = model.predict_proba(features)[0][1]
+        if batcher is not None:
+            prediction, probability = batcher(bundle, record)
+        else:
+            prediction, probability = score_records(bundle, [record])[0]
+        prediction = int(prediction)
 
-        app.logger.info(f"Prediction made: {prediction[0]}, Probability: {probability}")
+        app.logger.debug("Prediction made: %s, Probability: %s", prediction, probability)
 
         # Redirect to a new page with the result
-        return render_template('result.html', prediction=int(prediction[0]), churn_probability=probability)
+        with STAGE_SECONDS.time(stage='render'):
+            return render_template('result.html', prediction=prediction, churn_probability=probability)
 
     except Exception as e:
         app.logger.error(f"Error during prediction: {e}")
         return render_template('result.html', error=f"Error during prediction: {str(e)}")
 
+@app.route('/predict/batch', methods=['POST'])
+def predict_batch():
+    bundle = current_bundle()
+    with STAGE_SECONDS.time(stage='parse'):
+        records = read_batch_records()
+    try:
+        results = score_records(bundle, records)
+    except (KeyError, TypeError, ValueError) as e:
+        raise BadRequest(description=f"Invalid record: {e}")
+
+    predictions = [int(p) for p, _ in results]
+    probabilities = [q for _, q in results]
+    app.logger.debug("Batch prediction made for %d records", len(records))
+
+    if 'application/x-ndjson' in request.headers.get('Accept', ''):
+        lines = (
+            json.dumps({'prediction': p, 'churn_probability': q}) + '\n'
+            for p, q in zip(predictions, probabilities)
+        )
+        return Response(lines, mimetype='application/x-ndjson')
+    with STAGE_SECONDS.time(stage='serialize'):
+        return jsonify({
+            'predictions': predictions,
+            'churn_probabilities': probabilities,
+        })
+
+@app.route('/api/v1/predict', methods=['POST'])
+async def api_predict():
+    """JSON API: one record or a list of records in, predictions out.
+
+    With micro-batching on, a single record awaits its batch without holding
+    a scoring call of its own, so concurrent single-record requests share
+    predict_proba passes. A list is already a batch: it is scored as one
+    matrix, like /predict/batch.
+    """
+    bundle = current_bundle()
+    with STAGE_SECONDS.time(stage='parse'):
+        payload = request.get_json(force=True)
+    records = payload if isinstance(payload, list) else [payload]
+    if not records or not all(isinstance(r, dict) for r in records):
+        raise BadRequest(description="Expected a JSON record or a non-empty list of records.")
+    if len(records) > MAX_BATCH_ROWS:
+        raise BadRequest(description=f"A request may contain at most {MAX_BATCH_ROWS} records.")
+    try:
+        if batcher is not None and len(records) == 1:
+            results = [await asyncio.wrap_future(batcher.submit(bundle, records[0]))]
+        else:
+            results = await asyncio.to_thread(score_records, bundle, records)
+    except (KeyError, TypeError, ValueError) as e:
+        raise BadRequest(description=f"Invalid record: {e}")
+
+    with STAGE_SECONDS.time(stage='serialize'):
+        body = [{'prediction': int(p), 'churn_probability': q} for p, q in results]
+        return jsonify(body if isinstance(payload, list) else body[0])
+
+@app.route('/model/info', methods=['GET'])
+def model_info():
+    return jsonify(registry.info())
+
+@app.route('/model/reload', methods=['POST'])
+def model_reload():
+    # The new bundle is built here; concurrent requests keep using the current one
+    reloaded = registry.reload(force=request.args.get('force') == '1')
+    if registry.current() is None:
+        raise HTTPException(description=f"The model could not be loaded: {registry.last_error}", code=500)
+    return jsonify({'reloaded': reloaded, **registry.info()})
+
+@app.route('/cache/stats', methods=['GET'])
+def cache_stats():
+    return jsonify(cache.stats() if cache is not None else {'enabled': False})
+
+@app.route('/model/rollback', methods=['POST'])
+def model_rollback():
+    if not registry.rollback():
+        raise BadRequest(description="No previous model version to roll back to.")
+    return jsonify(registry.info())
+
+@app.route('/drift', methods=['GET'])
+def drift_report():
+    """PSI/KS of the recent scored features of every worker against the training set."""
+    if not DRIFT:
+        return jsonify({'enabled': False})
+    return jsonify(drift.report(DRIFT_DIR, exclude=state_path('serve', DRIFT_DIR)))
+
+@app.route('/metrics', methods=['GET'])
+def metrics():
+    # Point-in-time values of the cache and batcher, next to the request metrics
+    if cache is not None:
+        for name, value in cache.stats().items():
+            METRICS.gauge(f'churn_cache_{name}', 'Prediction cache statistics').set(value)
+    if batcher is not None:
+        for name, value in batcher.stats().items():
+            METRICS.gauge(f'churn_batcher_{name}', 'Micro-batcher statistics').set(value)
+    merged = merge_saved(METRICS, METRICS_DIR, exclude=metrics_path(METRICS_DIR))
+    return Response(merged.render_prometheus(), mimetype='text/plain; version=0.0.4')
+
 # Handle HTTP exceptions
 @app.errorhandler(HTTPException)
 def handle_exception(error):
@@ -102,4 +341,5 @@ def handle_exception(error):
     return jsonify({'error': error.description}), error.code
 
 if __name__ == '__main__':
+    # Development server; production runs gunicorn with gunicorn.conf.py
     app.run(port=5001)
@@ -0,0 +1,131 @@
+"""HTTP load test: the Flask development server against gunicorn.
+
+    python -m benchmarks.load_test --duration 10 --concurrency 16
+
+Each server is started on a free local port with the production model
+(run `python -m src.main --save` first), then hammered with single-record
+requests on keep-alive connections from several client processes.
+Throughput and latency percentiles are printed per server.
+"""
+import argparse
+import http.client
+import json
+import multiprocessing
+import os
+import socket
+import subprocess
+import sys
+import time
+import numpy as np
+from benchmarks.synth import form_records
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+ENDPOINTS = {
+    "api": ("/api/v1/predict", "application/json"),
+    "form": ("/predict", "application/x-www-form-urlencoded"),
+}
+
+
+def free_port():
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def server_command(server, port, args):
+    if server == "dev":
+        return [sys.executable, "-m", "flask", "--app", "app", "run", "--port", str(port)]
+    return [sys.executable, "-m", "gunicorn", "--config", "gunicorn.conf.py", "--bind", f"127.0.0.1:{port}",
+            "--workers", str(args.workers), "--threads", str(args.threads)]
+
+
+def wait_until_up(port, timeout=60):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        try:
+            connection = http.client.HTTPConnection("127.0.0.1", port, timeout=2)
+            connection.request("GET", "/model/info")
+            if connection.getresponse().status == 200:
+                return
+        except OSError:
+            pass
+        time.sleep(0.2)
+    raise RuntimeError(f"Server on port {port} did not come up")
+
+
+def client(job):
+    """One client process: send requests until the deadline, return the latencies."""
+    port, endpoint, bodies, deadline = job
+    path, content_type = ENDPOINTS[endpoint]
+    connection = http.client.HTTPConnection("127.0.0.1", port, timeout=30)
+    latencies, errors, i = [], 0, 0
+    while time.monotonic() < deadline:
+        start = time.perf_counter()
+        connection.request("POST", path, body=bodies[i % len(bodies)], headers={"Content-Type": content_type})
+        response = connection.getresponse()
+        response.read()
+        latencies.append(time.perf_counter() - start)
+        errors += response.status != 200
+        i += 1
+    connection.close()
+    return latencies, errors
+
+
+def load_test(server, args, bodies):
+    port = free_port()
+    env = dict(os.environ, PREDICTION_CACHE_SIZE="0", MODEL_WATCH="0", LOG_LEVEL="WARNING")
+    process = subprocess.Popen(server_command(server, port, args), cwd=ROOT, env=env,
+                               stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    try:
+        wait_until_up(port)
+        deadline = time.monotonic() + args.duration
+        jobs = [(port, args.endpoint, bodies[i::args.concurrency], deadline) for i in range(args.concurrency)]
+        with multiprocessing.Pool(args.concurrency) as pool:
+            results = pool.map(client, jobs)
+    finally:
+        process.terminate()
+        process.wait()
+    latencies = np.concatenate([r[0] for r in results]) * 1000
+    return {
+        "requests": len(latencies),
+        "errors": sum(r[1] for r in results),
+        "rps": len(latencies) / args.duration,
+        "p50_ms": float(np.percentile(latencies, 50)),
+        "p99_ms": float(np.percentile(latencies, 99)),
+    }
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Compare serving throughput of the dev server and gunicorn")
+    parser.add_argument("--duration", type=float, default=10.0, help="Seconds of load per server")
+    parser.add_argument("--concurrency", type=int, default=16, help="Concurrent client connections")
+    parser.add_argument("--endpoint", choices=sorted(ENDPOINTS), default="api")
+    parser.add_argument("--workers", type=int, default=os.cpu_count(), help="gunicorn worker processes")
+    parser.add_argument("--threads", type=int, default=4, help="gunicorn threads per worker")
+    parser.add_argument("--servers", nargs="+", choices=["dev", "gunicorn"], default=["dev", "gunicorn"])
+    parser.add_argument("--out", help="Write the results as JSON")
+    args = parser.parse_args(argv)
+
+    records = form_records(os.path.join(ROOT, "data", "data_churn.csv"), 1000)
+    if args.endpoint == "api":
+        bodies = [json.dumps(record) for record in records]
+    else:
+        from urllib.parse import urlencode
+
+        bodies = [urlencode(record) for record in records]
+
+    results = {}
+    for server in args.servers:
+        results[server] = load_test(server, args, bodies)
+        r = results[server]
+        print(f"{server:<9} {r['rps']:>9.1f} req/s  p50 {r['p50_ms']:>7.2f} ms  p99 {r['p99_ms']:>7.2f} ms  "
+              f"({r['requests']} requests, {r['errors']} errors)")
+    if "dev" in results and "gunicorn" in results:
+        print(f"gunicorn throughput: {results['gunicorn']['rps'] / results['dev']['rps']:.1f}x the dev server")
+    if args.out:
+        with open(args.out, "w") as f:
+            json.dump({"args": vars(args), "results": results}, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
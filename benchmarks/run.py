@@ -0,0 +1,262 @@
+"""Pipeline and serving benchmarks.
+
+    python -m benchmarks.run run --rows 10000 --out benchmarks/results.json
+    python -m benchmarks.run compare benchmarks/baseline.json benchmarks/results.json
+
+`run` generates synthetic data in a scratch directory, then runs every
+stage in its own process (so peak RSS is per stage) and writes wall time,
+peak RSS, throughput, scoring latency percentiles and cold start times to a
+JSON file.
+`compare` exits non-zero when any metric regressed past the threshold.
+"""
+import argparse
+import json
+import os
+import platform
+import resource
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+import numpy as np
+from benchmarks.synth import form_records, generate_churn_data
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+DATA_FILE = os.path.join("data", "bench.csv")
+STAGES = ["prepare", "train", "evaluate", "save", "score_single", "score_batch", "startup", "drift"]
+DEFAULT_THRESHOLD = 0.25
+# Metric name suffixes and whether a larger value is a regression
+LOWER_IS_BETTER = ("seconds", "peak_rss_mb", "p50_ms", "p99_ms", "_us")
+HIGHER_IS_BETTER = ("rows_per_s",)
+
+
+def _percentiles(samples):
+    samples = np.asarray(samples) * 1000
+    return {"p50_ms": float(np.percentile(samples, 50)), "p99_ms": float(np.percentile(samples, 99))}
+
+
+def stage_prepare(args):
+    from src.prepare import prepare_data
+
+    prepare_data(DATA_FILE, use_cache=False)
+    return {"rows": args.rows}
+
+
+def stage_train(args):
+    from src.config import DATA_PATHS
+    from src.store import load_frame
+    from src.train import train_model
+
+    X_train = load_frame(DATA_PATHS["X_train"])
+    train_model(X_train, load_frame(DATA_PATHS["y_train"]))
+    return {"rows": len(X_train)}
+
+
+def stage_evaluate(args):
+    import joblib
+    from src.config import DATA_PATHS
+    from src.evaluate import evaluate_model
+    from src.store import load_frame
+
+    X_test = load_frame(DATA_PATHS["X_test"])
+    metrics = evaluate_model(joblib.load(DATA_PATHS["model"]), X_test, load_frame(DATA_PATHS["y_test"]))
+    return {"rows": len(X_test), "f1_score": metrics["f1_score"]}
+
+
+def stage_save(args):
+    import joblib
+    from src.config import DATA_PATHS
+    from src.save import save_model
+
+    save_model(joblib.load(DATA_PATHS["model"]), joblib.load(DATA_PATHS["transformer"]))
+    return {}
+
+
+def stage_score_single(args):
+    import app
+
+    client = app.app.test_client()
+    records = form_records(DATA_FILE, min(args.requests, 1000))
+    client.post("/predict", data=records[0])  # warm-up
+    samples = []
+    for i in range(args.requests):
+        start = time.perf_counter()
+        response = client.post("/predict", data=records[i % len(records)])
+        samples.append(time.perf_counter() - start)
+        assert response.status_code == 200 and b"Error" not in response.data
+    return {"rows_per_s": len(samples) / sum(samples), **_percentiles(samples)}
+
+
+def stage_score_batch(args):
+    import app
+
+    client = app.app.test_client()
+    records = form_records(DATA_FILE, args.batch_size)
+    client.post("/predict/batch", json=records[:10])  # warm-up
+    samples = []
+    for _ in range(max(args.requests // 10, 5)):
+        start = time.perf_counter()
+        response = client.post("/predict/batch", json={"records": records})
+        samples.append(time.perf_counter() - start)
+        assert response.status_code == 200
+    return {"rows_per_s": len(samples) * len(records) / sum(samples), **_percentiles(samples)}
+
+
+def stage_startup(args):
+    from benchmarks.startup import startup_times
+
+    # Cold starts of the CLI and the app against the artifacts written above
+    return startup_times()
+
+
+def stage_drift(args):
+    import joblib
+    from src.config import DATA_PATHS
+    from src.drift import DriftMonitor
+    from src.store import load_array
+
+    # Per-request cost of feeding the drift monitor, amortized binning included
+    monitor = DriftMonitor(joblib.load(DATA_PATHS["transformer"]).drift_reference)
+    X = np.ascontiguousarray(load_array(DATA_PATHS["X_test"]))
+    results = {}
+    for name, size in (("update_us", 1), ("update_batch64_us", 64)):
+        n = max(args.requests * 20, 10_000) // size
+        start = time.perf_counter()
+        for i in range(n):
+            monitor.update(X[i * size % (len(X) - size):][:size])
+        results[name] = (time.perf_counter() - start) / n * 1e6
+    return results
+
+
+def run_stage(args):
+    """Child process: run one stage in the scratch directory and print its metrics as JSON.
+
+    Scoring stages report throughput over their timed requests only, not the app start-up.
+    """
+    start = time.perf_counter()
+    metrics = globals()[f"stage_{args.stage}"](args)
+    seconds = time.perf_counter() - start
+    rows = metrics.pop("rows", None)
+    result = {"seconds": seconds, "peak_rss_mb": resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024, **metrics}
+    if rows:
+        result["rows_per_s"] = rows / seconds
+    print(json.dumps(result))
+
+
+def run(args):
+    workdir = args.workdir or tempfile.mkdtemp(prefix="churn-bench-")
+    os.makedirs(os.path.join(workdir, "data"), exist_ok=True)
+    start = time.perf_counter()
+    generate_churn_data(args.rows, os.path.join(workdir, DATA_FILE), os.path.join(ROOT, "data", "data_churn.csv"),
+                        seed=args.seed)
+    print(f"Generated {args.rows} rows in {time.perf_counter() - start:.1f}s")
+
+    env = dict(
+        os.environ,
+        PYTHONPATH=ROOT,
+        MLFLOW_TRACKING_URI="",  # runs stay spooled in the scratch directory
+        PREDICTION_CACHE_SIZE="0",
+        MODEL_WATCH="0",
+    )
+    results = {}
+    try:
+        for stage in args.stages:
+            command = [sys.executable, "-m", "benchmarks.run", "stage", stage, "--rows", str(args.rows),
+                       "--requests", str(args.requests), "--batch-size", str(args.batch_size)]
+            output = subprocess.run(command, cwd=workdir, env=env, capture_output=True, text=True)
+            if output.returncode != 0:
+                sys.exit(f"Stage '{stage}' failed:\n{output.stderr}")
+            results[stage] = json.loads(output.stdout.strip().splitlines()[-1])
+            print(f"{stage:<13} " + "  ".join(f"{k}={v:.4g}" for k, v in results[stage].items()))
+    finally:
+        if not args.workdir:
+            shutil.rmtree(workdir, ignore_errors=True)
+
+    report = {
+        "meta": {
+            "rows": args.rows,
+            "seed": args.seed,
+            "requests": args.requests,
+            "batch_size": args.batch_size,
+            "python": platform.python_version(),
+            "machine": platform.machine(),
+            "cpu_count": os.cpu_count(),
+            "timestamp": time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime()),
+        },
+        "stages": results,
+    }
+    with open(args.out, "w") as f:
+        json.dump(report, f, indent=2)
+    print(f"Results written to {args.out}")
+
+
+def compare_results(baseline, current, threshold=DEFAULT_THRESHOLD):
+    """Relative change of every comparable metric; positive means worse."""
+    changes, regressions = [], []
+    for stage, metrics in baseline["stages"].items():
+        for metric, base in metrics.items():
+            value = current["stages"].get(stage, {}).get(metric)
+            if value is None or not base or not value:
+                continue
+            if metric.endswith(LOWER_IS_BETTER):
+                change = value / base - 1
+            elif metric.endswith(HIGHER_IS_BETTER):
+                change = base / value - 1
+            else:
+                continue
+            changes.append((stage, metric, base, value, change))
+            if change > threshold:
+                regressions.append((stage, metric, base, value, change))
+    return changes, regressions
+
+
+def compare(args):
+    with open(args.baseline) as f:
+        baseline = json.load(f)
+    with open(args.current) as f:
+        current = json.load(f)
+    for key in ("rows", "requests", "batch_size"):
+        if baseline["meta"].get(key) != current["meta"].get(key):
+            print(f"Warning: {key} differs ({baseline['meta'].get(key)} vs {current['meta'].get(key)})")
+
+    changes, regressions = compare_results(baseline, current, args.threshold)
+    for stage, metric, base, value, change in changes:
+        flag = "REGRESSION" if change > args.threshold else ""
+        print(f"{stage:<13} {metric:<12} {base:>12.4g} -> {value:<12.4g} {change:+7.1%} {flag}")
+    if regressions:
+        sys.exit(f"{len(regressions)} metric(s) regressed by more than {args.threshold:.0%}")
+    print(f"No regressions beyond {args.threshold:.0%}")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Churn pipeline benchmarks")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    run_parser = commands.add_parser("run", help="Run the benchmarks and write a JSON report")
+    run_parser.add_argument("--rows", type=int, default=10_000, help="Synthetic rows (10K to 10M)")
+    run_parser.add_argument("--seed", type=int, default=0)
+    run_parser.add_argument("--stages", nargs="+", choices=STAGES, default=STAGES)
+    run_parser.add_argument("--workdir", help="Scratch directory to keep (default: a removed temp dir)")
+    run_parser.add_argument("--out", default="benchmarks/results.json")
+
+    stage_parser = commands.add_parser("stage", help=argparse.SUPPRESS)
+    stage_parser.add_argument("stage", choices=STAGES)
+    stage_parser.add_argument("--rows", type=int, default=10_000)
+
+    for sub in (run_parser, stage_parser):
+        sub.add_argument("--requests", type=int, default=500, help="Single-row scoring requests")
+        sub.add_argument("--batch-size", type=int, default=1000, help="Rows per batch scoring request")
+
+    compare_parser = commands.add_parser("compare", help="Fail when a metric regressed against a baseline")
+    compare_parser.add_argument("baseline")
+    compare_parser.add_argument("current")
+    compare_parser.add_argument("--threshold", type=float, default=DEFAULT_THRESHOLD,
+                                help="Allowed relative slowdown (0.25 = 25%%)")
+
+    args = parser.parse_args(argv)
+    {"run": run, "stage": run_stage, "compare": compare}[args.command](args)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,84 @@
+"""Start-up time of the CLI and the app.
+
+    python -m benchmarks.startup --top 15
+
+Each target runs in a fresh interpreter under `python -X importtime`, so
+the wall time is a cold start and the import log shows where it goes.
+Run from a directory holding prepared data and a trained model (the
+`startup` stage of benchmarks.run does this in its scratch directory).
+"""
+import argparse
+import os
+import subprocess
+import sys
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+TARGETS = {
+    "cli_help": ["-m", "src.main", "--help"],
+    "cli_predict": ["-m", "src.main", "--predict"],
+    "import_app": ["-c", "import app"],
+}
+
+
+def parse_importtime(stderr):
+    """(module, self seconds, cumulative seconds) for every line of an -X importtime log."""
+    imports = []
+    for line in stderr.splitlines():
+        if not line.startswith("import time:") or "self [us]" in line:
+            continue
+        self_us, cumulative_us, module = line[len("import time:"):].split("|")
+        imports.append((module.strip(), int(self_us) / 1e6, int(cumulative_us) / 1e6))
+    return imports
+
+
+def measure(argv, repeat=3, cwd=None):
+    """Best-of-repeat wall time of a cold interpreter, and the import log of that run."""
+    env = dict(
+        os.environ,
+        PYTHONPATH=ROOT,
+        DEFER_BACKGROUND_TASKS="1",
+        MODEL_WATCH="0",
+        METRICS="0",  # keep the CLI from printing its step summary
+    )
+    best, imports = None, []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = subprocess.run([sys.executable, "-X", "importtime", *argv], cwd=cwd, env=env,
+                                capture_output=True, text=True)
+        seconds = time.perf_counter() - start
+        if result.returncode != 0:
+            raise RuntimeError(f"{' '.join(argv)} failed:\n{result.stderr[-2000:]}")
+        if best is None or seconds < best:
+            best, imports = seconds, parse_importtime(result.stderr)
+    return best, imports
+
+
+def startup_times(repeat=3, cwd=None):
+    """{target}_seconds and {target}_import_seconds for every target."""
+    results = {}
+    for name, argv in TARGETS.items():
+        seconds, imports = measure(argv, repeat, cwd)
+        results[f"{name}_seconds"] = seconds
+        results[f"{name}_import_seconds"] = sum(i[1] for i in imports)
+    return results
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Cold start time of the CLI and the app")
+    parser.add_argument("--targets", nargs="+", choices=sorted(TARGETS), default=list(TARGETS))
+    parser.add_argument("--repeat", type=int, default=3, help="Runs per target; the fastest is reported")
+    parser.add_argument("--top", type=int, default=10, help="Slowest imports listed per target")
+    args = parser.parse_args(argv)
+
+    for name in args.targets:
+        seconds, imports = measure(TARGETS[name], args.repeat)
+        print(f"{name:<12} {seconds:.3f}s wall, {sum(i[1] for i in imports):.3f}s importing {len(imports)} modules")
+        # Top-level packages only: their cumulative time includes every submodule
+        top_level = [i for i in imports if "." not in i[0]]
+        for module, _, cumulative in sorted(top_level, key=lambda i: -i[2])[:args.top]:
+            print(f"    {cumulative * 1000:>9.1f} ms  {module}")
+
+
+if __name__ == "__main__":
+    main()
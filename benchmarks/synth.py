@@ -0,0 +1,64 @@
+import os
+import numpy as np
+import pandas as pd
+from src.features import INPUT_COLUMNS
+
+REFERENCE_PATH = "data/data_churn.csv"
+
+# Charges are billed per minute at a fixed rate in the reference data
+CHARGE_RATES = {
+    "Total day charge": ("Total day minutes", 0.17),
+    "Total eve charge": ("Total eve minutes", 0.085),
+    "Total night charge": ("Total night minutes", 0.045),
+    "Total intl charge": ("Total intl minutes", 0.27),
+}
+
+
+def generate_churn_data(n_rows, out_path, reference_path=REFERENCE_PATH, seed=0, chunk_rows=500_000):
+    """Write n_rows of synthetic churn data with the data_churn.csv schema.
+
+    Every column is drawn from its empirical distribution within the row's
+    churn class, voice-mail messages only for voice-mail plans, and charges
+    are derived from the minutes, so the data keeps the reference's class
+    balance and the signal the model learns. Rows are written chunk by
+    chunk, so 10M rows never have to fit in memory.
+    """
+    reference = pd.read_csv(reference_path)
+    columns = list(reference.columns)
+    churn_rate = reference["Churn"].mean()
+    groups = {churn: group for churn, group in reference.groupby("Churn")}
+    rng = np.random.default_rng(seed)
+
+    tmp_path = f"{out_path}.tmp"
+    for start in range(0, n_rows, chunk_rows):
+        n = min(chunk_rows, n_rows - start)
+        churn = rng.random(n) < churn_rate
+        chunk = {column: np.empty(n, dtype=reference[column].to_numpy().dtype) for column in columns}
+        for label, group in groups.items():
+            rows = np.flatnonzero(churn == label)
+            for column in columns:
+                if column != "Churn" and column not in CHARGE_RATES:
+                    chunk[column][rows] = rng.choice(group[column].to_numpy(), size=len(rows))
+            has_plan = group["Voice mail plan"].str.lower() == "yes"
+            messages = group.loc[has_plan, "Number vmail messages"].to_numpy()
+            with_vmail = rows[np.char.lower(chunk["Voice mail plan"][rows].astype(str)) == "yes"]
+            chunk["Number vmail messages"][rows] = 0
+            if len(messages):
+                chunk["Number vmail messages"][with_vmail] = rng.choice(messages, size=len(with_vmail))
+        for charge, (minutes, rate) in CHARGE_RATES.items():
+            chunk[charge] = (chunk[minutes] * rate).round(2)
+        chunk["Churn"] = churn
+        chunk = pd.DataFrame(chunk, columns=columns)
+        chunk.to_csv(tmp_path, mode="w" if start == 0 else "a", header=start == 0, index=False)
+    os.replace(tmp_path, out_path)
+    return out_path
+
+
+def form_records(path, n):
+    """The first n rows of a churn CSV as /predict form records (underscored names, 0/1 plan, state)."""
+    df = pd.read_csv(path, nrows=n)
+    df["International plan"] = (df["International plan"].str.lower() == "yes").astype(int)
+    records = df[INPUT_COLUMNS].copy()
+    records.columns = [column.replace(" ", "_") for column in INPUT_COLUMNS]
+    records["state"] = df["State"]
+    return records.to_dict("records")
@@ -0,0 +1,43 @@
+# Production server for app.py: gunicorn --config gunicorn.conf.py
+import gc
+import multiprocessing
+import os
+
+wsgi_app = "app:app"
+bind = f"0.0.0.0:{os.environ.get('PORT', '5001')}"
+
+# Worker processes and request threads per worker
+workers = int(os.environ.get("WEB_CONCURRENCY", multiprocessing.cpu_count()))
+threads = int(os.environ.get("GUNICORN_THREADS", 4))
+worker_class = "gthread"
+timeout = int(os.environ.get("GUNICORN_TIMEOUT", 60))
+keepalive = 5
+
+# Import the app, and load the model, once in the master: workers share those
+# pages copy-on-write instead of each unpickling its own copy
+preload_app = True
+
+# Threads can't be forked, so app.py leaves them to post_fork
+os.environ.setdefault("DEFER_BACKGROUND_TASKS", "1")
+
+accesslog = os.environ.get("GUNICORN_ACCESS_LOG")  # e.g. "-" for stdout; off by default
+
+
+def on_starting(server):
+    # Counters start over with the server: drop the metrics saved by the workers of an earlier run
+    import glob
+    from src.config import DATA_PATHS
+
+    for path in glob.glob(os.path.join(os.environ.get("METRICS_DIR", DATA_PATHS["metrics"]), "metrics-*.json")):
+        os.remove(path)
+
+
+def pre_fork(server, worker):
+    # Keep the collector from touching (and so copying) the preloaded objects
+    gc.freeze()
+
+
+def post_fork(server, worker):
+    import app
+
+    app.start_background_tasks(after_fork=True)
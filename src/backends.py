@@ -0,0 +1,104 @@
+import json
+import os
+import time
+import warnings
+import numpy as np
+from src.config import DATA_PATHS
+
+# scikit-learn and the tracker are imported where they are used, so that the CLI
+# can read BACKENDS without paying for them
+
+DEFAULT_BACKEND = "gbm"
+
+# Hand-picked parameters, used until a --tune run has written better ones
+DEFAULT_PARAMS = {
+    "max_depth": 10,
+    "max_features": None,
+    "max_leaf_nodes": 7,
+    "min_samples_leaf": 5,
+}
+
+# Binned, multi-threaded boosting; the iteration budget is generous because
+# early stopping on a held-out 10% ends training once the loss stops improving
+HIST_DEFAULT_PARAMS = {
+    "learning_rate": 0.1,
+    "max_iter": 500,
+    "max_leaf_nodes": 31,
+    "min_samples_leaf": 20,
+    "early_stopping": True,
+    "validation_fraction": 0.1,
+    "n_iter_no_change": 10,
+    "random_state": 42,
+}
+
+
+def load_best_params(path=None):
+    path = path or DATA_PATHS["best_params"]
+    if not os.path.exists(path):
+        return dict(DEFAULT_PARAMS)
+    with open(path) as f:
+        return json.load(f)
+
+
+def _gbm(params):
+    from sklearn.ensemble import GradientBoostingClassifier
+
+    return GradientBoostingClassifier(**(params if params is not None else load_best_params()))
+
+
+def _hist(params):
+    from sklearn.ensemble import HistGradientBoostingClassifier
+
+    return HistGradientBoostingClassifier(**(params if params is not None else HIST_DEFAULT_PARAMS))
+
+
+BACKENDS = {
+    "gbm": _gbm,  # exact GradientBoostingClassifier, uses the --tune parameters
+    "hist": _hist,  # HistGradientBoostingClassifier
+}
+
+
+def make_model(backend=DEFAULT_BACKEND, params=None):
+    if backend not in BACKENDS:
+        raise ValueError(f"Unknown model backend '{backend}', expected one of {sorted(BACKENDS)}")
+    return BACKENDS[backend](params)
+
+
+def benchmark_backends(X_train, y_train, X_test, y_test, backends=None, latency_rows=200):
+    """Fit every backend and report fit time, predict latency and the evaluate_model metrics."""
+    from src.evaluate import evaluate_model
+    from src.tracking import TRACKER
+
+    results = {}
+    for backend in backends or sorted(BACKENDS):
+        model = make_model(backend)
+        start = time.perf_counter()
+        model.fit(X_train, y_train)
+        fit_seconds = time.perf_counter() - start
+
+        X_batch = np.asarray(X_test)
+        single = []
+        with warnings.catch_warnings():
+            # Rows arrive as bare arrays when serving, like here
+            warnings.filterwarnings("ignore", message="X does not have valid feature names")
+            start = time.perf_counter()
+            model.predict(X_batch)
+            batch_seconds = time.perf_counter() - start
+            for row in X_batch[:latency_rows]:
+                start = time.perf_counter()
+                model.predict(row.reshape(1, -1))
+                single.append(time.perf_counter() - start)
+
+        # One MLflow run per backend, so evaluate_model's metrics don't overwrite each other
+        with TRACKER.start_run(run_name=f"backend-{backend}", nested=TRACKER.active_run() is not None):
+            TRACKER.log_params({"backend": backend})
+            metrics = evaluate_model(model, X_test, y_test)
+        results[backend] = {
+            "fit_seconds": fit_seconds,
+            "n_iter": int(getattr(model, "n_iter_", getattr(model, "n_estimators_", 0))),
+            "predict_batch_ms": batch_seconds * 1000,
+            "predict_row_p50_ms": float(np.percentile(single, 50) * 1000),
+            "predict_row_p99_ms": float(np.percentile(single, 99) * 1000),
+            **metrics,
+        }
+    return results
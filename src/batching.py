@@ -0,0 +1,107 @@
+import logging
+import queue
+import threading
+import time
+from concurrent.futures import Future
+
+logger = logging.getLogger(__name__)
+
+_STOP = object()
+
+
+class MicroBatcher:
+    """Coalesces concurrent single-item requests into batched calls.
+
+    Callers submit(key, item) and block on the returned Future. A worker
+    thread collects items until max_batch_size is reached or max_wait_ms has
+    passed since the first one arrived, groups them by key (e.g. the model
+    bundle they were read against) and calls batch_fn(key, items) once per
+    group; batch_fn returns one result per item. If a batch fails, its items
+    are retried one by one so only the offending caller sees the error.
+    """
+
+    def __init__(self, batch_fn, max_batch_size=64, max_wait_ms=2.0):
+        self.batch_fn = batch_fn
+        self.max_batch_size = max_batch_size
+        self.max_wait = max_wait_ms / 1000.0
+        self.batches = 0
+        self.items = 0
+        self._queue = queue.Queue()
+        self._thread = None
+        self._lock = threading.Lock()
+
+    def start(self):
+        with self._lock:
+            if self._thread is None or not self._thread.is_alive():
+                self._thread = threading.Thread(target=self._run, name="micro-batcher", daemon=True)
+                self._thread.start()
+        return self
+
+    def stop(self):
+        self._queue.put(_STOP)
+        if self._thread is not None:
+            self._thread.join()
+
+    def submit(self, key, item):
+        if self._thread is None:
+            self.start()
+        future = Future()
+        self._queue.put((key, item, future))
+        return future
+
+    def __call__(self, key, item, timeout=None):
+        return self.submit(key, item).result(timeout)
+
+    def _run(self):
+        while True:
+            first = self._queue.get()
+            if first is _STOP:
+                return
+            batch = [first]
+            deadline = time.monotonic() + self.max_wait
+            stopping = False
+            while len(batch) < self.max_batch_size:
+                remaining = deadline - time.monotonic()
+                try:
+                    entry = self._queue.get(timeout=remaining) if remaining > 0 else self._queue.get_nowait()
+                except queue.Empty:
+                    break
+                if entry is _STOP:
+                    stopping = True
+                    break
+                batch.append(entry)
+            self._flush(batch)
+            if stopping:
+                return
+
+    def _flush(self, batch):
+        groups = {}
+        for key, item, future in batch:
+            groups.setdefault(id(key), (key, []))[1].append((item, future))
+        for key, entries in groups.values():
+            self.batches += 1
+            self.items += len(entries)
+            try:
+                results = self.batch_fn(key, [item for item, _ in entries])
+            except Exception as e:
+                logger.debug(f"Batch of {len(entries)} failed ({e}); retrying items individually")
+                for item, future in entries:
+                    self._run_single(key, item, future)
+                continue
+            for (_, future), result in zip(entries, results):
+                future.set_result(result)
+
+    def _run_single(self, key, item, future):
+        try:
+            future.set_result(self.batch_fn(key, [item])[0])
+        except Exception as e:
+            future.set_exception(e)
+
+    def stats(self):
+        return {
+            "batches": self.batches,
+            "items": self.items,
+            "mean_batch_size": self.items / self.batches if self.batches else 0.0,
+            "max_batch_size": self.max_batch_size,
+            "max_wait_ms": self.max_wait * 1000.0,
+        }
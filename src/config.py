@@ -1,21 +1,35 @@
 # src/config.py
 import os
 
-if not os.path.exists('data'):
-    os.makedirs('data')
 # Define directories for processed data and models
+DATA_DIR = "data"
 PROCESSED_DATA_DIR = "processed_data"
 MODEL_DIR = "models"
-os.makedirs(PROCESSED_DATA_DIR, exist_ok=True)
-os.makedirs(MODEL_DIR, exist_ok=True)
 
 # Define paths for saving data
 DATA_PATHS = {
-    "X_train": os.path.join(PROCESSED_DATA_DIR, "X_train.pkl"),
-    "X_test": os.path.join(PROCESSED_DATA_DIR, "X_test.pkl"),
-    "y_train": os.path.join(PROCESSED_DATA_DIR, "y_train.pkl"),
-    "y_test": os.path.join(PROCESSED_DATA_DIR, "y_test.pkl"),
+    "X_train": os.path.join(PROCESSED_DATA_DIR, "X_train.npy"),
+    "X_test": os.path.join(PROCESSED_DATA_DIR, "X_test.npy"),
+    "y_train": os.path.join(PROCESSED_DATA_DIR, "y_train.npy"),
+    "y_test": os.path.join(PROCESSED_DATA_DIR, "y_test.npy"),
+    "w_train": os.path.join(PROCESSED_DATA_DIR, "w_train.npy"),  # Sample weights of --resample class-weight
     "model": os.path.join(MODEL_DIR, ".pkl"),
     "scaler": os.path.join(PROCESSED_DATA_DIR, "scaler.pkl"),  # Save scaler in processed_data
-
+    "transformer": os.path.join(PROCESSED_DATA_DIR, "feature_transformer.pkl"),
+    "stage_cache": os.path.join(PROCESSED_DATA_DIR, ".stage_cache"),
+    "prepare_key": os.path.join(PROCESSED_DATA_DIR, "prepare.key"),
+    "manifest": os.path.join(PROCESSED_DATA_DIR, "manifest.json"),  # Schema of the .npy artifacts
+    "best_params": os.path.join(MODEL_DIR, "best_params.json"),  # Written by --tune, read by train_model
+    "tuning": os.path.join(MODEL_DIR, "tuning"),  # CV folds and the resumable trial log
+    "deltas": os.path.join("data", "deltas"),  # Raw rows added by --update, replayed on a full refit
+    "train_state": os.path.join(MODEL_DIR, "train_state.json"),  # Last full refit and increments since
+    "tracking_spool": "tracking_spool",  # Runs logged locally, replayed to MLflow in the background or later
+    "drift": "drift_state",  # Binned scored features of each serving/scoring process, for drift reports
+    "metrics": "metrics_state",  # Request metrics of each serving worker, summed on /metrics
 }
+
+
+def ensure_dirs():
+    """Create the data, processed data and model directories (importing config has no side effects)."""
+    for directory in (DATA_DIR, PROCESSED_DATA_DIR, MODEL_DIR):
+        os.makedirs(directory, exist_ok=True)
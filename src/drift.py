@@ -0,0 +1,265 @@
+import glob
+import hashlib
+import logging
+import os
+import threading
+import time
+import numpy as np
+from src.config import DATA_PATHS
+
+# Data-drift monitoring of the scored features against the training set.
+# prepare_data stores a DriftReference on the feature transformer: per
+# feature, quantile bin edges of the scaled training rows and their counts.
+# A DriftMonitor bins every scored row with those edges into a fixed ring
+# of time windows, so memory doesn't grow with traffic, and compares the
+# recent windows with the reference (PSI and a binned KS statistic). Each
+# process saves its ring to DATA_PATHS["drift"]; reports merge them all.
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_BINS = 10
+DEFAULT_WINDOW_SECONDS = 3600
+DEFAULT_WINDOWS = 24  # the report covers the last 24 windows (a day by default)
+# Population stability index bands: below 0.1 stable, above 0.25 drifted
+PSI_MODERATE = 0.1
+PSI_DRIFT = 0.25
+# Floor of the bin proportions in the PSI, which is infinite for empty bins
+PSI_EPSILON = 1e-4
+# Two-sample KS critical value factor at the 5% level
+KS_ALPHA_FACTOR = 1.358
+CHUNK_ROWS = 8192
+# Training rows the bin edges are computed from
+SAMPLE_ROWS = 100_000
+# Scored rows a monitor holds before binning them
+BUFFER_ROWS = 4096
+
+
+class DriftReference:
+    """Bin edges and training counts of each feature."""
+
+    def __init__(self, columns, edges, counts):
+        self.columns = list(columns)
+        self.edges = np.asarray(edges, dtype=np.float64)  # (n_features, n_bins - 1) inner edges
+        self.counts = np.asarray(counts, dtype=np.int64)  # (n_features, n_bins)
+        self._offsets = np.arange(len(self.columns)) * self.n_bins
+        self.fingerprint = hashlib.sha256(self.edges.tobytes()).hexdigest()[:12]
+
+    @property
+    def n_bins(self):
+        return self.edges.shape[1] + 1
+
+    @classmethod
+    def from_sample(cls, sample, columns, n_bins=DEFAULT_BINS):
+        """Quantile bins of a row sample, with no counts yet (add bin_counts() of the training rows)."""
+        edges = np.quantile(np.asarray(sample), np.linspace(0, 1, n_bins + 1)[1:-1], axis=0).T
+        return cls(columns, edges, np.zeros((len(columns), n_bins), dtype=np.int64))
+
+    @classmethod
+    def from_features(cls, X, columns, n_bins=DEFAULT_BINS, sample_rows=SAMPLE_ROWS, random_state=42):
+        """Quantile bins of a (possibly memory-mapped) feature matrix; edges come from a row sample."""
+        X = np.asarray(X)
+        sample = X
+        if len(X) > sample_rows:
+            sample = X[np.sort(np.random.default_rng(random_state).choice(len(X), sample_rows, replace=False))]
+        reference = cls.from_sample(sample, columns, n_bins)
+        for start in range(0, len(X), CHUNK_ROWS):
+            reference.counts += reference.bin_counts(X[start:start + CHUNK_ROWS])
+        return reference
+
+    def bin_counts(self, features):
+        """(n_features, n_bins) counts of a feature matrix; a value on an edge falls in the lower bin."""
+        features = np.asarray(features, dtype=np.float64)
+        bins = np.empty(features.shape, dtype=np.int64)
+        for j, edges in enumerate(self.edges):
+            bins[:, j] = np.searchsorted(edges, features[:, j]) + self._offsets[j]
+        return np.bincount(bins.ravel(), minlength=self.counts.size).reshape(self.counts.shape)
+
+
+def compare(reference, counts):
+    """PSI and KS statistic of each feature of live bin counts against the reference."""
+    n_live = int(counts[0].sum()) if len(counts) else 0
+    n_ref = int(reference.counts[0].sum())
+    report = {"rows": n_live, "reference_rows": n_ref, "status": "no data", "features": {}}
+    if n_live == 0:
+        return report
+    expected = reference.counts / n_ref
+    actual = counts / n_live
+    psi = np.sum(
+        (actual - expected) * np.log(np.maximum(actual, PSI_EPSILON) / np.maximum(expected, PSI_EPSILON)), axis=1
+    )
+    ks = np.abs(np.cumsum(actual, axis=1) - np.cumsum(expected, axis=1)).max(axis=1)
+    ks_critical = KS_ALPHA_FACTOR * np.sqrt((n_live + n_ref) / (n_live * n_ref))
+    for i, column in enumerate(reference.columns):
+        status = "drift" if psi[i] >= PSI_DRIFT else "moderate" if psi[i] >= PSI_MODERATE else "stable"
+        report["features"][column] = {
+            "psi": float(psi[i]),
+            "ks": float(ks[i]),
+            "ks_significant": bool(ks[i] > ks_critical),
+            "status": status,
+        }
+    statuses = [f["status"] for f in report["features"].values()]
+    report["status"] = next(s for s in ("drift", "moderate", "stable") if s in statuses)
+    report["ks_critical"] = float(ks_critical)
+    return report
+
+
+class DriftMonitor:
+    """Binned counts of the scored rows in a ring of time windows.
+
+    update() only copies the request's feature rows into a fixed buffer,
+    which is binned BUFFER_ROWS rows at a time (or when the window changes
+    or the counts are read), so the per-request cost stays at a couple of
+    microseconds. Memory is the buffer plus n_windows x n_features x n_bins
+    counts, whatever the traffic. Without a reference (a transformer from
+    before drift monitoring) updates are ignored.
+    """
+
+    def __init__(self, reference=None, window_seconds=DEFAULT_WINDOW_SECONDS, n_windows=DEFAULT_WINDOWS):
+        self.window_seconds = window_seconds
+        self.n_windows = n_windows
+        self._lock = threading.Lock()
+        self._saver = None
+        self.reset(reference)
+
+    def reset(self, reference):
+        """Start over against another reference (e.g. after a model swap)."""
+        with self._lock:
+            self.reference = reference
+            shape = reference.counts.shape if reference is not None else (0, 0)
+            self.counts = np.zeros((self.n_windows,) + shape, dtype=np.int64)
+            self.epochs = np.full(self.n_windows, -1, dtype=np.int64)
+            self._buffer = np.empty((BUFFER_ROWS, shape[0]), dtype=np.float64)
+            self._buffered = 0
+            self._buffer_epoch = -1
+
+    def update(self, features):
+        if self.reference is None:
+            return
+        epoch = int(time.time() // self.window_seconds)
+        n = len(features)
+        with self._lock:
+            if epoch != self._buffer_epoch or self._buffered + n > BUFFER_ROWS:
+                self._flush()
+                self._buffer_epoch = epoch
+            if n > BUFFER_ROWS:
+                self._add(epoch, self.reference.bin_counts(features))
+                return
+            self._buffer[self._buffered:self._buffered + n] = features
+            self._buffered += n
+
+    def add_counts(self, counts, reference=None):
+        """Add counts binned elsewhere (a scoring worker); dropped if binned against another reference."""
+        epoch = int(time.time() // self.window_seconds)
+        with self._lock:
+            if reference is None or reference.fingerprint == self.reference.fingerprint:
+                self._add(epoch, counts)
+
+    def _flush(self):
+        # Called with the lock held
+        if self._buffered:
+            self._add(self._buffer_epoch, self.reference.bin_counts(self._buffer[:self._buffered]))
+            self._buffered = 0
+
+    def _add(self, epoch, counts):
+        slot = epoch % self.n_windows
+        if self.epochs[slot] != epoch:
+            self.counts[slot] = 0
+            self.epochs[slot] = epoch
+        self.counts[slot] += counts
+
+    def pop_counts(self):
+        """Counts of every window, summed, and reset to zero (to ship them to another process)."""
+        with self._lock:
+            self._flush()
+            counts = self.counts.sum(axis=0)
+            self.counts[:] = 0
+        return counts
+
+    def live_counts(self, now=None):
+        """Counts of the windows still inside the report horizon."""
+        with self._lock:
+            self._flush()
+            return _recent(self.counts, self.epochs, self.window_seconds, self.n_windows, now)
+
+    def report(self, drift_dir=None, exclude=None):
+        """compare() of this monitor's recent counts plus those saved by other processes in drift_dir."""
+        if self.reference is None:
+            return {"rows": 0, "status": "no reference", "features": {}}
+        counts = self.live_counts()
+        if drift_dir is not None:
+            counts = counts + merge_saved(self.reference, drift_dir, self.n_windows, exclude=exclude)
+        return compare(self.reference, counts)
+
+    def save(self, path):
+        if self.reference is None:
+            return
+        with self._lock:
+            self._flush()
+            counts, epochs = self.counts.copy(), self.epochs.copy()
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        tmp_path = f"{path}.tmp.npz"
+        np.savez(tmp_path, counts=counts, epochs=epochs, window_seconds=self.window_seconds,
+                 fingerprint=self.reference.fingerprint)
+        os.replace(tmp_path, path)
+
+    def start_saving(self, path, interval):
+        """Save the counts to path every interval seconds from a daemon thread."""
+        def save_loop():
+            while True:
+                time.sleep(interval)
+                try:
+                    self.save(path)
+                except OSError as e:
+                    logger.warning(f"Could not save drift counts to {path}: {e}")
+
+        self._saver = threading.Thread(target=save_loop, name="drift-saver", daemon=True)
+        self._saver.start()
+
+
+def _recent(counts, epochs, window_seconds, n_windows, now=None):
+    current = int((time.time() if now is None else now) // window_seconds)
+    return counts[(epochs > current - n_windows) & (epochs <= current)].sum(axis=0)
+
+
+def state_path(source, drift_dir=None):
+    """Where a process saves its counts: one file per source and process id."""
+    return os.path.join(drift_dir or DATA_PATHS["drift"], f"{source}-{os.getpid()}.npz")
+
+
+def merge_saved(reference, drift_dir=None, n_windows=DEFAULT_WINDOWS, exclude=None, now=None):
+    """Recent counts of every saved state binned against this reference (others are skipped).
+
+    Every process id leaves a file behind; those whose newest window is
+    outside the report horizon (exited workers and CLI runs) are removed.
+    """
+    total = np.zeros_like(reference.counts)
+    now = time.time() if now is None else now
+    for path in sorted(glob.glob(os.path.join(drift_dir or DATA_PATHS["drift"], "*.npz"))):
+        if path == exclude or path.endswith(".tmp.npz"):
+            continue
+        try:
+            with np.load(path) as state:
+                window_seconds = float(state["window_seconds"])
+                expired = state["epochs"].max() <= now // window_seconds - n_windows
+                if not expired and str(state["fingerprint"]) == reference.fingerprint:
+                    total += _recent(state["counts"], state["epochs"], window_seconds, n_windows, now)
+        except (OSError, ValueError, KeyError) as e:
+            logger.warning(f"Skipping unreadable drift state {path}: {e}")
+            continue
+        if expired:
+            try:
+                os.remove(path)
+            except OSError:
+                pass  # Removed by another worker's report
+    return total
+
+
+def format_report(report):
+    lines = [f"Drift: {report['status']} over {report['rows']} scored rows "
+             f"(reference: {report.get('reference_rows', 0)} training rows)"]
+    for column, stats in report["features"].items():
+        flag = " *" if stats["ks_significant"] else ""
+        lines.append(f"  {column:<24} PSI {stats['psi']:7.4f}  KS {stats['ks']:.4f}{flag}  {stats['status']}")
+    if report["features"]:
+        lines.append(f"  (* KS above the 5% critical value {report['ks_critical']:.4f})")
+    return "\n".join(lines)
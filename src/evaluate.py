@@ -1,22 +1,94 @@
 # evaluate.py
-import mlflow
-from sklearn.metrics import accuracy_score, precision_score, recall_score, f1_score
+import numpy as np
 import logging
+from src.tracking import TRACKER
 
+DEFAULT_BOOTSTRAP = 1000
+DEFAULT_CONFIDENCE = 0.95
+METRIC_NAMES = ("accuracy", "precision", "recall", "f1_score")
 
-def evaluate_model(model, X_test_scaled, y_test):
-    y_pred = model.predict(X_test_scaled)
-    accuracy = accuracy_score(y_test, y_pred)
-    precision = precision_score(y_test, y_pred)
-    recall = recall_score(y_test, y_pred)
-    f1 = f1_score(y_test, y_pred)
-    # Log metrics to MLflow
-    mlflow.log_metric("accuracy", accuracy)
-    mlflow.log_metric("precision", precision)
-    mlflow.log_metric("recall", recall)
-    mlflow.log_metric("f1_score", f1)
+
+def confusion_metrics(tp, fp, fn, tn):
+    """Accuracy, precision, recall and F1 from confusion counts (scalars or arrays, 0 when undefined)."""
+    tp, fp, fn, tn = (np.asarray(c, dtype=np.float64) for c in (tp, fp, fn, tn))
+    with np.errstate(divide="ignore", invalid="ignore"):
+        precision = np.where(tp + fp > 0, tp / (tp + fp), 0.0)
+        recall = np.where(tp + fn > 0, tp / (tp + fn), 0.0)
+        f1 = np.where(2 * tp + fp + fn > 0, 2 * tp / (2 * tp + fp + fn), 0.0)
+    accuracy = (tp + tn) / (tp + fp + fn + tn)
+    return dict(zip(METRIC_NAMES, (accuracy, precision, recall, f1)))
+
+
+def threshold_sweep(y_true, scores):
+    """Confusion counts at every distinct score threshold, from one sort.
+
+    Predicting positive for score >= thresholds[i] gives tp[i] true and
+    fp[i] false positives; thresholds are in decreasing order, like
+    sklearn's precision_recall_curve reversed.
+    """
+    order = np.argsort(scores, kind="mergesort")[::-1]
+    scores, y_true = scores[order], y_true[order]
+    # Last row of every run of equal scores
+    last = np.r_[np.flatnonzero(np.diff(scores)), len(scores) - 1]
+    tp = np.cumsum(y_true)[last]
+    fp = last + 1 - tp
+    return scores[last], tp, fp
+
+
+def bootstrap_intervals(tp, fp, fn, tn, n_bootstrap=DEFAULT_BOOTSTRAP, confidence=DEFAULT_CONFIDENCE, random_state=42):
+    """Percentile bootstrap intervals of the confusion_metrics.
+
+    Resampling n rows with replacement only changes how many land in each
+    confusion cell, so each replicate is one multinomial draw over the four
+    cells: the cost doesn't grow with the number of rows.
+    """
+    counts = np.array([tp, fp, fn, tn], dtype=np.int64)
+    draws = np.random.default_rng(random_state).multinomial(counts.sum(), counts / counts.sum(), size=n_bootstrap)
+    replicates = confusion_metrics(*draws.T)
+    tail = (1 - confidence) / 2 * 100
+    return {name: tuple(np.percentile(values, [tail, 100 - tail])) for name, values in replicates.items()}
+
+
+def evaluate_model(model, X_test_scaled, y_test, n_bootstrap=DEFAULT_BOOTSTRAP, confidence=DEFAULT_CONFIDENCE,
+                   random_state=42):
+    """Metrics at the default 0.5 threshold with bootstrap intervals, ROC/PR AUC and the F1-best threshold.
+
+    predict_proba runs once; every other number is derived from its scores.
+    """
+    scores = model.predict_proba(X_test_scaled)[:, 1]
+    y_true = np.asarray(y_test) == model.classes_[1]
+    n_pos = int(y_true.sum())
+    n_neg = len(y_true) - n_pos
+
+    # Same labels as model.predict: the positive class wins only above 0.5
+    y_pred = scores > 0.5
+    tp = int(np.count_nonzero(y_pred & y_true))
+    fp = int(np.count_nonzero(y_pred)) - tp
+    fn, tn = n_pos - tp, n_neg - fp
+    metrics = {name: float(value) for name, value in confusion_metrics(tp, fp, fn, tn).items()}
+    for name, (low, high) in bootstrap_intervals(tp, fp, fn, tn, n_bootstrap, confidence, random_state).items():
+        metrics[f"{name}_ci_low"] = float(low)
+        metrics[f"{name}_ci_high"] = float(high)
+
+    # Every operating point at once
+    thresholds, tps, fps = threshold_sweep(y_true, scores)
+    curve = confusion_metrics(tps, fps, n_pos - tps, n_neg - fps)
+    best = int(np.argmax(curve["f1_score"]))
+    metrics["best_threshold"] = float(thresholds[best])
+    metrics["best_threshold_f1"] = float(curve["f1_score"][best])
+    if n_pos and n_neg:
+        tpr = np.r_[0, tps] / n_pos
+        fpr = np.r_[0, fps] / n_neg
+        metrics["roc_auc"] = float(np.sum(np.diff(fpr) * (tpr[1:] + tpr[:-1]) / 2))
+        metrics["average_precision"] = float(np.sum(np.diff(tpr) * curve["precision"]))
+
+    # Log metrics to MLflow (spooled, sent in one batch)
+    TRACKER.log_metrics(metrics)
     # Log metrics to Elasticsearch
     logger = logging.getLogger(__name__)
-    logger.info(f"Accuracy: {accuracy}, Precision: {precision}, Recall: {recall}, F1-score: {f1}")  # ADD F1-score ✅
+    logger.info(
+        f"Accuracy: {metrics['accuracy']}, Precision: {metrics['precision']}, Recall: {metrics['recall']}, "
+        f"F1-score: {metrics['f1_score']}, best threshold: {metrics['best_threshold']}"
+    )
 
-    return {'accuracy': accuracy, 'precision': precision, 'recall': recall, 'f1_score': f1}  # RETURN F1 ✅
+    return metrics
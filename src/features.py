@@ -0,0 +1,291 @@
+import numpy as np
+import pandas as pd
+from src.schema import CHURN_SCHEMA, apply_schema
+
+# Raw inputs used by the model, in feature order
+INPUT_COLUMNS = [
+    "Account length",
+    "International plan",
+    "Number vmail messages",
+    "Total day calls",
+    "Total day charge",
+    "Total eve calls",
+    "Total eve charge",
+    "Total night calls",
+    "Total night charge",
+    "Total intl calls",
+    "Total intl charge",
+    "Customer service calls",
+]
+FEATURE_COLUMNS = INPUT_COLUMNS + ["State_Category", "Usage Score"]
+OUTLIER_COLUMNS = ["Total eve calls", "Total day calls", "Total intl calls"]
+USAGE_COLUMNS = [
+    "Total day charge",
+    "Total eve charge",
+    "Total night charge",
+    "Total intl charge",
+]
+STATE_CATEGORY_CODES = {"Low": 0, "Medium": 1, "High": 2}
+# Column positions in the raw input matrix, resolved once instead of per batch
+_INPUT_INDEX = {c: i for i, c in enumerate(INPUT_COLUMNS)}
+_USAGE_INDEX = [_INPUT_INDEX[c] for c in USAGE_COLUMNS]
+# Inputs the training data holds as float32; serving rounds them the same way
+_FLOAT32_INPUTS = [i for i, c in enumerate(INPUT_COLUMNS) if CHURN_SCHEMA[c] == "float32"]
+
+
+def normalize_columns(df):
+    """Accept both the CSV headers and the form field names (Account_length, state)."""
+    renames = {c: c.replace("_", " ") for c in df.columns if "_" in c and c != "State_Category"}
+    if "state" in df.columns:
+        renames["state"] = "State"
+    return df.rename(columns=renames) if renames else df
+
+
+# Accepted keys for each input in dict records: CSV header first, then form field name
+_RECORD_KEYS = [(c, c.replace(" ", "_")) for c in INPUT_COLUMNS]
+_STATE_KEYS = ("State", "state")
+
+
+def _field(record, keys):
+    for key in keys:
+        if key in record:
+            return record[key]
+    raise KeyError(keys[-1])
+
+
+class Standardization:
+    """The mean_ and scale_ of a fitted StandardScaler.
+
+    Kept on the transformer instead of the scaler itself, so unpickling a
+    transformer for prediction doesn't have to import scikit-learn.
+    """
+
+    def __init__(self, mean, scale):
+        self.mean_ = np.asarray(mean, dtype=np.float64)
+        self.scale_ = np.asarray(scale, dtype=np.float64)
+
+    def transform(self, X):
+        return (np.asarray(X, dtype=np.float64) - self.mean_) / self.scale_
+
+
+class StateIndex:
+    """State code -> churn category index for whole columns of codes.
+
+    A 26 x 26 table indexed by the two letters of the code, so a column of
+    codes is encoded with a few array operations instead of a hash lookup
+    per row. Codes that weren't seen in training, or aren't two capital
+    letters, get the default category, which can be overridden per lookup.
+    Python lists (a request's records) are looked up in a dict holding the
+    same entries, as converting a few objects costs more than hashing them.
+    """
+
+    def __init__(self, state_categories, default):
+        self.default = default
+        self.categories = {state: int(category) for state, category in state_categories.items()}
+        self.table = np.full(26 * 26, -1, dtype=np.int8)
+        for state, category in state_categories.items():
+            slot = self._slots([state])
+            if slot[0] < 0:
+                raise ValueError(f"State code '{state}' is not two capital letters")
+            self.table[slot] = category
+        # Must encode every training state exactly as the clustering did
+        states = np.array(list(state_categories), dtype=object)
+        if not np.array_equal(self.lookup(states), [state_categories[s] for s in states]):
+            raise ValueError("State index disagrees with the fitted state categories")
+
+    @staticmethod
+    def _slots(states):
+        # Unicode code points of up to three characters; a third one means the code is too long
+        chars = np.asarray(states, dtype=object).astype("U3").view(np.uint32).reshape(-1, 3).astype(np.int64) - 65
+        valid = (chars[:, :2] >= 0).all(axis=1) & (chars[:, :2] < 26).all(axis=1) & (chars[:, 2] == -65)
+        return np.where(valid, chars[:, 0] * 26 + chars[:, 1], -1)
+
+    def lookup(self, states, default=None):
+        """Category codes (int64) of a list, array or Series of state codes."""
+        default = self.default if default is None else default
+        if isinstance(states, list):
+            return np.array([self.categories.get(s, default) for s in states], dtype=np.int64)
+        slots = self._slots(states)
+        categories = np.where(slots >= 0, self.table[slots], -1).astype(np.int64)
+        categories[categories < 0] = default
+        return categories
+
+
+class FeatureTransformer:
+    """Fitted feature engineering shared by training, CLI prediction and the Flask app.
+
+    Holds everything prepare_data learns from the raw data: the IQR clipping
+    bounds, the plan encoding, the state -> churn category lookup, the Usage
+    Score weights and the StandardScaler fitted on the training split.
+    """
+
+    def __init__(self, n_clusters=3, iqr_factor=3, random_state=42, unknown_state="Medium"):
+        self.n_clusters = n_clusters
+        self.iqr_factor = iqr_factor
+        self.random_state = random_state
+        self.clip_bounds = {}
+        self.plan_mapping = {}
+        self.state_categories = {}
+        self.default_state_category = STATE_CATEGORY_CODES[unknown_state]
+        self.state_index = None
+        self.drift_reference = None  # binned training features, set by prepare_data (src/drift.py)
+        self.usage_weights = None
+        self.scaler = None
+
+    def fit(self, df):
+        """Learn clipping bounds, encodings, state categories and usage weights from a raw frame."""
+        from sklearn.preprocessing import LabelEncoder
+
+        df = normalize_columns(df)
+        quartiles = {column: tuple(df[column].quantile([0.25, 0.75])) for column in OUTLIER_COLUMNS}
+        plan_labels = LabelEncoder().fit(df["International plan"]).classes_
+        churn = pd.Series(LabelEncoder().fit_transform(df["Churn"]), index=df.index)
+        # State Churn Rate
+        state_churn_rates = churn.groupby(df["State"], observed=True).mean()
+        # Usage columns aren't clipped, so their correlations don't depend on the bounds
+        correlations = df[USAGE_COLUMNS].corrwith(churn).to_numpy()
+        return self.fit_statistics(quartiles, plan_labels, state_churn_rates, correlations)
+
+    def fit_statistics(self, quartiles, plan_labels, state_churn_rates, correlations):
+        """Fit from summary statistics of the raw data instead of the data itself.
+
+        quartiles maps each OUTLIER_COLUMNS column to its (Q1, Q3),
+        state_churn_rates is a Series of churn rates indexed by state, and
+        correlations holds the correlation of each USAGE_COLUMNS column with
+        churn. This is what fit computes from a frame, and what the
+        out-of-core prepare (src/ooc.py) merges across partitions.
+        """
+        from sklearn.cluster import KMeans
+
+        for column, (Q1, Q3) in quartiles.items():
+            IQR = Q3 - Q1
+            self.clip_bounds[column] = (Q1 - self.iqr_factor * IQR, Q3 + self.iqr_factor * IQR)
+        self.plan_mapping = {c: i for i, c in enumerate(plan_labels)}
+
+        # Feature Engineering: State Churn Rate
+        state_churn_rate = state_churn_rates.sort_index().rename("Churn_Rate").rename_axis("State").reset_index()
+        kmeans = KMeans(n_clusters=self.n_clusters, random_state=self.random_state)
+        state_churn_rate["Cluster"] = kmeans.fit_predict(state_churn_rate[["Churn_Rate"]].values)
+        cluster_mapping = state_churn_rate.groupby("Cluster")["Churn_Rate"].mean().sort_values().index.to_list()
+        cluster_labels = {
+            cluster_mapping[0]: "Low",
+            cluster_mapping[1]: "Medium",
+            cluster_mapping[2]: "High",
+        }
+        categories = state_churn_rate["Cluster"].map(cluster_labels).map(STATE_CATEGORY_CODES)
+        self.state_categories = dict(zip(state_churn_rate["State"], categories.astype(int)))
+        self.state_index = StateIndex(self.state_categories, self.default_state_category)
+
+        # Feature Engineering: Usage Score
+        weights = np.abs(np.asarray(correlations, dtype=np.float64))
+        self.usage_weights = weights / weights.sum()
+        return self
+
+    def fit_scaler(self, X_train):
+        """Fit the StandardScaler on the engineered training features."""
+        from sklearn.preprocessing import StandardScaler
+
+        scaler = StandardScaler().fit(X_train[FEATURE_COLUMNS])
+        self.scaler = Standardization(scaler.mean_, scaler.scale_)
+        return self
+
+    def engineer(self, df):
+        """Return the engineered (unscaled) feature frame, keeping Churn when present."""
+        df = normalize_columns(df)
+        out = self._clip(apply_schema(df[INPUT_COLUMNS]))
+        out["International plan"] = self._encode_plan(out["International plan"])
+        out["State_Category"] = self.encode_states(df["State"])
+        out["Usage Score"] = out[USAGE_COLUMNS].to_numpy(dtype=np.float64) @ self.usage_weights
+        if "Churn" in df.columns:
+            # Fixed False/True -> 0/1 mapping, so a delta holding a single class encodes the same way
+            out["Churn"] = df["Churn"].astype(str).str.lower().eq("true").astype(np.int64)
+        return out
+
+    def encode_states(self, states, unknown_state=None):
+        """State category codes of a column of states; unknown ones get the unknown_state category
+        ("Low", "Medium" or "High", by default the one the transformer was created with)."""
+        default = None if unknown_state is None else STATE_CATEGORY_CODES[unknown_state]
+        if isinstance(getattr(states, "dtype", None), pd.CategoricalDtype):
+            # One lookup per category, then a take by code (-1, a missing state, hits the default)
+            lookup = self.state_index.lookup(list(states.cat.categories) + [None], default)
+            return lookup[states.cat.codes.to_numpy()]
+        return self.state_index.lookup(states, default)
+
+    def __setstate__(self, state):
+        # Transformers pickled before the state index existed
+        self.__dict__.update(state)
+        self.__dict__.setdefault("drift_reference", None)
+        if self.__dict__.get("state_index") is None and self.state_categories:
+            self.state_index = StateIndex(self.state_categories, self.default_state_category)
+
+    def transform(self, X, unknown_state=None):
+        """Vectorized raw inputs -> scaled model features as a float64 matrix.
+
+        X is a DataFrame (CSV headers or form field names) or an ndarray whose
+        columns are INPUT_COLUMNS followed by the state code. unknown_state
+        overrides the category of states not seen in training.
+        """
+        if not isinstance(X, pd.DataFrame):
+            X = pd.DataFrame(np.asarray(X, dtype=object).reshape(-1, len(INPUT_COLUMNS) + 1),
+                             columns=INPUT_COLUMNS + ["State"])
+        X = normalize_columns(X)
+        numeric = X[INPUT_COLUMNS].assign(
+            **{"International plan": self._encode_plan(X["International plan"])}
+        ).to_numpy(dtype=np.float64)
+        return self._finish(numeric, X["State"], unknown_state)
+
+    def transform_records(self, records, unknown_state=None):
+        """transform() for a list of dicts (JSON/form payloads) without building a DataFrame."""
+        numeric = np.empty((len(records), len(INPUT_COLUMNS)), dtype=np.float64)
+        states = []
+        plan = _INPUT_INDEX["International plan"]
+        for i, record in enumerate(records):
+            values = [_field(record, keys) for keys in _RECORD_KEYS]
+            values[plan] = self.plan_mapping.get(values[plan], values[plan])
+            numeric[i] = values
+            states.append(_field(record, _STATE_KEYS))
+        return self._finish(numeric, states, unknown_state)
+
+    def _finish(self, numeric, states, unknown_state=None):
+        features = np.empty((len(numeric), len(FEATURE_COLUMNS)), dtype=np.float64)
+        features[:, :len(INPUT_COLUMNS)] = numeric
+        numeric = features[:, :len(INPUT_COLUMNS)]  # clip the copy in place
+        numeric[:, _FLOAT32_INPUTS] = numeric[:, _FLOAT32_INPUTS].astype(np.float32)
+        for column, (lower, upper) in self.clip_bounds.items():
+            i = _INPUT_INDEX[column]
+            np.clip(numeric[:, i], lower, upper, out=numeric[:, i])
+        features[:, -2] = self.encode_states(states, unknown_state)
+        features[:, -1] = numeric[:, _USAGE_INDEX] @ self.usage_weights
+        return self._scale_inplace(features)
+
+    def scale(self, X):
+        """Apply the fitted scaler to already-engineered features."""
+        if isinstance(X, pd.DataFrame):
+            X = X[FEATURE_COLUMNS]
+        return self._scale_inplace(np.array(X, dtype=np.float64))
+
+    def _scale_inplace(self, features):
+        if self.scaler is not None:
+            features -= self.scaler.mean_
+            features /= self.scaler.scale_
+        return features
+
+    def _clip(self, df):
+        for column, (lower, upper) in self.clip_bounds.items():
+            if column in df.columns:
+                df[column] = df[column].clip(lower=lower, upper=upper)
+        return df
+
+    def _encode_plan(self, plan):
+        if pd.api.types.is_numeric_dtype(plan):
+            return plan.astype(np.float64)
+        if isinstance(plan.dtype, pd.CategoricalDtype):
+            # Encode the categories once, then take by code (-1 is a missing value)
+            encoded = np.r_[self._encode_plan(pd.Series(plan.cat.categories, dtype=object)).to_numpy(), np.nan]
+            return pd.Series(encoded[plan.cat.codes.to_numpy()], index=plan.index)
+        # "Yes"/"No" labels from the CSV, already-encoded 0/1 values from the form
+        encoded = plan.map(self.plan_mapping)
+        unmapped = encoded.isna()
+        if unmapped.any():
+            encoded[unmapped] = pd.to_numeric(plan[unmapped])
+        return encoded.astype(np.float64)
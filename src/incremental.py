@@ -0,0 +1,187 @@
+import glob
+import json
+import logging
+import os
+import shutil
+import time
+import numpy as np
+from src.backends import DEFAULT_BACKEND
+from src.config import DATA_PATHS
+from src.resample import DEFAULT_STRATEGY, balanced_weights
+
+# The training stack is imported by the functions below, so that the CLI can
+# read the defaults without loading it
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_EXTRA_ESTIMATORS = 20
+DEFAULT_REFIT_DAYS = 7
+# Largest mean shift of a scaled feature, in training standard deviations
+DEFAULT_DRIFT_THRESHOLD = 0.5
+
+
+def read_state(path=None):
+    path = path or DATA_PATHS["train_state"]
+    if os.path.exists(path):
+        with open(path) as f:
+            return json.load(f)
+    # A model trained by --train counts as fully refit when it was written
+    model_path = DATA_PATHS["model"]
+    last_full_refit = os.path.getmtime(model_path) if os.path.exists(model_path) else None
+    return {"last_full_refit": last_full_refit, "increments": 0, "delta_rows": 0}
+
+
+def write_state(state, path=None):
+    with open(path or DATA_PATHS["train_state"], "w") as f:
+        json.dump(state, f, indent=2)
+
+
+def archive_delta(delta_path, now):
+    """Keep a copy of the raw delta so full refits can replay it."""
+    os.makedirs(DATA_PATHS["deltas"], exist_ok=True)
+    stamp = time.strftime("%Y%m%dT%H%M%S", time.gmtime(now))
+    archived = os.path.join(DATA_PATHS["deltas"], f"{stamp}-{os.path.basename(delta_path)}")
+    shutil.copyfile(delta_path, archived)
+    return archived
+
+
+def archived_deltas():
+    return sorted(glob.glob(os.path.join(DATA_PATHS["deltas"], "*.csv")))
+
+
+def feature_drift(X_scaled):
+    import pandas as pd
+    from src.features import FEATURE_COLUMNS
+
+    # Scaled with the training scaler, so every feature had mean 0 and std 1 in training
+    return pd.Series(np.abs(np.asarray(X_scaled).mean(axis=0)), index=FEATURE_COLUMNS)
+
+
+def resample_delta(X, y, random_state=42):
+    # SMOTE interpolates between 5 neighbours; smaller minorities are used as they are
+    if np.bincount(y, minlength=2).min() <= 5:
+        return X, y
+    from imblearn.over_sampling import SMOTE
+
+    return SMOTE(random_state=random_state).fit_resample(X, y)
+
+
+def grow_model(model, X, y, extra_estimators, sample_weight=None):
+    """Fit extra boosting stages on new rows, keeping the existing ones."""
+    from sklearn.ensemble import HistGradientBoostingClassifier
+
+    if isinstance(model, HistGradientBoostingClassifier):
+        model.set_params(warm_start=True, max_iter=model.n_iter_ + extra_estimators)
+    else:
+        model.set_params(warm_start=True, n_estimators=model.n_estimators_ + extra_estimators)
+    model.fit(X, y, sample_weight=sample_weight)
+    model.set_params(warm_start=False)
+    return model
+
+
+def update_model(
+    delta_path,
+    refit_days=DEFAULT_REFIT_DAYS,
+    drift_threshold=DEFAULT_DRIFT_THRESHOLD,
+    extra_estimators=DEFAULT_EXTRA_ESTIMATORS,
+    backend=DEFAULT_BACKEND,
+    resample_strategy=None,
+    now=None,
+):
+    """Train on a CSV of newly arrived rows.
+
+    Normally the rows are engineered and scaled with the fitted transformer,
+    appended to the processed store and used to grow the model by
+    extra_estimators stages, so the cost depends on the delta only. When no
+    model exists, the last full refit is refit_days old, or a feature drifts
+    past drift_threshold, the data (base CSV plus every archived delta) is
+    prepared again and the model is retrained from scratch.
+
+    The delta is resampled like the stored training set: class weights when
+    it has them (a class-weight --prepare), SMOTE otherwise. resample_strategy
+    None keeps that strategy; another one can only take effect through a
+    full refit, so an incremental update refuses it.
+    """
+    import joblib
+    import pandas as pd
+    from src.features import FEATURE_COLUMNS
+    from src.prepare import prepare_data
+    from src.schema import read_churn_csv
+    from src.save import atomic_dump, compiled_path, export_compiled
+    from src.store import append_frame, load_array, load_frame
+    from src.train import load_sample_weight, train_model
+
+    start = time.perf_counter()
+    now = time.time() if now is None else now
+    state = read_state()
+    archive_delta(delta_path, now)
+
+    transformer = joblib.load(DATA_PATHS["transformer"])
+    delta = transformer.engineer(read_churn_csv(delta_path))
+    X = pd.DataFrame(transformer.scale(delta), columns=FEATURE_COLUMNS)
+    y = pd.Series(delta["Churn"].to_numpy(), name="Churn")
+    drift = feature_drift(X)
+
+    weighted = os.path.exists(DATA_PATHS["w_train"])
+    if resample_strategy is None:
+        resample_strategy = "class-weight" if weighted else DEFAULT_STRATEGY
+
+    reason = None
+    if not os.path.exists(DATA_PATHS["model"]) or state["last_full_refit"] is None:
+        reason = "no trained model"
+    elif now - state["last_full_refit"] >= refit_days * 86400:
+        reason = f"scheduled ({refit_days} days since the last full refit)"
+    elif drift.max() > drift_threshold:
+        reason = f"drift in '{drift.idxmax()}' ({drift.max():.2f} std)"
+
+    if reason is not None:
+        logger.info(f"Full refit: {reason}")
+        prepare_data(extra_paths=archived_deltas(), resample_strategy=resample_strategy)
+        model = train_model(
+            load_frame(DATA_PATHS["X_train"]),
+            load_frame(DATA_PATHS["y_train"]),
+            backend=backend,
+            sample_weight=load_sample_weight(),
+        )
+        state = {"last_full_refit": now, "increments": 0, "delta_rows": 0}
+    else:
+        if (resample_strategy == "class-weight") != weighted:
+            # Appending to X_train but not w_train (or the reverse) would break the next --train
+            prepared = "with class weights" if weighted else "without class weights"
+            raise ValueError(
+                f"The training set was prepared {prepared}; --resample {resample_strategy} can't extend it. "
+                "Leave --resample unset to keep the stored strategy, or run --prepare with it first."
+            )
+        # The store no longer holds exactly what prepare_data wrote: its next run must rewrite it
+        if os.path.exists(DATA_PATHS["prepare_key"]):
+            os.remove(DATA_PATHS["prepare_key"])
+        weights = None
+        if resample_strategy == "class-weight":
+            # Weigh the delta by the class balance of all rows seen so far
+            X_delta, y_delta = X, y
+            counts = np.bincount(load_array(DATA_PATHS["y_train"]), minlength=2) + np.bincount(y, minlength=2)
+            weights = pd.Series(balanced_weights(y, counts), name="weight")
+            append_frame(weights, DATA_PATHS["w_train"])
+        else:
+            X_delta, y_delta = resample_delta(X, y)
+        append_frame(X_delta, DATA_PATHS["X_train"])
+        append_frame(y_delta, DATA_PATHS["y_train"])
+        model = joblib.load(DATA_PATHS["model"])
+        if y_delta.nunique() > 1:
+            grow_model(model, X_delta, y_delta, extra_estimators, weights)
+            atomic_dump(model, DATA_PATHS["model"])
+            export_compiled(model, compiled_path(DATA_PATHS["model"]))
+        else:
+            logger.info("Delta holds a single class; rows stored, model unchanged")
+        state["increments"] += 1
+        state["delta_rows"] += len(delta)
+    write_state(state)
+
+    return {
+        "mode": "full" if reason is not None else "incremental",
+        "reason": reason,
+        "rows": len(delta),
+        "max_drift": float(drift.max()),
+        "n_estimators": int(getattr(model, "n_iter_", getattr(model, "n_estimators_", 0))),
+        "seconds": time.perf_counter() - start,
+    }
@@ -1,7 +1,11 @@
 import joblib
 import os
+from src.compiled import FlatEnsemble
+from src.config import DATA_PATHS
+from src.save import compiled_path
 
 PRODUCTION_MODEL_PATH = "customer_churn_gbm_model.pkl"
+PRODUCTION_TRANSFORMER_PATH = "customer_churn_feature_transformer.pkl"
 
 
 def load_model():
@@ -10,3 +14,20 @@ def load_model():
     else:
         print(f"No model found at {PRODUCTION_MODEL_PATH}")
         return None
+
+
+def load_transformer():
+    if os.path.exists(PRODUCTION_TRANSFORMER_PATH):
+        return joblib.load(PRODUCTION_TRANSFORMER_PATH)
+    else:
+        print(f"No feature transformer found at {PRODUCTION_TRANSFORMER_PATH}")
+        return None
+
+
+def load_trained_model(model_path=None):
+    """The model written by --train; its flattened export when that is current, which loads without sklearn."""
+    model_path = model_path or DATA_PATHS["model"]
+    export_path = compiled_path(model_path)
+    if os.path.exists(export_path) and os.path.getmtime(export_path) >= os.path.getmtime(model_path):
+        return FlatEnsemble.load(export_path)
+    return joblib.load(model_path)
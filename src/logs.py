@@ -0,0 +1,39 @@
+import atexit
+import logging
+import queue
+from logging.handlers import QueueHandler, QueueListener
+
+LOG_FORMAT = "%(asctime)s %(levelname)s %(name)s: %(message)s"
+
+# The running listener; threads don't survive fork(), so workers restart it
+_listener = None
+
+
+def setup_async_logging(filename, level=logging.INFO):
+    """Send the root logger's records through a queue to a background file writer.
+
+    Callers only enqueue the record; formatting and the file write happen on
+    the listener thread, so logging never blocks a request on disk I/O.
+    """
+    log_queue = queue.SimpleQueue()
+    file_handler = logging.FileHandler(filename)
+    file_handler.setFormatter(logging.Formatter(LOG_FORMAT))
+    root = logging.getLogger()
+    root.addHandler(QueueHandler(log_queue))
+    root.setLevel(level)
+    return _start_listener(log_queue, file_handler)
+
+
+def _start_listener(log_queue, *handlers):
+    global _listener
+    _listener = QueueListener(log_queue, *handlers, respect_handler_level=True)
+    _listener.start()
+    # Flush what is still queued when the process exits
+    atexit.register(_listener.stop)
+    return _listener
+
+
+def restart_after_fork():
+    """Start a fresh writer thread in a forked worker process."""
+    if _listener is not None:
+        _start_listener(_listener.queue, *_listener.handlers)
@@ -1,150 +1,414 @@
-import mlflow
-import mlflow.sklearn
 import argparse
-import joblib
+import json
 import logging
+import os
 from src.config import DATA_PATHS
-from src.prepare import prepare_data
-from src.train import train_model
-from src.evaluate import evaluate_model
-from src.save import save_model
-from src.load import load_model
-from src.predict import make_prediction
-import mlflow
+from src.metrics import METRICS
+from src.resample import DEFAULT_STRATEGY, STRATEGIES
+from src.backends import BACKENDS, DEFAULT_BACKEND
+from src.score import DEFAULT_CHUNKSIZE
+from src.incremental import (
+    DEFAULT_DRIFT_THRESHOLD,
+    DEFAULT_EXTRA_ESTIMATORS,
+    DEFAULT_REFIT_DAYS,
+)
+
+# Only light modules are imported above: each step imports what it needs
+# (pandas, scikit-learn, MLflow...), so --predict or --help don't load the
+# training stack. Check with: python -X importtime -m src.main --help
 
 # Define the logger globally
 logging.basicConfig(level=logging.DEBUG)
 logger = logging.getLogger(__name__)
 
+STEP_SECONDS = METRICS.histogram("churn_pipeline_step_seconds", "Wall time of each pipeline step")
 
-def main():
-    # Ensure previous run is closed
-    if mlflow.active_run():
-        mlflow.end_run()
-
-    # Set up MLflow tracking
-    mlflow.set_tracking_uri("http://127.0.0.1:5000")
-    mlflow.set_experiment("Customer_Churn_Experiment")
 
+def main():
     # Set up logging
     logging.basicConfig(filename='main.log', level=logging.DEBUG)
 
     # Set up argument parser
     parser = argparse.ArgumentParser(description="Customer Churn Prediction Pipeline")
     parser.add_argument("--prepare", action="store_true", help="Prepare the data")
+    parser.add_argument("--no-cache", action="store_true", help="Recompute every --prepare stage")
+    parser.add_argument(
+        "--trace-memory", action="store_true", help="Report the peak memory of every --prepare stage (slower)"
+    )
+    parser.add_argument(
+        "--partitions",
+        nargs="+",
+        metavar="CSV",
+        help="Prepare out of core from CSV partitions (files, directories or globs) across --workers processes",
+    )
+    parser.add_argument(
+        "--resample",
+        choices=sorted(STRATEGIES),
+        help=f"Class imbalance handling for --prepare and --update (default: {DEFAULT_STRATEGY}, "
+        "class-weight with --partitions, the one that streams; the others load the whole training set; "
+        "--update alone keeps the strategy of the last --prepare)",
+    )
+    parser.add_argument("--tune", action="store_true", help="Search GBM parameters with cross-validation")
+    parser.add_argument("--tune-candidates", type=int, default=27, help="Configurations sampled by --tune")
     parser.add_argument("--train", action="store_true", help="Train the model")
+    parser.add_argument(
+        "--backend", choices=sorted(BACKENDS), default=DEFAULT_BACKEND, help="Model backend used by --train"
+    )
+    parser.add_argument(
+        "--compare-backends", action="store_true", help="Benchmark fit time, latency and metrics of every backend"
+    )
+    parser.add_argument("--update", metavar="DELTA", help="Train incrementally on a CSV of new rows")
+    parser.add_argument(
+        "--refit-days", type=float, default=DEFAULT_REFIT_DAYS, help="Days between full refits for --update"
+    )
+    parser.add_argument(
+        "--drift-threshold",
+        type=float,
+        default=DEFAULT_DRIFT_THRESHOLD,
+        help="Feature mean shift (in std) that makes --update refit fully",
+    )
+    parser.add_argument(
+        "--extra-estimators", type=int, default=DEFAULT_EXTRA_ESTIMATORS, help="Stages added by --update"
+    )
     parser.add_argument("--evaluate", action="store_true", help="Evaluate the model")
     parser.add_argument("--save", action="store_true", help="Save the trained model")
     parser.add_argument("--load", action="store_true", help="Load a saved model")
     parser.add_argument("--predict", action="store_true", help="Make predictions")  # Add this line
+    parser.add_argument("--score-file", metavar="IN", help="Score every row of a CSV file chunk by chunk")
+    parser.add_argument(
+        "--out", metavar="OUT", help="Output file for --score-file (.csv or .parquet), or the JSON of --drift-report"
+    )
+    parser.add_argument("--chunksize", type=int, default=DEFAULT_CHUNKSIZE, help="Rows per chunk for --score-file")
+    parser.add_argument("--id-column", help="Input column copied to the --score-file output")
+    parser.add_argument(
+        "--workers",
+        type=int,
+        help="Worker processes, 0 = all cores (default: 1 for --score-file, all cores for --tune and --partitions)",
+    )
+    parser.add_argument(
+        "--replay-tracking",
+        nargs="?",
+        const="",
+        metavar="URI",
+        help="Send the spooled MLflow runs to a tracking server (default: $MLFLOW_TRACKING_URI)",
+    )
+    parser.add_argument(
+        "--drift-report",
+        nargs="?",
+        const="",
+        metavar="DIR",
+        help=f"PSI/KS drift of the recently scored features (app and --score-file) against the training set, "
+        f"from the counts saved in DIR (default: {DATA_PATHS['drift']})",
+    )
+    parser.add_argument("--metrics-out", metavar="JSON", help="Also write the run's metrics summary to a file")
     args = parser.parse_args()
+    # --update on its own keeps the strategy of the stored training set (see update_model)
+    if args.resample is None and (args.prepare or not args.update):
+        args.resample = "class-weight" if args.partitions else DEFAULT_STRATEGY
+
+    try:
+        run_steps(args, parser)
+    finally:
+        report_metrics(args.metrics_out)
+
+
+def report_metrics(path=None):
+    """Print the step timings and other recorded metrics as a JSON summary."""
+    summary = METRICS.summary()
+    if not summary:
+        return
+    print(json.dumps({"metrics": summary}, indent=2))
+    if path:
+        with open(path, "w") as f:
+            json.dump(summary, f, indent=2)
+
+
+def step_prepare(args, parser):
+    from src.prepare import prepare_data
+
+    print("Preparing data...")
+    if args.partitions:
+        from src.ooc import prepare_partitions
+
+        prepare_partitions(args.partitions, n_workers=args.workers or None, resample_strategy=args.resample)
+    else:
+        prepare_data(use_cache=not args.no_cache, resample_strategy=args.resample, trace_memory=args.trace_memory)
+    print("Data preparation complete.")
+
+
+def step_tune(args, parser):
+    from src.tune import save_best_params, tune_model
+
+    print("Tuning model parameters...")
+    if not (os.path.exists(DATA_PATHS["X_train"]) and os.path.exists(DATA_PATHS["y_train"])):
+        print("Error: Data files not found. Run --prepare first.")
+        return False
+    best_params, best_f1 = tune_model(
+        DATA_PATHS["X_train"],
+        DATA_PATHS["y_train"],
+        DATA_PATHS["tuning"],
+        n_candidates=args.tune_candidates,
+        n_workers=args.workers or None,
+    )
+    save_best_params(best_params, DATA_PATHS["best_params"])
+    print(f"Best parameters (CV F1 {best_f1:.4f}): {best_params}")
+    print(f"Saved to {DATA_PATHS['best_params']}; --train will use them.")
+
+
+def step_train(args, parser):
+    from src.store import load_frame
+    from src.tracking import TRACKER
+    from src.train import load_sample_weight, train_model
+
+    print("Training model...")
+    try:
+        X_train_scaled_smote_df = load_frame(DATA_PATHS["X_train"])
+        y_train_smote_df = load_frame(DATA_PATHS["y_train"])
+    except FileNotFoundError:
+        print("Error: Data files not found. Run --prepare first.")
+        return False
+
+    # Start MLflow run for training (spooled locally, see src/tracking.py)
+    with TRACKER.start_run(run_name="train"):
+        # Train the model using the pre-defined function
+        gbm = train_model(
+            X_train_scaled_smote_df, y_train_smote_df, backend=args.backend, sample_weight=load_sample_weight()
+        )
+
+        # Log parameters for tracking purposes
+        TRACKER.log_params({"model_type": type(gbm).__name__, "backend": args.backend, "data_version": "v1"})
+
+        # Log the model using MLflow
+        TRACKER.log_model(DATA_PATHS["model"], "model")
+
+        print("Model training complete.")
+
+
+def step_update(args, parser):
+    from src.incremental import update_model
+
+    print(f"Updating model with {args.update}...")
+    if not os.path.exists(DATA_PATHS["transformer"]):
+        print("Error: Feature transformer not found. Run --prepare first.")
+        return False
+    try:
+        summary = update_model(
+            args.update,
+            refit_days=args.refit_days,
+            drift_threshold=args.drift_threshold,
+            extra_estimators=args.extra_estimators,
+            backend=args.backend,
+            resample_strategy=args.resample,
+        )
+    except ValueError as e:
+        print(f"Error: {e}")
+        return False
+    if summary["mode"] == "full":
+        print(f"Full refit ({summary['reason']})")
+    print(
+        f"{summary['mode'].capitalize()} update on {summary['rows']} rows in {summary['seconds']:.2f}s, "
+        f"max drift {summary['max_drift']:.2f} std, {summary['n_estimators']} stages"
+    )
+
+
+def step_compare_backends(args, parser):
+    from src.backends import benchmark_backends
+    from src.store import load_frame
+
+    print("Benchmarking model backends...")
+    try:
+        data = {name: load_frame(DATA_PATHS[name]) for name in ("X_train", "y_train", "X_test", "y_test")}
+    except FileNotFoundError:
+        print("Error: Data files not found. Run --prepare first.")
+        return False
+    results = benchmark_backends(data["X_train"], data["y_train"], data["X_test"], data["y_test"])
+    print(f"{'backend':<8} {'fit s':>8} {'iters':>6} {'batch ms':>9} {'p50 ms':>8} {'p99 ms':>8} {'F1':>7}")
+    for backend, r in results.items():
+        print(
+            f"{backend:<8} {r['fit_seconds']:>8.2f} {r['n_iter']:>6} {r['predict_batch_ms']:>9.2f} "
+            f"{r['predict_row_p50_ms']:>8.3f} {r['predict_row_p99_ms']:>8.3f} {r['f1_score']:>7.4f}"
+        )
 
-    gbm = None
-    X_train_scaled_smote_df = X_test_scaled_smote_df = y_train_smote_df = (
-        y_test_smote_df
-    ) = None
-
-    # Step 1: Prepare data if needed
-    if args.prepare:
-        print("Preparing data...")
-        (
-            X_train_scaled_smote_df,
-            X_test_scaled_smote_df,
-            y_train_smote_df,
-            y_test_smote_df,
-        ) = prepare_data()
-        joblib.dump(X_train_scaled_smote_df, DATA_PATHS["X_train"])
-        joblib.dump(X_test_scaled_smote_df, DATA_PATHS["X_test"])
-        joblib.dump(y_train_smote_df, DATA_PATHS["y_train"])
-        joblib.dump(y_test_smote_df, DATA_PATHS["y_test"])
-        print("Data preparation complete.")
-
-    # Step 2: Train model if needed
-    if args.train:
-        print("Training model...")
-        try:
-            X_train_scaled_smote_df = joblib.load(DATA_PATHS["X_train"])
-            y_train_smote_df = joblib.load(DATA_PATHS["y_train"])
-        except FileNotFoundError:
-            print("Error: Data files not found. Run --prepare first.")
-            return
-
-        # Start MLflow run for training
-        with mlflow.start_run():
-            # Train the model using the pre-defined function
-            gbm = train_model(X_train_scaled_smote_df, y_train_smote_df)
-
-            # Log parameters for tracking purposes
-            mlflow.log_param("model_type", "Gradient Boosting")
-            mlflow.log_param("data_version", "v1")
-
-            # Log the model using MLflow
-            mlflow.sklearn.log_model(gbm, "model")
-
-            # Optionally, log any additional metrics if needed
-
-            print("Model training complete.")
-
-    # Step 3: Evaluate model if needed
-    if args.evaluate:
-        print("\n🔍 Evaluating Model...\n" + "="*30)
-        try:
-            gbm = joblib.load(DATA_PATHS["model"])
-            X_test_scaled_smote_df = joblib.load(DATA_PATHS["X_test"])
-            y_test_smote_df = joblib.load(DATA_PATHS["y_test"])
-        except FileNotFoundError:
-            print("❌ Error: Model or data files not found. Run --train or --prepare first.")
-            return
 
+def step_evaluate(args, parser):
+    import joblib
+    from src.evaluate import DEFAULT_CONFIDENCE, METRIC_NAMES, evaluate_model
+    from src.store import load_frame
+    from src.tracking import TRACKER
+
+    print("\n🔍 Evaluating Model...\n" + "="*30)
+    try:
+        gbm = joblib.load(DATA_PATHS["model"])
+        X_test_scaled_smote_df = load_frame(DATA_PATHS["X_test"])
+        y_test_smote_df = load_frame(DATA_PATHS["y_test"])
+    except FileNotFoundError:
+        print("❌ Error: Model or data files not found. Run --train or --prepare first.")
+        return False
+
+    # evaluate_model logs the metrics to this run
+    with TRACKER.start_run(run_name="evaluate"):
         metrics = evaluate_model(gbm, X_test_scaled_smote_df, y_test_smote_df)
 
-        # Structured output
-        print("\n📊 **Evaluation Metrics:**")
-        print(f"✅ Accuracy    : {metrics.get('accuracy', 0):.4f}")
-        print(f"🎯 Precision  : {metrics.get('precision', 0):.4f}")
-        print(f"📈 Recall     : {metrics.get('recall', 0):.4f}")
-        print(f"📉 F1 Score   : {metrics.get('f1_score', 0):.4f}")
-        print("="*30)
-        if mlflow.active_run():
-            mlflow.end_run()
-        # Log evaluation metrics to MLflow
-        with mlflow.start_run():
-            mlflow.log_metric("accuracy", metrics.get("accuracy", 0))
-            mlflow.log_metric("precision", metrics.get("precision", 0))
-            mlflow.log_metric("recall", metrics.get("recall", 0))
-            mlflow.log_metric("f1_score", metrics.get("f1_score", 0))
-
-        print("\n✅ Model evaluation complete!\n")
-
-    # Step 4: Save model if needed
-    if args.save:
-        print("Saving model...")
-        try:
-            gbm = joblib.load(DATA_PATHS["model"])
-        except FileNotFoundError:
-            print("Error: No model found. Run --train first.")
-            return
-        save_model(gbm)
-        print("Model saved.")
-
-    # Step 5: Load model if needed
-    if args.load:
-        print("Loading saved model...")
-        gbm = load_model()
-        if gbm is None:
-            print("Error: No saved model found. Train and save a model first.")
-            return
-        print("Model loaded successfully.")
-
-    # Step 6: Make predictions if needed
-    if args.predict:
-        print("\n🤖 Making Predictions...\n" + "="*30)
-        try:
-            gbm = joblib.load(DATA_PATHS["model"])  # Load the trained model
-        except FileNotFoundError:
-            print("❌ Error: No model found. Run --train first.")
-            return
-        make_prediction(gbm, logger)
+    # Structured output
+    print("\n📊 **Evaluation Metrics:**")
+    print(f"✅ Accuracy    : {metrics.get('accuracy', 0):.4f}")
+    print(f"🎯 Precision  : {metrics.get('precision', 0):.4f}")
+    print(f"📈 Recall     : {metrics.get('recall', 0):.4f}")
+    print(f"📉 F1 Score   : {metrics.get('f1_score', 0):.4f}")
+    print(f"   {DEFAULT_CONFIDENCE:.0%} bootstrap intervals:")
+    for name in METRIC_NAMES:
+        print(f"   {name:<10}: [{metrics[name + '_ci_low']:.4f}, {metrics[name + '_ci_high']:.4f}]")
+    if "roc_auc" in metrics:
+        print(f"   ROC AUC {metrics['roc_auc']:.4f}, average precision {metrics['average_precision']:.4f}")
+    print(f"⚖️ Best F1 {metrics['best_threshold_f1']:.4f} at threshold {metrics['best_threshold']:.4f}")
+    print("="*30)
+
+    print("\n✅ Model evaluation complete!\n")
+
+
+def step_save(args, parser):
+    import joblib
+    from src.save import save_model
+
+    print("Saving model...")
+    try:
+        gbm = joblib.load(DATA_PATHS["model"])
+    except FileNotFoundError:
+        print("Error: No model found. Run --train first.")
+        return False
+    try:
+        transformer = joblib.load(DATA_PATHS["transformer"])
+    except FileNotFoundError:
+        print("Warning: No feature transformer found. Run --prepare to save it next to the model.")
+        transformer = None
+    save_model(gbm, transformer)
+    print("Model saved.")
+
+
+def step_load(args, parser):
+    from src.load import load_model
+
+    print("Loading saved model...")
+    gbm = load_model()
+    if gbm is None:
+        print("Error: No saved model found. Train and save a model first.")
+        return False
+    print("Model loaded successfully.")
+
+
+def step_predict(args, parser):
+    from src.load import load_trained_model
+    from src.predict import make_prediction
+
+    print("\n🤖 Making Predictions...\n" + "="*30)
+    try:
+        gbm = load_trained_model()  # Load the trained model
+    except FileNotFoundError:
+        print("❌ Error: No model found. Run --train first.")
+        return False
+    make_prediction(gbm, logger)
+
+
+def step_score_file(args, parser):
+    if not args.out:
+        parser.error("--score-file requires --out")
+    print(f"Scoring {args.score_file} in chunks of {args.chunksize} rows...")
+    if not (os.path.exists(DATA_PATHS["model"]) and os.path.exists(DATA_PATHS["transformer"])):
+        print("Error: Model or feature transformer not found. Run --prepare and --train first.")
+        return False
+    import joblib
+    from src.drift import DriftMonitor, format_report, state_path
+
+    transformer = joblib.load(DATA_PATHS["transformer"])
+    monitor = DriftMonitor(transformer.drift_reference)
+    if args.workers not in (None, 1):
+        from src.score import score_file_parallel
+
+        n_rows = score_file_parallel(
+            DATA_PATHS["model"],
+            DATA_PATHS["transformer"],
+            args.score_file,
+            args.out,
+            args.chunksize,
+            args.id_column,
+            args.workers or None,
+            logger,
+            monitor,
+        )
+    else:
+        from src.score import score_file
+
+        gbm = joblib.load(DATA_PATHS["model"])
+        n_rows = score_file(gbm, transformer, args.score_file, args.out, args.chunksize, args.id_column, logger,
+                            monitor)
+    print(f"Scored {n_rows} rows to {args.out}")
+    if monitor.reference is not None:
+        # Kept for --drift-report, next to the counts of the app's workers
+        monitor.save(state_path("score"))
+        print(format_report(monitor.report()))
+
+
+def step_drift_report(args, parser):
+    import joblib
+    from src.drift import DriftMonitor, format_report
+
+    if not os.path.exists(DATA_PATHS["transformer"]):
+        print("Error: Feature transformer not found. Run --prepare first.")
+        return False
+    reference = joblib.load(DATA_PATHS["transformer"]).drift_reference
+    if reference is None:
+        print("Error: The feature transformer has no drift reference. Run --prepare again.")
+        return False
+    report = DriftMonitor(reference).report(args.drift_report or DATA_PATHS["drift"])
+    print(format_report(report))
+    if args.out and not args.score_file:
+        with open(args.out, "w") as f:
+            json.dump(report, f, indent=2)
+
+
+def step_replay_tracking(args, parser):
+    from src.tracking import TRACKER, pending_runs, replay
+
+    tracking_uri = args.replay_tracking or os.environ.get("MLFLOW_TRACKING_URI")
+    if not tracking_uri:
+        print("Error: No tracking server. Pass a URI or set MLFLOW_TRACKING_URI.")
+        return False
+    # End the runs of this invocation so they are sent too; no flush, the replay below sends them
+    TRACKER.end_all()
+    print(f"Replaying {len(pending_runs())} spooled run(s) to {tracking_uri}...")
+    try:
+        sent = replay(tracking_uri)
+    except Exception as e:
+        print(f"Error: Tracking server unavailable ({e}); {len(pending_runs())} run(s) left in the spool.")
+        return False
+    print(f"Sent {sent} records; {len(pending_runs())} run(s) left in the spool.")
+
+
+# Pipeline steps in run order, keyed by the argument that selects them
+STEPS = {
+    "prepare": step_prepare,
+    "tune": step_tune,
+    "train": step_train,
+    "update": step_update,
+    "compare_backends": step_compare_backends,
+    "evaluate": step_evaluate,
+    "save": step_save,
+    "load": step_load,
+    "predict": step_predict,
+    "score_file": step_score_file,
+    "replay_tracking": step_replay_tracking,
+    "drift_report": step_drift_report,
+}
+
+
+def run_steps(args, parser):
+    for step, handler in STEPS.items():
+        if getattr(args, step) in (None, False):
+            continue
+        with STEP_SECONDS.time(step=step):
+            # A step returns False when a later one can't run
+            if handler(args, parser) is False:
+                return
 
 
 if __name__ == "__main__":
@@ -0,0 +1,291 @@
+import bisect
+import glob
+import json
+import logging
+import os
+import threading
+import time
+from src.config import DATA_PATHS
+
+logger = logging.getLogger(__name__)
+
+# Upper bounds (seconds) of the latency histogram buckets
+DEFAULT_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+
+
+def _label_key(labels):
+    return tuple(sorted(labels.items()))
+
+
+def _format_labels(key):
+    if not key:
+        return ""
+    return "{" + ",".join(f'{name}="{value}"' for name, value in key) + "}"
+
+
+class _NoopTimer:
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+
+_NOOP_TIMER = _NoopTimer()
+
+
+class _Timer:
+    __slots__ = ("histogram", "key", "start")
+
+    def __init__(self, histogram, key):
+        self.histogram = histogram
+        self.key = key
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        self.histogram._observe(self.key, time.perf_counter() - self.start)
+        return False
+
+
+class Counter:
+    kind = "counter"
+
+    def __init__(self, registry, name, help):
+        self.registry = registry
+        self.name = name
+        self.help = help
+        self.values = {}
+        self._lock = threading.Lock()
+
+    def inc(self, amount=1, **labels):
+        if not self.registry.enabled:
+            return
+        key = _label_key(labels)
+        with self._lock:
+            self.values[key] = self.values.get(key, 0) + amount
+
+    def samples(self):
+        return [(self.name, key, value) for key, value in self.values.items()]
+
+    def _merge(self, key, value):
+        # Called with the lock held
+        self.values[key] = self.values.get(key, 0) + value
+
+    def summary(self):
+        return {_format_labels(key) or "total": value for key, value in self.values.items()}
+
+
+class Gauge(Counter):
+    kind = "gauge"
+
+    def set(self, value, **labels):
+        if not self.registry.enabled:
+            return
+        with self._lock:
+            self.values[_label_key(labels)] = value
+
+
+class Histogram:
+    kind = "histogram"
+
+    def __init__(self, registry, name, help, buckets=DEFAULT_BUCKETS):
+        self.registry = registry
+        self.name = name
+        self.help = help
+        self.buckets = tuple(buckets)
+        self.values = {}  # label key -> [bucket counts..., count, sum, max]
+        self._lock = threading.Lock()
+
+    def time(self, **labels):
+        """Context manager observing the elapsed wall time of its block."""
+        if not self.registry.enabled:
+            return _NOOP_TIMER
+        return _Timer(self, _label_key(labels))
+
+    def observe(self, value, **labels):
+        if self.registry.enabled:
+            self._observe(_label_key(labels), value)
+
+    def _observe(self, key, value):
+        with self._lock:
+            state = self.values.get(key)
+            if state is None:
+                state = self.values[key] = [0] * len(self.buckets) + [0, 0.0, 0.0]
+            n = len(self.buckets)
+            i = bisect.bisect_left(self.buckets, value)
+            if i < n:
+                state[i] += 1
+            state[n] += 1
+            state[n + 1] += value
+            state[n + 2] = max(state[n + 2], value)
+
+    def _merge(self, key, value):
+        # Called with the lock held: bucket counts, count and sum add up, max is the larger one
+        state = self.values.get(key)
+        if state is None:
+            self.values[key] = list(value)
+            return
+        n = len(self.buckets)
+        for i in range(n + 2):
+            state[i] += value[i]
+        state[n + 2] = max(state[n + 2], value[n + 2])
+
+    def samples(self):
+        samples = []
+        n = len(self.buckets)
+        for key, state in self.values.items():
+            cumulative = 0
+            for bound, count in zip(self.buckets, state):
+                cumulative += count
+                samples.append((f"{self.name}_bucket", key + (("le", repr(bound)),), cumulative))
+            samples.append((f"{self.name}_bucket", key + (("le", "+Inf"),), state[n]))
+            samples.append((f"{self.name}_sum", key, state[n + 1]))
+            samples.append((f"{self.name}_count", key, state[n]))
+        return samples
+
+    def summary(self):
+        n = len(self.buckets)
+        return {
+            _format_labels(key) or "total": {
+                "count": state[n],
+                "seconds": state[n + 1],
+                "mean": state[n + 1] / state[n] if state[n] else 0.0,
+                "max": state[n + 2],
+            }
+            for key, state in self.values.items()
+        }
+
+
+class MetricsRegistry:
+    """Counters, gauges and latency histograms, rendered for Prometheus or as a JSON summary.
+
+    When disabled every recording call returns immediately and timers are a
+    shared no-op context manager, so instrumented code costs next to nothing.
+    """
+
+    def __init__(self, enabled=True):
+        self.enabled = enabled
+        self._metrics = {}
+        self._lock = threading.Lock()
+
+    def _get(self, cls, name, help, **kwargs):
+        with self._lock:
+            metric = self._metrics.get(name)
+            if metric is None:
+                metric = self._metrics[name] = cls(self, name, help, **kwargs)
+            return metric
+
+    def counter(self, name, help=""):
+        return self._get(Counter, name, help)
+
+    def gauge(self, name, help=""):
+        return self._get(Gauge, name, help)
+
+    def histogram(self, name, help="", buckets=DEFAULT_BUCKETS):
+        return self._get(Histogram, name, help, buckets=buckets)
+
+    def reset(self):
+        for metric in self._metrics.values():
+            with metric._lock:
+                metric.values.clear()
+
+    def snapshot(self):
+        """Values of every metric in a JSON-serializable form, to merge them in another process."""
+        snapshot = {}
+        for metric in list(self._metrics.values()):
+            with metric._lock:
+                values = [[[list(pair) for pair in key], value] for key, value in metric.values.items()]
+            snapshot[metric.name] = {"kind": metric.kind, "help": metric.help, "values": values}
+            if metric.kind == "histogram":
+                snapshot[metric.name]["buckets"] = list(metric.buckets)
+        return snapshot
+
+    def merge(self, snapshot, gauges=False):
+        """Add the counters and histograms of a snapshot(); gauges are only taken with gauges=True."""
+        for name, data in snapshot.items():
+            if data["kind"] == "gauge" and not gauges:
+                continue
+            if data["kind"] == "histogram":
+                metric = self.histogram(name, data["help"], buckets=data["buckets"])
+            else:
+                metric = self._get(Gauge if data["kind"] == "gauge" else Counter, name, data["help"])
+            with metric._lock:
+                for key, value in data["values"]:
+                    key = tuple(tuple(pair) for pair in key)
+                    if metric.kind == "gauge":
+                        metric.values[key] = value
+                    else:
+                        metric._merge(key, value)
+        return self
+
+    def save(self, path):
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        tmp_path = f"{path}.tmp"
+        with open(tmp_path, "w") as f:
+            json.dump(self.snapshot(), f)
+        os.replace(tmp_path, path)
+
+    def start_saving(self, path, interval):
+        """Save a snapshot to path every interval seconds from a daemon thread."""
+        def save_loop():
+            while True:
+                time.sleep(interval)
+                try:
+                    self.save(path)
+                except OSError as e:
+                    logger.warning(f"Could not save metrics to {path}: {e}")
+
+        threading.Thread(target=save_loop, name="metrics-saver", daemon=True).start()
+
+    def render_prometheus(self):
+        lines = []
+        for metric in self._metrics.values():
+            with metric._lock:
+                samples = metric.samples()
+            if not samples:
+                continue
+            lines.append(f"# HELP {metric.name} {metric.help}")
+            lines.append(f"# TYPE {metric.name} {metric.kind}")
+            for name, key, value in samples:
+                lines.append(f"{name}{_format_labels(key)} {value:.10g}")
+        return "\n".join(lines) + "\n"
+
+    def summary(self):
+        summary = {}
+        for metric in self._metrics.values():
+            with metric._lock:
+                values = metric.summary()
+            if values:
+                summary[metric.name] = values
+        return summary
+
+
+def state_path(metrics_dir=None):
+    """Where a process saves its metrics: one file per process id."""
+    return os.path.join(metrics_dir or DATA_PATHS["metrics"], f"metrics-{os.getpid()}.json")
+
+
+def merge_saved(registry, metrics_dir=None, exclude=None):
+    """A registry with the metrics of this one plus the counters and histograms saved in metrics_dir.
+
+    Under a multi-process server each worker only counts its own requests;
+    this sums them. Gauges are point-in-time values of one process, so only
+    those of this registry are kept.
+    """
+    merged = MetricsRegistry().merge(registry.snapshot(), gauges=True)
+    for path in sorted(glob.glob(os.path.join(metrics_dir or DATA_PATHS["metrics"], "metrics-*.json"))):
+        if path == exclude:
+            continue
+        try:
+            with open(path) as f:
+                merged.merge(json.load(f))
+        except (OSError, ValueError, KeyError) as e:
+            logger.warning(f"Skipping unreadable metrics state {path}: {e}")
+    return merged
+
+
+# Process-wide registry; METRICS=0 turns instrumentation off
+METRICS = MetricsRegistry(enabled=os.environ.get("METRICS", "1") == "1")
@@ -0,0 +1,300 @@
+import glob
+import logging
+import os
+import shutil
+import time
+from concurrent.futures import ProcessPoolExecutor
+import joblib
+import numpy as np
+import pandas as pd
+from src.config import DATA_PATHS, ensure_dirs
+from src.drift import SAMPLE_ROWS, DriftReference
+from src.features import FEATURE_COLUMNS, OUTLIER_COLUMNS, USAGE_COLUMNS, FeatureTransformer, Standardization
+from src.resample import balanced_weights, resample
+from src.schema import read_churn_csv
+from src.store import append_frame, delete_frame, load_frame, save_frame
+
+# Out-of-core prepare for data that lands as many partition files. Every
+# statistic prepare_data computes over the whole frame is gathered in
+# mergeable summaries, one per partition and in parallel, then merged:
+#   1. quantile sketches (clipping bounds), grouped churn sums/counts (state
+#      churn rates) and running moments (usage correlations) of the raw rows
+#   2. the partitions are engineered with the fitted transformer and spilled
+#      to disk, while running moments of the training rows fit the scaler
+#   3. the spilled partitions are scaled and appended to the processed store,
+#      and a row sample of each sets the drift reference bins
+#   4. the spilled partitions are binned into the drift reference counts
+# Only one partition per worker is ever in memory, with class-weight
+# resampling; the SMOTE strategies need the whole training set in memory.
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_STRATEGY = "class-weight"  # the one resampling strategy that streams
+SKETCH_BINS = 4096
+
+
+class QuantileSketch:
+    """Mergeable quantile summary: sorted distinct values and their counts.
+
+    Quantiles interpolate linearly like pandas, and are exact while a column
+    has at most max_bins distinct values (the integer call counts have a few
+    hundred). Beyond that, neighbouring bins are merged into their weighted
+    mean, which bounds the rank error by about n / max_bins.
+    """
+
+    def __init__(self, max_bins=SKETCH_BINS):
+        self.max_bins = max_bins
+        self.values = np.empty(0, dtype=np.float64)
+        self.counts = np.empty(0, dtype=np.int64)
+
+    def update(self, values):
+        values = np.asarray(values, dtype=np.float64)
+        values, counts = np.unique(values[~np.isnan(values)], return_counts=True)
+        return self._add(values, counts)
+
+    def merge(self, other):
+        return self._add(other.values, other.counts)
+
+    def _add(self, values, counts):
+        values, inverse = np.unique(np.r_[self.values, values], return_inverse=True)
+        counts = np.bincount(inverse, weights=np.r_[self.counts, counts])
+        if len(values) > self.max_bins:
+            groups = np.arange(len(values)) * self.max_bins // len(values)
+            weighted = np.bincount(groups, weights=values * counts)
+            counts = np.bincount(groups, weights=counts)
+            values = weighted / counts
+        self.values, self.counts = values, counts.astype(np.int64)
+        return self
+
+    def quantile(self, q):
+        position = (self.counts.sum() - 1) * q
+        below = int(np.floor(position))
+        # Index of the bins holding the values of rank below and below + 1
+        bins = np.searchsorted(np.cumsum(self.counts), [below, below + 1], side="right")
+        lower, upper = self.values[np.minimum(bins, len(self.values) - 1)]
+        return float(lower + (position - below) * (upper - lower))
+
+
+class Moments:
+    """Mergeable count, means and co-moment matrix of some columns.
+
+    Partial results combine with the pairwise update of Chan et al., which
+    stays accurate where summing raw powers would cancel catastrophically.
+    """
+
+    def __init__(self, n_columns):
+        self.n = 0
+        self.mean = np.zeros(n_columns)
+        self.m2 = np.zeros((n_columns, n_columns))
+
+    def update(self, X):
+        X = np.asarray(X, dtype=np.float64)
+        if not len(X):
+            return self
+        batch = Moments(X.shape[1])
+        batch.n = len(X)
+        batch.mean = X.mean(axis=0)
+        centered = X - batch.mean
+        batch.m2 = centered.T @ centered
+        return self.merge(batch)
+
+    def merge(self, other):
+        n = self.n + other.n
+        if n == 0:
+            return self
+        delta = other.mean - self.mean
+        self.m2 = self.m2 + other.m2 + np.outer(delta, delta) * (self.n * other.n / n)
+        self.mean = self.mean + delta * (other.n / n)
+        self.n = n
+        return self
+
+    @property
+    def var(self):
+        # Population variance, like StandardScaler
+        return self.m2.diagonal() / self.n
+
+    def corr(self, column):
+        """Correlation of every column with one of them."""
+        with np.errstate(divide="ignore", invalid="ignore"):
+            return self.m2[:, column] / np.sqrt(self.m2.diagonal() * self.m2[column, column])
+
+
+def expand_partitions(specs):
+    """CSV partitions named by files, directories (every *.csv inside) or glob patterns, in sorted order."""
+    paths = []
+    for spec in specs:
+        if os.path.isdir(spec):
+            paths.extend(sorted(glob.glob(os.path.join(spec, "*.csv"))))
+        elif glob.has_magic(spec):
+            paths.extend(sorted(glob.glob(spec)))
+        else:
+            paths.append(spec)
+    if not paths:
+        raise FileNotFoundError(f"No CSV partitions found in {specs}")
+    return paths
+
+
+def _map(fn, tasks, n_workers):
+    if n_workers == 1:
+        return list(map(fn, tasks))
+    with ProcessPoolExecutor(n_workers) as pool:
+        return list(pool.map(fn, tasks))
+
+
+def _partition_stats(path):
+    # Pass 1: mergeable summaries of one raw partition
+    df = read_churn_csv(path)
+    churn = df["Churn"].to_numpy(dtype=np.float64)
+    states = pd.Series(churn).groupby(df["State"].to_numpy()).agg(["sum", "count"])
+    return {
+        "rows": len(df),
+        "sketches": {c: QuantileSketch().update(df[c].to_numpy()) for c in OUTLIER_COLUMNS},
+        "plans": set(df["International plan"].dropna()),
+        "states": states,
+        "usage": Moments(len(USAGE_COLUMNS) + 1).update(np.column_stack([df[USAGE_COLUMNS].to_numpy(), churn])),
+    }
+
+
+def _merge_stats(parts):
+    merged = parts[0]
+    for part in parts[1:]:
+        merged["rows"] += part["rows"]
+        for column, sketch in merged["sketches"].items():
+            sketch.merge(part["sketches"][column])
+        merged["plans"] |= part["plans"]
+        merged["states"] = merged["states"].add(part["states"], fill_value=0)
+        merged["usage"].merge(part["usage"])
+    return merged
+
+
+def _test_mask(n_rows, test_size, random_state, partition):
+    # Seeded per partition, so the split doesn't depend on which worker reads it
+    return np.random.default_rng([random_state, partition]).random(n_rows) < test_size
+
+
+def _engineer_partition(task):
+    # Pass 2: engineer one partition, spill it, and summarize its training rows for the scaler
+    partition, path, transformer, spill_dir, test_size, random_state = task
+    df_dp = transformer.engineer(read_churn_csv(path))
+    X = df_dp[FEATURE_COLUMNS].to_numpy(dtype=np.float64)
+    y = df_dp["Churn"].to_numpy()
+    test = _test_mask(len(X), test_size, random_state, partition)
+    np.savez(os.path.join(spill_dir, f"{partition:05d}.npz"), X=X, y=y, test=test)
+    return Moments(len(FEATURE_COLUMNS)).update(X[~test]), np.bincount(y[~test], minlength=2)
+
+
+def _write(data, path, started):
+    if path in started:
+        append_frame(data, path)
+    else:
+        save_frame(data, path)
+        started.add(path)
+
+
+def prepare_partitions(
+    specs,
+    n_workers=None,
+    test_size=0.2,
+    random_state=42,
+    resample_strategy=DEFAULT_STRATEGY,
+    n_clusters=3,
+    iqr_factor=3,
+):
+    """prepare_data for CSV partitions that don't fit in memory together.
+
+    Writes the same artifacts as prepare_data. Rows keep their position in
+    the concatenated partitions as index. The train/test split is drawn per
+    row (seeded per partition) instead of by train_test_split, so it differs
+    from the in-memory split of the same rows. class-weight resampling
+    streams; the SMOTE strategies load the whole stored training set into
+    memory afterwards, so they only suit data that fits once processed.
+    """
+    ensure_dirs()
+    paths = expand_partitions(specs)
+    n_workers = min(n_workers or os.cpu_count() or 1, len(paths))
+    timings = {}
+
+    start = time.perf_counter()
+    stats = _merge_stats(_map(_partition_stats, paths, n_workers))
+    transformer = FeatureTransformer(n_clusters, iqr_factor, random_state).fit_statistics(
+        {column: (sketch.quantile(0.25), sketch.quantile(0.75)) for column, sketch in stats["sketches"].items()},
+        sorted(stats["plans"]),
+        stats["states"]["sum"] / stats["states"]["count"],
+        stats["usage"].corr(len(USAGE_COLUMNS))[:len(USAGE_COLUMNS)],
+    )
+    timings["statistics"] = time.perf_counter() - start
+
+    start = time.perf_counter()
+    spill_dir = os.path.join(DATA_PATHS["stage_cache"], "partitions")
+    shutil.rmtree(spill_dir, ignore_errors=True)
+    os.makedirs(spill_dir)
+    tasks = [(i, path, transformer, spill_dir, test_size, random_state) for i, path in enumerate(paths)]
+    engineered = _map(_engineer_partition, tasks, n_workers)
+    moments = engineered[0][0]
+    for partition_moments, _ in engineered[1:]:
+        moments.merge(partition_moments)
+    class_counts = sum(counts for _, counts in engineered)
+    scale = np.sqrt(moments.var)
+    transformer.scaler = Standardization(moments.mean, np.where(scale == 0, 1.0, scale))
+    timings["engineer"] = time.perf_counter() - start
+
+    start = time.perf_counter()
+    for key in ("X_train", "X_test", "y_train", "y_test", "w_train"):
+        delete_frame(DATA_PATHS[key])
+    started = set()
+    offset = 0
+    n_train = int(class_counts.sum())
+    samples = []
+    for i in range(len(paths)):
+        spilled = np.load(os.path.join(spill_dir, f"{i:05d}.npz"))
+        X = transformer.scale(spilled["X"])
+        y, test = spilled["y"], spilled["test"]
+        index = pd.Index(offset + np.arange(len(X)))
+        offset += len(X)
+        # Each partition's share of the drift reference's row sample
+        train_rows = np.flatnonzero(~test)
+        n_sample = min(len(train_rows), -(-SAMPLE_ROWS * len(train_rows) // max(n_train, 1)))
+        samples.append(X[np.random.default_rng([random_state, i]).choice(train_rows, n_sample, replace=False)])
+        for rows, X_key, y_key in ((~test, "X_train", "y_train"), (test, "X_test", "y_test")):
+            if not rows.any():
+                continue
+            _write(pd.DataFrame(X[rows], columns=FEATURE_COLUMNS, index=index[rows]), DATA_PATHS[X_key], started)
+            _write(pd.Series(y[rows], index=index[rows], name="Churn"), DATA_PATHS[y_key], started)
+            if X_key == "X_train" and resample_strategy == "class-weight":
+                weights = balanced_weights(y[rows], class_counts)
+                _write(pd.Series(weights, index=index[rows], name="weight"), DATA_PATHS["w_train"], started)
+    timings["write"] = time.perf_counter() - start
+
+    # Before resampling: drift monitoring compares scored rows with the real training rows
+    start = time.perf_counter()
+    reference = DriftReference.from_sample(np.concatenate(samples), FEATURE_COLUMNS)
+    for i in range(len(paths)):
+        spilled = np.load(os.path.join(spill_dir, f"{i:05d}.npz"))
+        reference.counts += reference.bin_counts(transformer.scale(spilled["X"][~spilled["test"]]))
+    transformer.drift_reference = reference
+    shutil.rmtree(spill_dir, ignore_errors=True)
+    timings["drift"] = time.perf_counter() - start
+
+    if resample_strategy != "class-weight":
+        logger.warning(f"{resample_strategy} resampling loads the whole training set into memory")
+        out_path = os.path.join(DATA_PATHS["stage_cache"], "resampled.npy")
+        X_res, y_res, _, report = resample(
+            load_frame(DATA_PATHS["X_train"]), load_frame(DATA_PATHS["y_train"]), resample_strategy, random_state,
+            out_path
+        )
+        save_frame(X_res, DATA_PATHS["X_train"])
+        save_frame(y_res, DATA_PATHS["y_train"])
+        timings["resample"] = report["seconds"]
+
+    joblib.dump(transformer.scaler, DATA_PATHS["scaler"])
+    joblib.dump(transformer, DATA_PATHS["transformer"])
+    # The stage cache didn't produce these outputs, so the next prepare_data rewrites them
+    if os.path.exists(DATA_PATHS["prepare_key"]):
+        os.remove(DATA_PATHS["prepare_key"])
+
+    logger.info(f"Out-of-core prepare of {stats['rows']} rows in {len(paths)} partitions on {n_workers} workers")
+    print(
+        f"Prepared {stats['rows']} rows from {len(paths)} partitions on {n_workers} workers: "
+        + ", ".join(f"{name} {seconds:.2f}s" for name, seconds in timings.items())
+    )
+    return transformer, stats["rows"]
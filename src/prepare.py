@@ -1,100 +1,126 @@
+import copy
+import functools
+import os
+import tracemalloc
 import joblib
 import pandas as pd
-import numpy as np
-from sklearn.preprocessing import LabelEncoder
 from sklearn.model_selection import train_test_split
-from sklearn.preprocessing import StandardScaler
-from imblearn.over_sampling import SMOTE
-from sklearn.cluster import KMeans
 
 # Paths for saving data
-from src.config import DATA_PATHS  # Assuming paths are imported from main.py
-
-
-def prepare_data():
-    df = pd.read_csv("data/data_churn.csv")
-    df_dp = df.copy()
-
-    # Handling outliers
-    columns_outliers = ["Total eve calls", "Total day calls", "Total intl calls"]
-    for column in columns_outliers:
-        Q1, Q3 = df_dp[column].quantile([0.25, 0.75])
-        IQR = Q3 - Q1
-        lower_bound = Q1 - 3 * IQR
-        upper_bound = Q3 + 3 * IQR
-        df_dp[column] = df_dp[column].clip(lower=lower_bound, upper=upper_bound)
-
-    # Encoding categorical variables
-    label_encoder = LabelEncoder()
-    df_dp["International plan"] = label_encoder.fit_transform(df_dp["International plan"])
-    df_dp["Voice mail plan"] = label_encoder.fit_transform(df_dp["Voice mail plan"])
-    df_dp["Churn"] = label_encoder.fit_transform(df_dp["Churn"])
-
-    # Feature Engineering: State Churn Rate
-    state_churn_rate = df_dp.groupby("State")["Churn"].mean().reset_index()
-    state_churn_rate.rename(columns={"Churn": "Churn_Rate"}, inplace=True)
-    kmeans = KMeans(n_clusters=3, random_state=42)
-    state_churn_rate["Cluster"] = kmeans.fit_predict(state_churn_rate[["Churn_Rate"]].values)
-
-    cluster_mapping = (
-        state_churn_rate.groupby("Cluster")["Churn_Rate"]
-        .mean()
-        .sort_values()
-        .index.to_list()
-    )
-    cluster_labels = {
-        cluster_mapping[0]: "Low",
-        cluster_mapping[1]: "Medium",
-        cluster_mapping[2]: "High",
-    }
-    state_churn_rate["State_Category"] = state_churn_rate["Cluster"].map(cluster_labels)
-    df_dp = df_dp.merge(state_churn_rate[["State", "State_Category"]], on="State", how="left")
-    df_dp["State_Category"] = df_dp["State_Category"].map({"Low": 0, "Medium": 1, "High": 2})
-    df_dp.drop(columns=["State"], inplace=True)
-    # Dropping insignificant columns
-    df_dp.drop(columns=["Area code", "Voice mail plan"], inplace=True)
-    df_dp.drop(
-        columns=[
-            "Total day minutes",
-            "Total eve minutes",
-            "Total night minutes",
-            "Total intl minutes",
-        ],
-        inplace=True,
-    )
-    # Feature Engineering: Usage Score
-    corr_features = [
-        "Total day charge",
-        "Total eve charge",
-        "Total night charge",
-        "Total intl charge",
-    ]
-    weights = np.abs(df_dp[corr_features].corrwith(df_dp["Churn"]))
-    weights /= weights.sum()
-    df_dp["Usage Score"] = df_dp[corr_features].mul(weights).sum(axis=1)
-
-    # Splitting data
+from src.config import DATA_PATHS, ensure_dirs  # Assuming paths are imported from main.py
+from src.drift import DriftReference
+from src.features import FeatureTransformer, FEATURE_COLUMNS
+from src.stage_cache import StageCache
+from src.resample import DEFAULT_STRATEGY, resample
+from src.schema import concat_frames, read_churn_csv
+from src.store import delete_frame, save_frame
+
+OUTPUT_KEYS = ["X_train", "X_test", "y_train", "y_test", "manifest", "scaler", "transformer"]
+
+
+def read_data(*paths):
+    # The base CSV plus the deltas archived by incremental training, if any, in the compact schema
+    return concat_frames([read_churn_csv(path) for path in paths])
+
+
+def fit_features(df, n_clusters, iqr_factor, random_state):
+    # Outlier clipping, encoding, state clustering and Usage Score weights
+    return FeatureTransformer(n_clusters, iqr_factor, random_state).fit(df)
+
+
+def engineer_features(transformer, df):
+    return transformer.engineer(df)
+
+
+def split_data(df_dp, test_size, random_state):
     X = df_dp.drop(columns=["Churn"])
     y = df_dp["Churn"]
-    X_train, X_test, y_train, y_test = train_test_split(X, y, test_size=0.2, random_state=42)
+    return train_test_split(X, y, test_size=test_size, random_state=random_state)
 
-    # Data scaling
-    scaler = StandardScaler()
-    numerical_columns = X_train.select_dtypes(include=["int64", "float64"]).columns
-    X_train_scaled = X_train.copy()
-    X_train_scaled[numerical_columns] = scaler.fit_transform(X_train[numerical_columns])
-    X_test_scaled = X_test.copy()
-    X_test_scaled[numerical_columns] = scaler.transform(X_test[numerical_columns])
 
+def scale_data(transformer, split):
+    X_train, X_test, y_train, y_test = split
+    transformer = copy.deepcopy(transformer).fit_scaler(X_train)
+    # The scaled matrices are ours: wrap them instead of letting the frame copy them
+    X_train_scaled = pd.DataFrame(transformer.scale(X_train), columns=FEATURE_COLUMNS, index=X_train.index,
+                                  copy=False)
+    X_test_scaled = pd.DataFrame(transformer.scale(X_test), columns=FEATURE_COLUMNS, index=X_test.index, copy=False)
+    # Drift monitoring compares scored rows with the real (not resampled) training rows
+    transformer.drift_reference = DriftReference.from_features(X_train_scaled.to_numpy(), FEATURE_COLUMNS)
+    return transformer, X_train_scaled, X_test_scaled, y_train, y_test
+
+
+def resample_data(scaled, strategy, random_state, trace_memory=False):
     # Address Class Imbalance (only for training data)
-    smote = SMOTE(random_state=42)
-    X_train_scaled_smote, y_train_smote = smote.fit_resample(X_train_scaled, y_train)
-
-    # Save data and scaler to disk
-    joblib.dump(X_train_scaled_smote, DATA_PATHS["X_train"])
-    joblib.dump(X_test_scaled, DATA_PATHS["X_test"])
-    joblib.dump(y_train_smote, DATA_PATHS["y_train"])
-    joblib.dump(y_test, DATA_PATHS["y_test"])
-    joblib.dump(scaler, DATA_PATHS["scaler"])
+    transformer, X_train_scaled, X_test_scaled, y_train, y_test = scaled
+    out_path = os.path.join(DATA_PATHS["stage_cache"], "resampled.npy")
+    os.makedirs(DATA_PATHS["stage_cache"], exist_ok=True)
+    X_train_res, y_train_res, weights, report = resample(
+        X_train_scaled, y_train, strategy, random_state, out_path, trace_memory=trace_memory
+    )
+    return transformer, X_train_res, X_test_scaled, y_train_res, y_test, weights, report
+
+
+def read_key(path):
+    if not os.path.exists(path):
+        return None
+    with open(path) as f:
+        return f.read()
+
+
+def prepare_data(
+    data_path="data/data_churn.csv", use_cache=True, extra_paths=(), resample_strategy=DEFAULT_STRATEGY,
+    trace_memory=False,
+):
+    ensure_dirs()
+    # Each stage is memoized under a key of the input file hashes and the stage parameters. Peak memory
+    # per stage is opt-in: under tracemalloc, the stages (and the imports they trigger) run much slower
+    stages = StageCache(DATA_PATHS["stage_cache"], enabled=use_cache, trace_memory=trace_memory)
+    raw = [stages.source(path) for path in [data_path, *extra_paths]]
+    df = stages.stage("load", read_data, *raw)
+    transformer = stages.stage("features", fit_features, df, n_clusters=3, iqr_factor=3, random_state=42)
+    df_dp = stages.stage("engineer", engineer_features, transformer, df)
+    split = stages.stage("split", split_data, df_dp, test_size=0.2, random_state=42)
+    scaled = stages.stage("scale", scale_data, transformer, split)
+    # Tracing doesn't change the output, so it is bound to the function rather than keyed as a parameter
+    resampled = stages.stage(
+        "resample", functools.partial(resample_data, trace_memory=trace_memory), scaled, strategy=resample_strategy,
+        random_state=42,
+    )
+
+    tracing = not trace_memory or tracemalloc.is_tracing()
+    if not tracing:
+        tracemalloc.start()
+    try:
+        transformer, X_train_scaled_smote, X_test_scaled, y_train_smote, y_test, weights, report = resampled.value
+    finally:
+        if not tracing:
+            tracemalloc.stop()
+    for name, stats in stages.stats.items():
+        peak = f", peak {stats['peak_mb']:.1f} MB" if "peak_mb" in stats else ""
+        print(f"Stage {name}: {stats['seconds']:.2f}s{peak}")
+    print(
+        f"Resampling ({report['strategy']}): {report['rows_in']} -> {report['rows_out']} rows, "
+        f"{report['seconds']:.2f}s"
+        + (f", peak {report['peak_mb']:.1f} MB" if report["peak_mb"] is not None else "")
+        + (" (cached)" if "resample" in stages.hits else "")
+    )
+
+    # Save data and scaler to disk, unless they already hold this exact result
+    key_path = DATA_PATHS["prepare_key"]
+    outputs_current = all(os.path.exists(DATA_PATHS[k]) for k in OUTPUT_KEYS) and read_key(key_path) == resampled.key
+    if not (use_cache and outputs_current):
+        save_frame(X_train_scaled_smote, DATA_PATHS["X_train"])
+        save_frame(X_test_scaled, DATA_PATHS["X_test"])
+        save_frame(y_train_smote, DATA_PATHS["y_train"])
+        save_frame(y_test, DATA_PATHS["y_test"])
+        if weights is not None:
+            save_frame(weights, DATA_PATHS["w_train"])
+        else:
+            delete_frame(DATA_PATHS["w_train"])
+        joblib.dump(transformer.scaler, DATA_PATHS["scaler"])
+        joblib.dump(transformer, DATA_PATHS["transformer"])
+        with open(key_path, "w") as f:
+            f.write(resampled.key)
 
     return X_train_scaled_smote, X_test_scaled, y_train_smote, y_test
@@ -0,0 +1,195 @@
+import hashlib
+import io
+import json
+import logging
+import os
+import threading
+import time
+import joblib
+from src.compiled import compile_model
+
+logger = logging.getLogger(__name__)
+
+
+class ModelBundle:
+    """A loaded model with the feature transformer it was trained with."""
+
+    def __init__(self, model, transformer, version, fingerprint):
+        self.model = model
+        self.transformer = transformer
+        self.version = version
+        self.fingerprint = fingerprint
+        self.loaded_at = time.time()
+
+    def info(self):
+        return {
+            "version": self.version,
+            "model_type": type(self.model).__name__,
+            "loaded_at": self.loaded_at,
+        }
+
+
+def file_fingerprint(paths):
+    # Cheap change detection; the content hash is only computed when this changes
+    return tuple((os.stat(p).st_mtime_ns, os.stat(p).st_size) for p in paths)
+
+
+def file_hash(paths):
+    digest = hashlib.sha256()
+    for path in paths:
+        with open(path, "rb") as f:
+            for block in iter(lambda: f.read(1 << 20), b""):
+                digest.update(block)
+    return digest.hexdigest()[:12]
+
+
+def write_manifest(path, model_path, transformer_path):
+    """Record the version of a saved model/transformer pair; written last, it marks the pair complete."""
+    manifest = {"version": file_hash([model_path, transformer_path]), "model": model_path,
+                "transformer": transformer_path}
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, "w") as f:
+        json.dump(manifest, f)
+    os.replace(tmp_path, path)
+    return manifest["version"]
+
+
+class ModelRegistry:
+    """Holds the serving model and swaps in new artifacts without a restart.
+
+    Requests read current() once and keep that bundle for the whole call; a
+    reload builds the new bundle off the request path and then replaces the
+    reference in one assignment, so serving never waits on a load. The
+    previous bundle is kept warm for rollback().
+
+    The model and the transformer are replaced by two separate writes. With
+    a manifest (written last by save_model), only a change of the manifest
+    triggers a reload, and only a pair whose content matches the manifest
+    version is loaded, so the two are swapped as one unit. Without one, the
+    artifacts themselves are watched.
+    """
+
+    def __init__(self, model_path, transformer_path, poll_interval=5.0, manifest_path=None):
+        self.model_path = model_path
+        self.transformer_path = transformer_path
+        self.manifest_path = manifest_path
+        self.poll_interval = poll_interval
+        self._current = None
+        self._previous = None
+        self._lock = threading.Lock()
+        self._listeners = []
+        self._watcher = None
+        self._stop = threading.Event()
+        self.last_error = None
+
+    @property
+    def paths(self):
+        return [self.model_path, self.transformer_path]
+
+    def current(self):
+        return self._current
+
+    def add_listener(self, callback):
+        """Call callback(new_bundle) after every swap (e.g. to invalidate caches)."""
+        self._listeners.append(callback)
+
+    def _manifest(self):
+        return self.manifest_path if self.manifest_path and os.path.exists(self.manifest_path) else None
+
+    def reload(self, force=False):
+        """Load the artifacts if they changed on disk; returns True when a new bundle was swapped in."""
+        with self._lock:
+            try:
+                manifest = self._manifest()
+                fingerprint = file_fingerprint([manifest] if manifest else self.paths)
+                current = self._current
+                if not force and current is not None and current.fingerprint == fingerprint:
+                    return False
+                expected = None
+                if manifest:
+                    with open(manifest) as f:
+                        expected = json.load(f)["version"]
+                    if not force and current is not None and current.version == expected:
+                        current.fingerprint = fingerprint
+                        return False
+                # Hash and unpickle the same bytes, so a write in between can't pair other files
+                blobs = []
+                for path in self.paths:
+                    with open(path, "rb") as f:
+                        blobs.append(f.read())
+                version = hashlib.sha256(b"".join(blobs)).hexdigest()[:12]
+                if expected is not None and version != expected:
+                    # A save is between its writes (or the artifacts were copied without their
+                    # manifest): keep serving the current pair, the next poll retries
+                    message = f"Artifacts {version} don't match manifest version {expected}"
+                    if current is not None:
+                        self.last_error = message
+                        logger.info(f"{message}; keeping the current model")
+                        return False
+                    logger.warning(f"{message}; loading them, as there is no model to keep serving")
+                if not force and current is not None and current.version == version:
+                    current.fingerprint = fingerprint
+                    return False
+                bundle = ModelBundle(
+                    compile_model(joblib.load(io.BytesIO(blobs[0]))),
+                    joblib.load(io.BytesIO(blobs[1])),
+                    version,
+                    fingerprint,
+                )
+            except Exception as e:
+                # Keep serving the current bundle; the next poll retries
+                self.last_error = str(e)
+                logger.error(f"Error loading model from {self.model_path}: {e}")
+                return False
+            self._swap(bundle)
+            logger.info(f"Model version {bundle.version} loaded from {self.model_path}")
+            return True
+
+    def rollback(self):
+        """Swap the previous bundle back in; returns False if there is none.
+
+        The rolled-back bundle takes the fingerprint of the artifacts on disk,
+        so the watcher doesn't load the newer model again until they change.
+        """
+        with self._lock:
+            if self._previous is None:
+                return False
+            manifest = self._manifest()
+            try:
+                self._previous.fingerprint = file_fingerprint([manifest] if manifest else self.paths)
+            except OSError:
+                pass  # Artifacts gone: the watcher's reload fails and keeps this bundle anyway
+            self._swap(self._previous)
+            logger.info(f"Rolled back to model version {self._current.version}")
+            return True
+
+    def _swap(self, bundle):
+        self._previous, self._current = self._current, bundle
+        self.last_error = None
+        for callback in self._listeners:
+            callback(bundle)
+
+    def start_watching(self):
+        """Poll the artifacts in a daemon thread and reload them when they change."""
+        if self._watcher is not None and self._watcher.is_alive():
+            return
+        self._stop.clear()
+        self._watcher = threading.Thread(target=self._watch, name="model-watcher", daemon=True)
+        self._watcher.start()
+
+    def stop_watching(self):
+        self._stop.set()
+
+    def _watch(self):
+        while not self._stop.wait(self.poll_interval):
+            self.reload()
+
+    def info(self):
+        current, previous = self._current, self._previous
+        return {
+            "model_path": self.model_path,
+            "current": current.info() if current else None,
+            "previous": previous.info() if previous else None,
+            "watching": self._watcher is not None and self._watcher.is_alive(),
+            "last_error": self.last_error,
+        }
@@ -0,0 +1,124 @@
+import logging
+import os
+import time
+import tracemalloc
+import numpy as np
+
+# imbalanced-learn, scikit-learn and pandas are imported by the strategies
+# themselves, so that the CLI can list STRATEGIES without loading them
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_STRATEGY = "smote"
+K_NEIGHBORS = 5
+CHUNK_ROWS = 65_536
+
+
+def _neighbors(n_jobs):
+    from sklearn.neighbors import NearestNeighbors
+
+    # Exact kd-tree search: same neighbours as brute force, O(n log n) on low-dimensional features
+    return NearestNeighbors(n_neighbors=K_NEIGHBORS + 1, algorithm="kd_tree", n_jobs=n_jobs)
+
+
+def smote(X, y, random_state, out_path=None, n_jobs=-1):
+    from imblearn.over_sampling import SMOTE
+
+    X_res, y_res = SMOTE(k_neighbors=_neighbors(n_jobs), random_state=random_state).fit_resample(X, y)
+    return X_res, y_res, None
+
+
+def smote_chunked(X, y, random_state, out_path, n_jobs=-1, chunk_rows=CHUNK_ROWS):
+    """SMOTE that writes the resampled matrix straight into a memory-mapped .npy.
+
+    Neighbours are searched once per minority row; synthetic rows are then
+    generated chunk_rows at a time, so memory stays bounded by the chunk size
+    instead of the oversampled set.
+    """
+    import pandas as pd
+
+    values = np.asarray(X, dtype=np.float64)
+    labels = np.asarray(y)
+    classes, counts = np.unique(labels, return_counts=True)
+    minority = classes[np.argmin(counts)]
+    n_new = int(counts.max() - counts.min())
+    X_min = values[labels == minority]
+    neighbors = _neighbors(n_jobs).fit(X_min).kneighbors(X_min, return_distance=False)[:, 1:]
+
+    rng = np.random.default_rng(random_state)
+    tmp_path = f"{out_path}.tmp.npy"
+    out = np.lib.format.open_memmap(
+        tmp_path, mode="w+", dtype=np.float64, shape=(len(values) + n_new, values.shape[1]), fortran_order=True
+    )
+    out[: len(values)] = values
+    for start in range(0, n_new, chunk_rows):
+        n = min(chunk_rows, n_new - start)
+        base = rng.integers(len(X_min), size=n)
+        pick = neighbors[base, rng.integers(K_NEIGHBORS, size=n)]
+        gap = rng.random((n, 1))
+        row = len(values) + start
+        out[row:row + n] = X_min[base] + gap * (X_min[pick] - X_min[base])
+    out.flush()
+    del out
+    os.replace(tmp_path, out_path)
+
+    X_res = pd.DataFrame(np.load(out_path, mmap_mode="r"), columns=X.columns, copy=False)
+    y_res = pd.Series(np.concatenate([labels, np.full(n_new, minority)]), name=y.name)
+    return X_res, y_res, None
+
+
+def balanced_weights(y, counts=None):
+    # n_samples / (n_classes * class_count), like class_weight="balanced"
+    labels = np.asarray(y)
+    counts = np.bincount(labels) if counts is None else np.asarray(counts)
+    return counts.sum() / (len(counts) * counts[labels])
+
+
+def class_weight(X, y, random_state, out_path=None, n_jobs=-1):
+    # No synthetic rows at all; the minority class weighs more in the loss instead
+    import pandas as pd
+
+    return X, y, pd.Series(balanced_weights(y), index=y.index, name="weight")
+
+
+STRATEGIES = {
+    "smote": smote,
+    "smote-chunked": smote_chunked,
+    "class-weight": class_weight,
+}
+
+
+def resample(X, y, strategy=DEFAULT_STRATEGY, random_state=42, out_path=None, n_jobs=-1, trace_memory=False):
+    """Run a resampling strategy; returns (X, y, sample_weight or None, report).
+
+    The report has the peak memory of the strategy only with trace_memory,
+    as tracemalloc slows it down heavily.
+    """
+    if strategy not in STRATEGIES:
+        raise ValueError(f"Unknown resampling strategy '{strategy}', expected one of {sorted(STRATEGIES)}")
+    tracing = not trace_memory or tracemalloc.is_tracing()
+    if not tracing:
+        tracemalloc.start()
+    if trace_memory:
+        tracemalloc.reset_peak()
+    start = time.perf_counter()
+    X_res, y_res, weights = STRATEGIES[strategy](X, y, random_state, out_path=out_path, n_jobs=n_jobs)
+    seconds = time.perf_counter() - start
+    peak = tracemalloc.get_traced_memory()[1] if trace_memory else None
+    if not tracing:
+        tracemalloc.stop()
+
+    report = {
+        "strategy": strategy,
+        "seconds": seconds,
+        "peak_mb": peak / 2**20 if peak is not None else None,
+        "rows_in": len(X),
+        "rows_out": len(X_res),
+        "disk_mb": os.path.getsize(out_path) / 2**20 if strategy == "smote-chunked" else 0.0,
+    }
+    in_memory = f"peak {report['peak_mb']:.1f} MB in memory, " if peak is not None else ""
+    logger.info(
+        f"Resampling '{strategy}': {report['rows_in']} -> {report['rows_out']} rows in {seconds:.2f}s, "
+        f"{in_memory}{report['disk_mb']:.1f} MB on disk"
+    )
+    return X_res, y_res, weights, report
@@ -1,8 +1,48 @@
+import os
 import joblib
+from src.compiled import FlatEnsemble
+from src.registry import write_manifest
 
 PRODUCTION_MODEL_PATH = "customer_churn_gbm_model.pkl"
+PRODUCTION_TRANSFORMER_PATH = "customer_churn_feature_transformer.pkl"
+PRODUCTION_COMPILED_PATH = "customer_churn_gbm_model.npz"
+# Version of the model/transformer pair, written after both: serving reloads when it changes
+PRODUCTION_MANIFEST_PATH = "customer_churn_model.json"
 
 
-def save_model(model):
-    joblib.dump(model, PRODUCTION_MODEL_PATH)
+def atomic_dump(obj, path):
+    # Write next to the target and rename, so a watching server never reads a partial file
+    tmp_path = f"{path}.tmp"
+    joblib.dump(obj, tmp_path)
+    os.replace(tmp_path, path)
+
+
+def compiled_path(model_path):
+    # The flattened export of a joblib model lives next to it
+    return f"{os.path.splitext(model_path)[0]}.npz"
+
+
+def export_compiled(model, path):
+    """Write the flattened ensemble of model to path; returns False (and removes path) when unsupported."""
+    try:
+        FlatEnsemble.from_gbm(model).save(path)
+        return True
+    except ValueError as e:
+        # Don't leave an export of a previous model next to this one
+        if os.path.exists(path):
+            os.remove(path)
+        print(f"Skipping flattened ensemble export: {e}")
+        return False
+
+
+def save_model(model, transformer=None):
+    if transformer is not None:
+        atomic_dump(transformer, PRODUCTION_TRANSFORMER_PATH)
+        print(f"Feature transformer saved to {PRODUCTION_TRANSFORMER_PATH}")
+    atomic_dump(model, PRODUCTION_MODEL_PATH)
     print(f"Model saved to {PRODUCTION_MODEL_PATH}")
+    if export_compiled(model, PRODUCTION_COMPILED_PATH):
+        print(f"Flattened ensemble exported to {PRODUCTION_COMPILED_PATH}")
+    if os.path.exists(PRODUCTION_TRANSFORMER_PATH):
+        version = write_manifest(PRODUCTION_MANIFEST_PATH, PRODUCTION_MODEL_PATH, PRODUCTION_TRANSFORMER_PATH)
+        print(f"Model version {version} recorded in {PRODUCTION_MANIFEST_PATH}")
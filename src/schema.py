@@ -0,0 +1,66 @@
+import numpy as np
+import pandas as pd
+
+# Compact dtypes of the churn CSV. Counts fit int16 and amounts float32 (the
+# model sees float32 anyway); the few distinct strings become categories and
+# Churn a boolean. Columns missing from a file are skipped.
+CHURN_SCHEMA = {
+    "State": "category",
+    "Account length": "int16",
+    "Area code": "int16",
+    "International plan": "category",
+    "Voice mail plan": "category",
+    "Number vmail messages": "int16",
+    "Total day minutes": "float32",
+    "Total day calls": "int16",
+    "Total day charge": "float32",
+    "Total eve minutes": "float32",
+    "Total eve calls": "int16",
+    "Total eve charge": "float32",
+    "Total night minutes": "float32",
+    "Total night calls": "int16",
+    "Total night charge": "float32",
+    "Total intl minutes": "float32",
+    "Total intl calls": "int16",
+    "Total intl charge": "float32",
+    "Customer service calls": "int16",
+    "Churn": "bool",
+}
+CATEGORY_COLUMNS = [c for c, dtype in CHURN_SCHEMA.items() if dtype == "category"]
+# Rows parsed at a time: only one chunk is ever held with pandas' default 64-bit dtypes
+READ_CHUNK_ROWS = 250_000
+
+
+def apply_schema(df):
+    """Cast a raw churn frame to CHURN_SCHEMA, refusing integers the narrow types can't hold."""
+    for column, dtype in CHURN_SCHEMA.items():
+        if column not in df.columns or df[column].dtype == dtype:
+            continue
+        if dtype.startswith("int"):
+            # astype would wrap out-of-range values around silently
+            info = np.iinfo(dtype)
+            if df[column].min() < info.min or df[column].max() > info.max:
+                raise ValueError(f"Column '{column}' has values outside the {dtype} range")
+        if column == "Churn":
+            # Strings like "False" would all cast to True
+            df[column] = df[column].astype(str).str.lower().eq("true")
+        else:
+            df[column] = df[column].astype(dtype)
+    return df
+
+
+def concat_frames(frames):
+    """pd.concat that keeps the category columns categorical (their categories are unioned)."""
+    if len(frames) == 1:
+        return frames[0]
+    for column in CATEGORY_COLUMNS:
+        if all(column in f.columns for f in frames):
+            categories = sorted(set().union(*(f[column].cat.categories for f in frames)))
+            for f in frames:
+                f[column] = f[column].cat.set_categories(categories)
+    return pd.concat(frames, ignore_index=True)
+
+
+def read_churn_csv(path, chunk_rows=READ_CHUNK_ROWS):
+    """Read a churn CSV chunk by chunk straight into the compact schema."""
+    return concat_frames([apply_schema(chunk) for chunk in pd.read_csv(path, chunksize=chunk_rows)])
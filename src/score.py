@@ -0,0 +1,216 @@
+import os
+import shutil
+import tempfile
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+import joblib
+import numpy as np
+from src.compiled import load_predictor
+
+# pandas is imported where frames are built, so that the CLI can read
+# DEFAULT_CHUNKSIZE without loading it
+
+DEFAULT_CHUNKSIZE = 100_000
+DEFAULT_SHARD_ROWS = 50_000
+
+# Per-process state of the scoring pool, set once by _init_worker
+_worker = {}
+
+
+def score_features(model, features):
+    """Churn probabilities and labels from a single predict_proba pass."""
+    probabilities = model.predict_proba(features)
+    predictions = model.classes_[np.argmax(probabilities, axis=1)]
+    return predictions, probabilities[:, 1]
+
+
+def score_chunk(model, transformer, chunk, id_column=None, monitor=None):
+    import pandas as pd
+
+    features = transformer.transform(chunk)
+    if monitor is not None:
+        monitor.update(features)
+    predictions, probabilities = score_features(model, features)
+    scored = pd.DataFrame(
+        {"Churn_Probability": probabilities, "Churn_Prediction": predictions.astype(np.int8)},
+        index=chunk.index,
+    )
+    if id_column is not None:
+        scored.insert(0, id_column, chunk[id_column].to_numpy())
+    return scored
+
+
+class _CsvSink:
+    def __init__(self, path):
+        self.file = open(path, "w", newline="")
+        self.header = True
+
+    def write(self, frame):
+        frame.to_csv(self.file, header=self.header, index=False)
+        self.header = False
+
+    def close(self):
+        self.file.close()
+
+
+class _ParquetSink:
+    def __init__(self, path):
+        try:
+            import pyarrow  # noqa: F401
+        except ImportError:
+            raise ImportError("Writing Parquet output requires pyarrow (pip install pyarrow).")
+        self.path = path
+        self.writer = None
+
+    def write(self, frame):
+        import pyarrow as pa
+        import pyarrow.parquet as pq
+
+        table = pa.Table.from_pandas(frame, preserve_index=False)
+        if self.writer is None:
+            self.writer = pq.ParquetWriter(self.path, table.schema)
+        self.writer.write_table(table)
+
+    def close(self):
+        if self.writer is not None:
+            self.writer.close()
+
+
+def open_sink(out_path):
+    if os.path.splitext(out_path)[1].lower() in (".parquet", ".pq"):
+        return _ParquetSink(out_path)
+    return _CsvSink(out_path)
+
+
+def iter_chunks(in_path, chunksize=DEFAULT_CHUNKSIZE):
+    import pandas as pd
+
+    return pd.read_csv(in_path, chunksize=chunksize)
+
+
+def score_file(model, transformer, in_path, out_path, chunksize=DEFAULT_CHUNKSIZE, id_column=None, logger=None,
+               monitor=None):
+    """Score a CSV chunk by chunk, appending results to a CSV or Parquet file.
+
+    Only one chunk is held in memory at a time, so peak memory is bounded by
+    chunksize rather than by the size of the input file. The scored features
+    are fed to monitor (a DriftMonitor), if given.
+    """
+    sink = open_sink(out_path)
+    n_rows = 0
+    try:
+        for chunk in iter_chunks(in_path, chunksize):
+            sink.write(score_chunk(model, transformer, chunk, id_column, monitor))
+            n_rows += len(chunk)
+            if logger is not None:
+                logger.info(f"Scored {n_rows} rows from {in_path}")
+    finally:
+        sink.close()
+    return n_rows
+
+
+def _init_worker(model_path, transformer_path=None, matrix_path=None, drift=False):
+    # Loaded once per worker process. Each worker holds its own copy of the flattened
+    # ensemble (a few small arrays); what score_matrix_parallel shares is the memory-mapped input
+    _worker["model"] = load_predictor(model_path)
+    if transformer_path is not None:
+        _worker["transformer"] = joblib.load(transformer_path)
+        if drift:
+            from src.drift import DriftMonitor
+
+            # Binned here; the counts travel back with each chunk's scores
+            _worker["monitor"] = DriftMonitor(_worker["transformer"].drift_reference)
+    if matrix_path is not None:
+        _worker["matrix"] = np.load(matrix_path, mmap_mode="r")
+
+
+def _score_shard(bounds):
+    start, stop = bounds
+    return score_features(_worker["model"], _worker["matrix"][start:stop])
+
+
+def _score_chunk_task(task):
+    chunk, id_column = task
+    monitor = _worker.get("monitor")
+    scored = score_chunk(_worker["model"], _worker["transformer"], chunk, id_column, monitor)
+    return scored, monitor.pop_counts() if monitor is not None else None
+
+
+def _ordered_map(pool, fn, tasks, max_pending):
+    """Like pool.map, but keeps at most max_pending tasks in flight so input is consumed lazily."""
+    pending = deque()
+    for task in tasks:
+        pending.append(pool.submit(fn, task))
+        if len(pending) >= max_pending:
+            yield pending.popleft().result()
+    while pending:
+        yield pending.popleft().result()
+
+
+def score_matrix_parallel(model_path, features, n_workers=None, shard_rows=DEFAULT_SHARD_ROWS):
+    """Score a feature matrix (array or .npy path) across a process pool.
+
+    The matrix is shared with the workers through a memory-mapped .npy file,
+    so tasks only carry row ranges; results come back in input order.
+    """
+    n_workers = n_workers or os.cpu_count() or 1
+    tmp_dir = None
+    if isinstance(features, (str, os.PathLike)):
+        matrix_path = features
+        n_rows = np.load(matrix_path, mmap_mode="r").shape[0]
+    else:
+        tmp_dir = tempfile.mkdtemp(prefix="churn-score-")
+        matrix_path = os.path.join(tmp_dir, "features.npy")
+        np.save(matrix_path, np.ascontiguousarray(features, dtype=np.float64))
+        n_rows = len(features)
+
+    try:
+        bounds = [(start, min(start + shard_rows, n_rows)) for start in range(0, n_rows, shard_rows)]
+        with ProcessPoolExecutor(n_workers, initializer=_init_worker, initargs=(model_path, None, matrix_path)) as pool:
+            results = list(pool.map(_score_shard, bounds))
+    finally:
+        if tmp_dir is not None:
+            shutil.rmtree(tmp_dir, ignore_errors=True)
+
+    if not results:
+        return np.empty(0, dtype=np.int64), np.empty(0, dtype=np.float64)
+    predictions = np.concatenate([p for p, _ in results])
+    probabilities = np.concatenate([q for _, q in results])
+    return predictions, probabilities
+
+
+def score_file_parallel(
+    model_path,
+    transformer_path,
+    in_path,
+    out_path,
+    chunksize=DEFAULT_CHUNKSIZE,
+    id_column=None,
+    n_workers=None,
+    logger=None,
+    monitor=None,
+):
+    """score_file with chunks transformed and scored across a process pool.
+
+    Chunks are written in input order, and at most two chunks per worker are
+    in flight, so memory stays bounded by chunksize * n_workers. Workers bin
+    the features for monitor, if given, and send back the counts.
+    """
+    drift = monitor is not None and monitor.reference is not None
+    n_workers = n_workers or os.cpu_count() or 1
+    sink = open_sink(out_path)
+    n_rows = 0
+    try:
+        initargs = (model_path, transformer_path, None, drift)
+        with ProcessPoolExecutor(n_workers, initializer=_init_worker, initargs=initargs) as pool:
+            tasks = ((chunk, id_column) for chunk in iter_chunks(in_path, chunksize))
+            for scored, counts in _ordered_map(pool, _score_chunk_task, tasks, 2 * n_workers):
+                if counts is not None:
+                    monitor.add_counts(counts, monitor.reference)
+                sink.write(scored)
+                n_rows += len(scored)
+                if logger is not None:
+                    logger.info(f"Scored {n_rows} rows from {in_path}")
+    finally:
+        sink.close()
+    return n_rows
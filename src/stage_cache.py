@@ -0,0 +1,129 @@
+import glob
+import hashlib
+import json
+import logging
+import os
+import time
+import tracemalloc
+import joblib
+
+logger = logging.getLogger(__name__)
+
+# Bump when a stage's code changes in a way that invalidates cached outputs
+STAGE_CACHE_VERSION = 4
+
+
+class Stage:
+    """A pipeline step whose output is memoized on disk under a content key.
+
+    The key chains the stage name, its parameters and the keys of its inputs,
+    so it changes whenever anything upstream changes. Values are resolved
+    lazily: a cached stage is loaded without evaluating its inputs at all.
+    """
+
+    def __init__(self, cache, name, fn, inputs, params):
+        self.cache = cache
+        self.name = name
+        self.fn = fn
+        self.inputs = inputs
+        self.params = params
+        payload = [STAGE_CACHE_VERSION, name, sorted(params.items()), [i.key for i in inputs]]
+        self.key = hashlib.sha256(json.dumps(payload, default=str).encode()).hexdigest()
+        self._resolved = False
+        self._value = None
+
+    @property
+    def path(self):
+        return os.path.join(self.cache.cache_dir, f"{self.name}-{self.key[:16]}.pkl")
+
+    @property
+    def value(self):
+        if not self._resolved:
+            self._value = self._load_or_compute()
+            self._resolved = True
+        return self._value
+
+    def _load_or_compute(self):
+        if self.cache.enabled and os.path.exists(self.path):
+            self.cache.hits.append(self.name)
+            logger.info(f"Stage '{self.name}' unchanged, loaded from {self.path}")
+            return joblib.load(self.path)
+        self.cache.misses.append(self.name)
+        inputs = [i.value for i in self.inputs]
+        tracing = self.cache.trace_memory and tracemalloc.is_tracing()
+        if tracing:
+            tracemalloc.reset_peak()
+            baseline = tracemalloc.get_traced_memory()[0]
+        start = time.perf_counter()
+        value = self.fn(*inputs, **self.params)
+        self.cache.stats[self.name] = {"seconds": time.perf_counter() - start}
+        if tracing:
+            # Memory the stage allocated on top of what was live when it started
+            self.cache.stats[self.name]["peak_mb"] = (tracemalloc.get_traced_memory()[1] - baseline) / 2**20
+        if self.cache.enabled:
+            os.makedirs(self.cache.cache_dir, exist_ok=True)
+            tmp_path = f"{self.path}.tmp"
+            joblib.dump(value, tmp_path)
+            os.replace(tmp_path, self.path)
+            self.cache.prune(self.name, self.path)
+        return value
+
+
+class Source:
+    """A pipeline input file, keyed by the SHA-256 of its contents."""
+
+    def __init__(self, cache, path):
+        self.path = path
+        self.key = cache.file_key(path)
+        self.value = path
+
+
+class StageCache:
+    """Creates the stages of a pipeline and records, per computed stage, its
+    wall time and (with trace_memory, while tracemalloc is tracing) its peak
+    memory in stats. Each stage keeps only its newest output on disk."""
+
+    def __init__(self, cache_dir, enabled=True, trace_memory=False):
+        self.cache_dir = cache_dir
+        self.enabled = enabled
+        self.trace_memory = trace_memory
+        self.hits = []
+        self.misses = []
+        self.stats = {}
+
+    def source(self, path):
+        return Source(self, path)
+
+    def prune(self, name, keep):
+        """Remove the outputs of stage name other than keep: only the newest one is ever reused."""
+        for path in glob.glob(os.path.join(glob.escape(self.cache_dir), f"{glob.escape(name)}-*.pkl")):
+            # Names like "load" must not match the outputs of a stage called "load-extra"
+            if path != keep and len(os.path.basename(path)) == len(name) + 21:
+                os.remove(path)
+
+    def stage(self, name, fn, *inputs, **params):
+        return Stage(self, name, fn, list(inputs), params)
+
+    def file_key(self, path):
+        # Rehash only when mtime/size change; the digest is remembered per file
+        stat = os.stat(path)
+        fingerprint = [os.path.abspath(path), stat.st_mtime_ns, stat.st_size]
+        index_path = os.path.join(self.cache_dir, "file_hashes.json")
+        index = {}
+        if os.path.exists(index_path):
+            with open(index_path) as f:
+                index = json.load(f)
+        entry = index.get(fingerprint[0])
+        if entry is not None and entry["fingerprint"] == fingerprint:
+            return entry["sha256"]
+
+        digest = hashlib.sha256()
+        with open(path, "rb") as f:
+            for block in iter(lambda: f.read(1 << 20), b""):
+                digest.update(block)
+        index[fingerprint[0]] = {"fingerprint": fingerprint, "sha256": digest.hexdigest()}
+        if self.enabled:
+            os.makedirs(self.cache_dir, exist_ok=True)
+            with open(index_path, "w") as f:
+                json.dump(index, f)
+        return digest.hexdigest()
@@ -0,0 +1,163 @@
+import json
+import os
+import numpy as np
+import pandas as pd
+
+# Columnar store for processed data: one raw .npy per frame (column-major, so
+# every column is contiguous on disk) plus a JSON manifest with the schema.
+# Loading memory-maps the file, so it is near-instant, pages are shared
+# between processes, and nothing is unpickled. Rows added later by
+# append_frame go to separate part files, so appending costs O(new rows);
+# the next save_frame compacts everything into one file again.
+
+
+def _manifest_path(path):
+    return os.path.join(os.path.dirname(path) or ".", "manifest.json")
+
+
+def _index_path(path):
+    return f"{os.path.splitext(path)[0]}.index.npy"
+
+
+def read_manifest(path):
+    manifest_path = _manifest_path(path)
+    if not os.path.exists(manifest_path):
+        return {}
+    with open(manifest_path) as f:
+        return json.load(f)
+
+
+def _part_path(path, part):
+    return f"{os.path.splitext(path)[0]}.part{part:05d}.npy"
+
+
+def frame_paths(path):
+    """The .npy files holding the rows of a stored frame: the first one and its appended parts."""
+    schema = read_manifest(path).get(os.path.basename(path), {})
+    return [path] + [_part_path(path, part) for part in schema.get("parts", [])]
+
+
+def _write_manifest(path, manifest):
+    tmp_manifest = f"{_manifest_path(path)}.tmp"
+    with open(tmp_manifest, "w") as f:
+        json.dump(manifest, f, indent=2)
+    os.replace(tmp_manifest, _manifest_path(path))
+
+
+def _atomic_save(path, array):
+    tmp_path = f"{path}.tmp.npy"
+    np.save(tmp_path, array)
+    os.replace(tmp_path, path)
+
+
+def save_frame(data, path):
+    """Persist a DataFrame or Series as .npy (plus its index when it is not a RangeIndex)."""
+    if isinstance(data, pd.Series):
+        kind, columns, values = "series", [data.name], data.to_numpy()
+    else:
+        dtypes = set(data.dtypes)
+        if len(dtypes) != 1:
+            raise ValueError(f"Columnar store needs a single dtype per frame, got {sorted(map(str, dtypes))}")
+        kind, columns, values = "frame", list(data.columns), np.asfortranarray(data.to_numpy())
+    _atomic_save(path, values)
+
+    index = data.index
+    has_index = not (isinstance(index, pd.RangeIndex) and index.start == 0 and index.step == 1)
+    if has_index:
+        _atomic_save(_index_path(path), index.to_numpy())
+    elif os.path.exists(_index_path(path)):
+        os.remove(_index_path(path))
+
+    manifest = read_manifest(path)
+    for part in manifest.get(os.path.basename(path), {}).get("parts", []):
+        for part_path in (_part_path(path, part), _index_path(_part_path(path, part))):
+            if os.path.exists(part_path):
+                os.remove(part_path)
+    manifest[os.path.basename(path)] = {
+        "kind": kind,
+        "columns": columns,
+        "dtype": str(values.dtype),
+        "shape": list(values.shape),
+        "order": "F" if kind == "frame" else "C",
+        "index": has_index,
+        "parts": [],
+    }
+    _write_manifest(path, manifest)
+
+
+def delete_frame(path):
+    """Remove a stored frame, its parts and its manifest entry, if present."""
+    manifest = read_manifest(path)
+    schema = manifest.pop(os.path.basename(path), None)
+    paths = [path] + [_part_path(path, p) for p in (schema or {}).get("parts", [])]
+    for stored in paths + [_index_path(p) for p in paths]:
+        if os.path.exists(stored):
+            os.remove(stored)
+    if schema is not None:
+        _write_manifest(path, manifest)
+
+
+def append_frame(data, path):
+    """Append the rows of a DataFrame/Series to a stored one as a new part file."""
+    manifest = read_manifest(path)
+    try:
+        schema = manifest[os.path.basename(path)]
+    except KeyError:
+        raise FileNotFoundError(f"{path} is not listed in {_manifest_path(path)}")
+    columns = [data.name] if isinstance(data, pd.Series) else list(data.columns)
+    if columns != schema["columns"]:
+        raise ValueError(f"Cannot append columns {columns} to {path} with columns {schema['columns']}")
+    values = data.to_numpy().astype(schema["dtype"], copy=False)
+    if schema["kind"] == "frame":
+        values = np.asfortranarray(values)
+    parts = schema.get("parts", [])
+    part = parts[-1] + 1 if parts else 1
+    _atomic_save(_part_path(path, part), values)
+    if schema["index"]:
+        _atomic_save(_index_path(_part_path(path, part)), data.index.to_numpy())
+    schema["parts"] = parts + [part]
+    schema["shape"][0] += len(values)
+    _write_manifest(path, manifest)
+
+
+def _load_values(path, schema, mmap_mode):
+    # Without appended parts the result stays on the memory map
+    values = np.load(path, mmap_mode=mmap_mode)
+    parts = schema.get("parts", [])
+    if parts:
+        values = np.concatenate([values] + [np.load(_part_path(path, p), mmap_mode=mmap_mode) for p in parts])
+    return values
+
+
+def _load_index(path, schema, mmap_mode):
+    if not schema["index"]:
+        return None
+    paths = [path] + [_part_path(path, p) for p in schema.get("parts", [])]
+    indexes = [np.load(_index_path(p), mmap_mode=mmap_mode) for p in paths]
+    return indexes[0] if len(indexes) == 1 else np.concatenate(indexes)
+
+
+def load_array(path, columns=None, mmap_mode="r"):
+    """The stored values as a (memory-mapped) ndarray, optionally projected to some columns."""
+    schema = read_manifest(path).get(os.path.basename(path), {})
+    values = _load_values(path, schema, mmap_mode)
+    if columns is not None:
+        values = values[:, [schema["columns"].index(c) for c in columns]]
+    return values
+
+
+def load_frame(path, columns=None, mmap_mode="r"):
+    """Load a stored DataFrame/Series; without projection the data stays on the memory map."""
+    try:
+        schema = read_manifest(path)[os.path.basename(path)]
+    except KeyError:
+        raise FileNotFoundError(f"{path} is not listed in {_manifest_path(path)}")
+    values = _load_values(path, schema, mmap_mode)
+    index = _load_index(path, schema, mmap_mode)
+    if schema["kind"] == "series":
+        return pd.Series(values, index=index, name=schema["columns"][0], copy=False)
+    if columns is not None:
+        values = values[:, [schema["columns"].index(c) for c in columns]]
+    else:
+        columns = schema["columns"]
+    return pd.DataFrame(values, index=index, columns=columns, copy=False)
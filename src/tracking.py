@@ -0,0 +1,320 @@
+import atexit
+import glob
+import json
+import logging
+import os
+import shutil
+import tempfile
+import threading
+import time
+import uuid
+from contextlib import contextmanager
+from src.config import DATA_PATHS
+
+try:
+    import fcntl
+except ImportError:  # Windows
+    fcntl = None
+    import msvcrt
+
+logger = logging.getLogger(__name__)
+
+EXPERIMENT = "Customer_Churn_Experiment"
+# MLflow's log_batch limits: 100 params and 1000 entries in total per request
+MAX_BATCH_PARAMS = 100
+MAX_BATCH_ENTRIES = 1000
+
+
+def _now_ms():
+    return int(time.time() * 1000)
+
+
+def _read_records(path):
+    # Complete lines only: the writer may be in the middle of the last one
+    with open(path) as f:
+        data = f.read()
+    return [json.loads(line) for line in data[:data.rfind("\n") + 1].splitlines()]
+
+
+def _state_path(spool_path):
+    return spool_path[: -len(".jsonl")] + ".state.json"
+
+
+def _read_state(spool_path):
+    try:
+        with open(_state_path(spool_path)) as f:
+            return json.load(f)
+    except FileNotFoundError:
+        return {"run_id": None, "sent": 0}
+
+
+def _write_state(spool_path, state):
+    tmp_path = f"{_state_path(spool_path)}.tmp"
+    with open(tmp_path, "w") as f:
+        json.dump(state, f)
+    os.replace(tmp_path, _state_path(spool_path))
+
+
+@contextmanager
+def _run_lock(spool_path):
+    # Exclusive per run, across processes and threads (each call opens its own file
+    # description); the OS releases it if the holder dies, so a crash leaves no stale lock
+    with open(spool_path[: -len(".jsonl")] + ".lock", "a+") as f:
+        if fcntl is not None:
+            fcntl.flock(f, fcntl.LOCK_EX)
+        else:
+            msvcrt.locking(f.fileno(), msvcrt.LK_LOCK, 1)
+        yield
+
+
+def pending_runs(spool_dir=None):
+    """Spool files not fully replayed yet, oldest run first."""
+    return sorted(glob.glob(os.path.join(spool_dir or DATA_PATHS["tracking_spool"], "*.jsonl")))
+
+
+def replay(tracking_uri, spool_dir=None):
+    """Send every spooled run to an MLflow tracking server; returns the number of records sent.
+
+    Progress is kept per run, so a replay interrupted by a server outage
+    resumes where it stopped. Fully replayed runs are removed from the spool.
+    Each run is replayed under an exclusive lock, so concurrent replays (the
+    background flusher and --replay-tracking) never send a run twice.
+    """
+    from mlflow.tracking import MlflowClient
+
+    client = MlflowClient(tracking_uri)
+    paths = pending_runs(spool_dir)
+    # Remote ids of runs started in earlier passes, for the parent tags of nested runs
+    run_ids = {os.path.basename(p)[: -len(".jsonl")]: _read_state(p)["run_id"] for p in paths}
+    experiments = {}
+    sent = 0
+    for path in paths:
+        with _run_lock(path):
+            # Re-read under the lock: another replayer may have sent the run meanwhile
+            if os.path.exists(path):
+                sent += _replay_run(client, path, run_ids, experiments)
+        if not os.path.exists(path):
+            try:
+                os.remove(path[: -len(".jsonl")] + ".lock")
+            except OSError:
+                pass  # Removed by another replayer
+    return sent
+
+
+def _replay_run(client, path, run_ids, experiments):
+    from mlflow.entities import Metric, Param
+
+    key = os.path.basename(path)[: -len(".jsonl")]
+    state = _read_state(path)
+    records = _read_records(path)
+    already_sent = state["sent"]
+    metrics, params = [], []
+
+    def send_batch(upto):
+        while params or metrics:
+            batch_params = params[:MAX_BATCH_PARAMS]
+            del params[:MAX_BATCH_PARAMS]
+            batch_metrics = metrics[:MAX_BATCH_ENTRIES - len(batch_params)]
+            del metrics[:len(batch_metrics)]
+            client.log_batch(state["run_id"], metrics=batch_metrics, params=batch_params)
+        state["sent"] = upto
+        _write_state(path, state)
+
+    for i in range(state["sent"], len(records)):
+        record = records[i]
+        kind = record["kind"]
+        if kind == "params":
+            params.extend(Param(k, str(v)) for k, v in record["params"].items())
+            continue
+        if kind == "metrics":
+            metrics.extend(Metric(k, float(v), record["time"], record["step"]) for k, v in record["metrics"].items())
+            continue
+        if metrics or params:
+            send_batch(i)
+        if kind == "start":
+            name = record["experiment"]
+            if name not in experiments:
+                experiment = client.get_experiment_by_name(name)
+                experiments[name] = experiment.experiment_id if experiment else client.create_experiment(name)
+            parent = record["parent"]
+            if parent and not run_ids.get(parent):
+                # Started by another replayer after this one read the states
+                run_ids[parent] = _read_state(os.path.join(os.path.dirname(path), f"{parent}.jsonl"))["run_id"]
+            tags = {"mlflow.parentRunId": run_ids[parent]} if run_ids.get(parent) else {}
+            run = client.create_run(experiments[name], start_time=record["time"], tags=tags,
+                                    run_name=record["run_name"])
+            state["run_id"] = run_ids[key] = run.info.run_id
+        elif kind == "model":
+            _log_model(client, state["run_id"], os.path.join(os.path.dirname(path), record["path"]),
+                       record["artifact_path"])
+        elif kind == "end":
+            client.set_terminated(state["run_id"], record["status"], record["time"])
+        state["sent"] = i + 1
+        _write_state(path, state)
+    if metrics or params:
+        send_batch(len(records))
+
+    if records and records[-1]["kind"] == "end":
+        os.remove(path)
+        os.remove(_state_path(path))
+        shutil.rmtree(path[: -len(".jsonl")], ignore_errors=True)
+    return len(records) - already_sent
+
+
+def _log_model(client, run_id, model_path, artifact_path):
+    # Logged in the MLflow sklearn format, like mlflow.sklearn.log_model. Pickled, as
+    # skops refuses the tree types, and the model is already a pickle of our own
+    import joblib
+    import mlflow.sklearn
+
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        local_path = os.path.join(tmp_dir, artifact_path)
+        mlflow.sklearn.save_model(
+            joblib.load(model_path), local_path, serialization_format=mlflow.sklearn.SERIALIZATION_FORMAT_CLOUDPICKLE
+        )
+        client.log_artifacts(run_id, local_path, artifact_path)
+
+
+class Tracker:
+    """Experiment tracking that never waits on the MLflow server.
+
+    Runs, params, metrics and models are appended to a local JSONL spool
+    (one file per run) and the call returns. With a tracking URI set, a
+    background thread replays the spool in log_batch requests every
+    flush_interval seconds; without one, runs stay spooled until they are
+    sent with replay() (python -m src.main --replay-tracking URI).
+    """
+
+    def __init__(self, tracking_uri=None, spool_dir=None, experiment=EXPERIMENT, flush_interval=5.0):
+        self.tracking_uri = tracking_uri or None
+        self._spool_dir = spool_dir
+        self.experiment = experiment
+        self.flush_interval = flush_interval
+        self._runs = []  # stack of active (key, file) pairs; nested runs on top
+        self._lock = threading.Lock()
+        self._cond = threading.Condition()
+        self._requested = self._completed = 0
+        self._flusher = None
+
+    @property
+    def spool_dir(self):
+        return self._spool_dir or DATA_PATHS["tracking_spool"]
+
+    def active_run(self):
+        return self._runs[-1][0] if self._runs else None
+
+    @contextmanager
+    def start_run(self, run_name=None, nested=False):
+        """Start a run (nested in the active one if nested=True) and end it on exit."""
+        if self._runs and not nested:
+            self.end_run()
+        key = self._begin(run_name)
+        try:
+            yield key
+        except BaseException:
+            self.end_run("FAILED")
+            raise
+        self.end_run()
+
+    def _begin(self, run_name=None):
+        os.makedirs(self.spool_dir, exist_ok=True)
+        # Sorts in start order, so a replay creates parent runs before nested ones
+        key = f"{time.time_ns()}-{uuid.uuid4().hex[:8]}"
+        parent = self.active_run()
+        with self._lock:
+            self._runs.append((key, open(os.path.join(self.spool_dir, f"{key}.jsonl"), "a")))
+        self._write(
+            {"kind": "start", "run_name": run_name, "parent": parent, "experiment": self.experiment, "time": _now_ms()}
+        )
+        return key
+
+    def end_run(self, status="FINISHED"):
+        if not self._runs:
+            return
+        self._write({"kind": "end", "status": status, "time": _now_ms()})
+        with self._lock:
+            _, f = self._runs.pop()
+            f.close()
+        self._wake()
+
+    def log_params(self, params):
+        self._write({"kind": "params", "params": {k: str(v) for k, v in params.items()}})
+
+    def log_metrics(self, metrics, step=0):
+        self._write({"kind": "metrics", "metrics": {k: float(v) for k, v in metrics.items()}, "time": _now_ms(),
+                     "step": step})
+
+    def log_model(self, model_path, artifact_path="model"):
+        """Log a joblib model file; it is copied to the spool, as it may be overwritten before the replay."""
+        if not self._runs:
+            self._begin()
+        key = self.active_run()
+        os.makedirs(os.path.join(self.spool_dir, key), exist_ok=True)
+        relative_path = os.path.join(key, f"{artifact_path}.pkl")
+        shutil.copyfile(model_path, os.path.join(self.spool_dir, relative_path))
+        self._write({"kind": "model", "path": relative_path, "artifact_path": artifact_path})
+
+    def _write(self, record):
+        # Like MLflow, logging outside a run starts one; it ends with the process
+        if not self._runs:
+            self._begin()
+        with self._lock:
+            f = self._runs[-1][1]
+            f.write(json.dumps(record) + "\n")
+            f.flush()
+        self._wake(start_only=True)
+
+    def _wake(self, start_only=False):
+        if self.tracking_uri is None:
+            return
+        if self._flusher is None:
+            self._flusher = threading.Thread(target=self._flush_loop, name="tracking-flusher", daemon=True)
+            self._flusher.start()
+        if not start_only:
+            with self._cond:
+                self._requested += 1
+                self._cond.notify_all()
+
+    def flush(self, timeout=None):
+        """Ask the flusher to replay now; returns False if the runs weren't sent within timeout."""
+        if self.tracking_uri is None:
+            return False
+        self._wake()
+        with self._cond:
+            target = self._requested
+            return self._cond.wait_for(lambda: self._completed >= target, timeout)
+
+    def _flush_loop(self):
+        while True:
+            with self._cond:
+                self._cond.wait_for(lambda: self._requested > self._completed, self.flush_interval)
+                target = self._requested
+            try:
+                replay(self.tracking_uri, self.spool_dir)
+            except Exception as e:
+                # The server is slow or down: keep the spool and retry after an interval. The
+                # flush isn't complete, so flush() times out and close() warns about the runs left
+                logger.warning(f"Tracking server {self.tracking_uri} unavailable, runs stay spooled: {e}")
+                time.sleep(self.flush_interval)
+                continue
+            with self._cond:
+                self._completed = max(self._completed, target)
+                self._cond.notify_all()
+
+    def end_all(self):
+        """End the open runs (nested ones first); they stay spooled until the next flush."""
+        while self._runs:
+            self.end_run()
+
+    def close(self, timeout=None):
+        """End the open runs and give the flusher up to timeout seconds to send them."""
+        self.end_all()
+        if self.tracking_uri is not None and not self.flush(timeout):
+            logger.warning(f"Tracking runs left in {self.spool_dir}; send them later with --replay-tracking")
+
+
+# Process-wide tracker: MLFLOW_TRACKING_URI enables background syncing, otherwise runs stay spooled
+TRACKER = Tracker(
+    os.environ.get("MLFLOW_TRACKING_URI"), flush_interval=float(os.environ.get("TRACKING_FLUSH_SECONDS", 5))
+)
+atexit.register(TRACKER.close, float(os.environ.get("TRACKING_EXIT_TIMEOUT", 5)))
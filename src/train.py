@@ -1,23 +1,25 @@
-from sklearn.ensemble import GradientBoostingClassifier
 import joblib
 import os
 from src.config import DATA_PATHS  # Assuming paths are imported from main.py
+from src.backends import DEFAULT_BACKEND, make_model
+from src.save import compiled_path, export_compiled
+from src.store import load_frame
 
 
-def train_model(X_train_scaled_smote, y_train_smote):
-    # Define the model parameters
-    best_params = {
-        "max_depth": 10,
-        "max_features": None,
-        "max_leaf_nodes": 7,
-        "min_samples_leaf": 5,
-    }
+def load_sample_weight():
+    # Only present when --prepare ran with --resample class-weight
+    try:
+        return load_frame(DATA_PATHS["w_train"])
+    except FileNotFoundError:
+        return None
+
 
-    # Initialize the model
-    gbm = GradientBoostingClassifier(**best_params)
+def train_model(X_train_scaled_smote, y_train_smote, params=None, backend=DEFAULT_BACKEND, sample_weight=None):
+    # Initialize the model; without params the gbm backend uses the --tune results
+    gbm = make_model(backend, params)
     try:
         # Fit the model to the training data
-        gbm.fit(X_train_scaled_smote, y_train_smote)
+        gbm.fit(X_train_scaled_smote, y_train_smote, sample_weight=sample_weight)
     except ValueError as e:
         print(f"Error in training the model: {e}")
         return None
@@ -37,5 +39,7 @@ def train_model(X_train_scaled_smote, y_train_smote):
     except Exception as e:
         print(f"Error saving the model: {e}")
         return None
+    # Flattened copy for --predict, which then loads without scikit-learn
+    export_compiled(gbm, compiled_path(model_path))
 
     return gbm
@@ -0,0 +1,197 @@
+import hashlib
+import json
+import logging
+import os
+import random
+from concurrent.futures import ProcessPoolExecutor, as_completed
+import numpy as np
+from sklearn.ensemble import GradientBoostingClassifier
+from sklearn.metrics import f1_score
+from sklearn.model_selection import StratifiedKFold
+from src.store import frame_paths, load_array, read_manifest
+
+logger = logging.getLogger(__name__)
+
+# Search space around the hand-picked parameters in src.train
+PARAM_GRID = {
+    "learning_rate": [0.05, 0.1, 0.2],
+    "max_depth": [3, 5, 10],
+    "max_leaf_nodes": [5, 7, 15, 31],
+    "min_samples_leaf": [1, 5, 20],
+    "subsample": [0.8, 1.0],
+    "max_features": [None, "sqrt"],
+}
+
+# Per-process data of the tuning pool, set once by _init_worker
+_worker = {}
+
+
+def sample_candidates(n_candidates, random_state=42):
+    """Distinct random configurations from PARAM_GRID."""
+    rng = random.Random(random_state)
+    n_total = int(np.prod([len(v) for v in PARAM_GRID.values()]))
+    candidates, seen = [], set()
+    while len(candidates) < min(n_candidates, n_total):
+        params = {name: rng.choice(values) for name, values in PARAM_GRID.items()}
+        key = json.dumps(params, sort_keys=True)
+        if key not in seen:
+            seen.add(key)
+            candidates.append(params)
+    return candidates
+
+
+def halving_rungs(min_estimators, max_estimators, eta):
+    rungs = [min_estimators]
+    while rungs[-1] * eta <= max_estimators:
+        rungs.append(rungs[-1] * eta)
+    return rungs
+
+
+def data_key(X_path, y_path, n_splits, random_state):
+    # The store manifest entry (shape and part list) and every file of the frame, so rows
+    # appended by --update as part files change the key too
+    digest = hashlib.sha256()
+    for path in (X_path, y_path):
+        schema = read_manifest(path).get(os.path.basename(path), {})
+        digest.update(f"{os.path.abspath(path)}:{json.dumps(schema, sort_keys=True)}".encode())
+        for stored in frame_paths(path):
+            stat = os.stat(stored)
+            digest.update(f":{stat.st_mtime_ns}:{stat.st_size}".encode())
+    digest.update(f"{n_splits}:{random_state}".encode())
+    return digest.hexdigest()[:16]
+
+
+def cached_folds(y, n_splits, random_state, path):
+    """Stratified CV split indices, computed once per dataset and reused by every trial and run."""
+    if os.path.exists(path):
+        with np.load(path) as folds:
+            return [(folds[f"train_{i}"], folds[f"val_{i}"]) for i in range(n_splits)]
+    splitter = StratifiedKFold(n_splits=n_splits, shuffle=True, random_state=random_state)
+    folds = list(splitter.split(np.zeros(len(y)), y))
+    arrays = {}
+    for i, (train_idx, val_idx) in enumerate(folds):
+        arrays[f"train_{i}"], arrays[f"val_{i}"] = train_idx, val_idx
+    np.savez(path, **arrays)
+    return folds
+
+
+def _init_worker(X_path, y_path, folds_path, n_splits):
+    # Memory-mapped, so every worker shares the same pages of the training data
+    _worker["X"] = load_array(X_path)
+    _worker["y"] = load_array(y_path)
+    with np.load(folds_path) as folds:
+        _worker["folds"] = [(folds[f"train_{i}"], folds[f"val_{i}"]) for i in range(n_splits)]
+
+
+def _fit_fold(task):
+    params, n_estimators, fold, random_state = task
+    train_idx, val_idx = _worker["folds"][fold]
+    X, y = _worker["X"], _worker["y"]
+    model = GradientBoostingClassifier(n_estimators=n_estimators, random_state=random_state, **params)
+    model.fit(X[train_idx], y[train_idx])
+    return f1_score(y[val_idx], model.predict(X[val_idx]))
+
+
+def read_trials(log_path, key):
+    trials = {}
+    if os.path.exists(log_path):
+        with open(log_path) as f:
+            for line in f:
+                try:
+                    trial = json.loads(line)
+                except ValueError:
+                    # The last line of a sweep killed mid-write
+                    continue
+                if trial["data_key"] == key:
+                    trials[(json.dumps(trial["params"], sort_keys=True), trial["n_estimators"])] = trial
+    return trials
+
+
+def tune_model(
+    X_path,
+    y_path,
+    out_dir,
+    n_candidates=27,
+    n_splits=3,
+    min_estimators=20,
+    max_estimators=180,
+    eta=3,
+    n_workers=None,
+    random_state=42,
+):
+    """Successive-halving CV search over PARAM_GRID using a process pool.
+
+    Every candidate is scored (mean F1 over the folds) with min_estimators
+    trees; the best 1/eta move on to eta times more trees, until
+    max_estimators. Each trial is appended to trials.jsonl in out_dir as
+    soon as its folds finish, and skipped when the search is rerun on the
+    same data, so an interrupted sweep resumes where it stopped. Returns the best parameters, including
+    n_estimators.
+    """
+    os.makedirs(out_dir, exist_ok=True)
+    key = data_key(X_path, y_path, n_splits, random_state)
+    folds_path = os.path.join(out_dir, f"folds-{key}.npz")
+    cached_folds(load_array(y_path), n_splits, random_state, folds_path)
+    log_path = os.path.join(out_dir, "trials.jsonl")
+    trials = read_trials(log_path, key)
+    if os.path.exists(log_path) and os.path.getsize(log_path):
+        # A sweep killed mid-write leaves a partial last line: start the next trial on a line of its own
+        with open(log_path, "rb+") as f:
+            f.seek(-1, os.SEEK_END)
+            if f.read(1) != b"\n":
+                f.write(b"\n")
+
+    candidates = sample_candidates(n_candidates, random_state)
+    rungs = halving_rungs(min_estimators, max_estimators, eta)
+    n_workers = n_workers or os.cpu_count() or 1
+    initargs = (X_path, y_path, folds_path, n_splits)
+    with ProcessPoolExecutor(n_workers, initializer=_init_worker, initargs=initargs) as pool:
+        for rung, n_estimators in enumerate(rungs):
+            pending = [p for p in candidates if (json.dumps(p, sort_keys=True), n_estimators) not in trials]
+            futures = {
+                pool.submit(_fit_fold, (params, n_estimators, fold, random_state)): (i, fold)
+                for i, params in enumerate(pending)
+                for fold in range(n_splits)
+            }
+            scores = [[None] * n_splits for _ in pending]
+            remaining = [n_splits] * len(pending)
+            with open(log_path, "a") as log:
+                # Each trial is logged as soon as its folds finish, so an interruption only loses running trials
+                for future in as_completed(futures):
+                    i, fold = futures[future]
+                    scores[i][fold] = future.result()
+                    remaining[i] -= 1
+                    if remaining[i]:
+                        continue
+                    trial = {
+                        "data_key": key,
+                        "params": pending[i],
+                        "n_estimators": n_estimators,
+                        "rung": rung,
+                        "f1_mean": float(np.mean(scores[i])),
+                        "f1_folds": [float(s) for s in scores[i]],
+                    }
+                    trials[(json.dumps(pending[i], sort_keys=True), n_estimators)] = trial
+                    log.write(json.dumps(trial) + "\n")
+                    log.flush()
+
+            ranked = sorted(
+                candidates, key=lambda p: -trials[(json.dumps(p, sort_keys=True), n_estimators)]["f1_mean"]
+            )
+            logger.info(
+                f"Rung {rung}: {len(candidates)} candidates with {n_estimators} trees, "
+                f"best F1 {trials[(json.dumps(ranked[0], sort_keys=True), n_estimators)]['f1_mean']:.4f}"
+            )
+            if rung < len(rungs) - 1:
+                candidates = ranked[:max(1, len(candidates) // eta)]
+            else:
+                candidates = ranked
+
+    best = candidates[0]
+    best_trial = trials[(json.dumps(best, sort_keys=True), rungs[-1])]
+    return {**best, "n_estimators": rungs[-1]}, best_trial["f1_mean"]
+
+
+def save_best_params(params, path):
+    with open(path, "w") as f:
+        json.dump(params, f, indent=2)
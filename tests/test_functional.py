@@ -1,5 +1,6 @@
 import pytest
 import joblib
+import json
 import sys
 import os
 from unittest.mock import Mock
@@ -15,6 +16,7 @@ from src.save import save_model
 from src.load import load_model
 from src.predict import make_prediction
 from src.config import DATA_PATHS
+from src.store import load_frame, save_frame
 
 # Suppress specific warnings
 pytestmark = pytest.mark.filterwarnings("ignore:X does not have valid feature names")
@@ -31,15 +33,15 @@ def test_prepare_data():
     assert X_train.shape[0] > 0 and X_test.shape[0] > 0
     
     # Save the prepared data for use in other tests
-    joblib.dump(X_train, DATA_PATHS["X_train"])
-    joblib.dump(X_test, DATA_PATHS["X_test"])
-    joblib.dump(y_train, DATA_PATHS["y_train"])
-    joblib.dump(y_test, DATA_PATHS["y_test"])
+    save_frame(X_train, DATA_PATHS["X_train"])
+    save_frame(X_test, DATA_PATHS["X_test"])
+    save_frame(y_train, DATA_PATHS["y_train"])
+    save_frame(y_test, DATA_PATHS["y_test"])
 
 def test_train_model():
     """Test the train_model function."""
-    X_train = joblib.load(DATA_PATHS["X_train"])
-    y_train = joblib.load(DATA_PATHS["y_train"])
+    X_train = load_frame(DATA_PATHS["X_train"])
+    y_train = load_frame(DATA_PATHS["y_train"])
     
     # Train the model
     model = train_model(X_train, y_train)
@@ -51,8 +53,8 @@ def test_train_model():
 def test_evaluate_model():
     """Test the evaluate_model function."""
     model = joblib.load(DATA_PATHS["model"])
-    X_test = joblib.load(DATA_PATHS["X_test"])
-    y_test = joblib.load(DATA_PATHS["y_test"])
+    X_test = load_frame(DATA_PATHS["X_test"])
+    y_test = load_frame(DATA_PATHS["y_test"])
     
     # Evaluate the model
     metrics = evaluate_model(model, X_test, y_test)
@@ -87,3 +89,931 @@ def test_make_prediction():
     
     # Assert that the logger was called
     mock_logger.info.assert_called()
+
+def test_feature_transformer():
+    """Test that the saved transformer reproduces the prepared features from raw rows."""
+    import numpy as np
+    import pandas as pd
+
+    transformer = joblib.load(DATA_PATHS["transformer"])
+    X_test = load_frame(DATA_PATHS["X_test"])
+    raw = pd.read_csv("data/data_churn.csv").loc[X_test.index]
+
+    np.testing.assert_allclose(transformer.transform(raw), X_test.to_numpy(), atol=1e-9)
+
+    # Form-style field names and pre-encoded plans give the same features
+    form = raw.rename(columns=lambda c: c.replace(" ", "_")).rename(columns={"State": "state"})
+    form["International_plan"] = (form["International_plan"] == "Yes").astype(int)
+    np.testing.assert_allclose(transformer.transform(form), X_test.to_numpy(), atol=1e-9)
+
+def test_predict_batch_endpoint():
+    """Test the /predict/batch endpoint against the single-row /predict path."""
+    import app as flask_app
+    from src.registry import ModelRegistry
+
+    flask_app.registry = ModelRegistry(DATA_PATHS["model"], DATA_PATHS["transformer"])
+    assert flask_app.registry.reload()
+    model = joblib.load(DATA_PATHS["model"])
+    client = flask_app.app.test_client()
+    record = {
+        'Account_length': 100, 'International_plan': 1, 'Number_vmail_messages': 25,
+        'Total_day_calls': 150, 'Total_day_charge': 45.5, 'Total_eve_calls': 130,
+        'Total_eve_charge': 35.7, 'Total_night_calls': 120, 'Total_night_charge': 30.2,
+        'Total_intl_calls': 30, 'Total_intl_charge': 10.5, 'Customer_service_calls': 2,
+        'state': 'CA'
+    }
+    records = [record, dict(record, state='NY', Customer_service_calls=6)] * 50
+
+    response = client.post('/predict/batch', json={'records': records})
+    assert response.status_code == 200
+    body = response.get_json()
+    assert len(body['predictions']) == len(records)
+    assert all(0.0 <= p <= 1.0 for p in body['churn_probabilities'])
+
+    features = flask_app.build_features(records[:2], joblib.load(DATA_PATHS["transformer"]))
+    assert list(body['predictions'][:2]) == list(model.predict(features))
+
+    ndjson = '\n'.join(json.dumps(r) for r in records[:3])
+    response = client.post('/predict/batch', data=ndjson, content_type='application/x-ndjson',
+                           headers={'Accept': 'application/x-ndjson'})
+    assert response.status_code == 200
+    assert len(response.get_data(as_text=True).splitlines()) == 3
+
+    response = client.post('/predict/batch', json=[{'state': 'CA'}])
+    assert response.status_code == 400
+
+    response = client.post('/predict/batch', data=ndjson + '\n{"state": ', content_type='application/x-ndjson')
+    assert response.status_code == 400 and 'line 4' in response.get_json()['error']
+
+def test_score_file(tmp_path):
+    """Test chunked file scoring against scoring the whole file at once."""
+    import numpy as np
+    import pandas as pd
+    from src.score import score_file
+
+    model = joblib.load(DATA_PATHS["model"])
+    transformer = joblib.load(DATA_PATHS["transformer"])
+    out_path = tmp_path / "scores.csv"
+
+    n_rows = score_file(model, transformer, "data/data_churn.csv", str(out_path), chunksize=500, id_column="State")
+
+    raw = pd.read_csv("data/data_churn.csv")
+    scores = pd.read_csv(out_path)
+    assert n_rows == len(raw) == len(scores)
+    assert list(scores.columns) == ["State", "Churn_Probability", "Churn_Prediction"]
+    expected = model.predict_proba(transformer.transform(raw))[:, 1]
+    np.testing.assert_allclose(scores["Churn_Probability"], expected)
+
+def test_parallel_scoring(tmp_path):
+    """Test that process-pool scoring matches single-process scoring, in order."""
+    import numpy as np
+    import pandas as pd
+    from src.score import score_file_parallel, score_matrix_parallel
+
+    model = joblib.load(DATA_PATHS["model"])
+    X_test = load_frame(DATA_PATHS["X_test"])
+
+    predictions, probabilities = score_matrix_parallel(DATA_PATHS["model"], X_test.to_numpy(), n_workers=2,
+                                                       shard_rows=100)
+    np.testing.assert_array_equal(probabilities, model.predict_proba(X_test.to_numpy())[:, 1])
+    np.testing.assert_array_equal(predictions, model.predict(X_test.to_numpy()))
+
+    out_path = tmp_path / "scores.csv"
+    n_rows = score_file_parallel(DATA_PATHS["model"], DATA_PATHS["transformer"], "data/data_churn.csv",
+                                 str(out_path), chunksize=400, n_workers=2)
+    transformer = joblib.load(DATA_PATHS["transformer"])
+    raw = pd.read_csv("data/data_churn.csv")
+    assert n_rows == len(raw)
+    np.testing.assert_allclose(pd.read_csv(out_path)["Churn_Probability"],
+                               model.predict_proba(transformer.transform(raw))[:, 1])
+
+def test_flat_ensemble_parity(tmp_path):
+    """Test that the flattened ensemble reproduces sklearn's predict_proba exactly."""
+    import numpy as np
+    from src.compiled import FlatEnsemble, SMALL_BATCH_ROWS
+
+    model = joblib.load(DATA_PATHS["model"])
+    X_test = load_frame(DATA_PATHS["X_test"]).to_numpy()
+    X_wide = np.random.default_rng(0).normal(scale=3.0, size=(500, X_test.shape[1]))
+
+    path = tmp_path / "model.npz"
+    FlatEnsemble.from_gbm(model).save(path)
+    flat = FlatEnsemble.load(path)
+    for X in (X_test, X_wide, X_test[:1]):
+        np.testing.assert_array_equal(flat.predict_proba(X), model.predict_proba(X))
+        np.testing.assert_array_equal(flat.predict(X), model.predict(X))
+
+    # The in-memory version hands large batches to sklearn; both paths agree
+    compiled = FlatEnsemble.from_gbm(model)
+    n = SMALL_BATCH_ROWS
+    np.testing.assert_array_equal(compiled.predict_proba(X_test[:n + 1])[:n], compiled.predict_proba(X_test[:n]))
+
+    # Non-finite input is rejected like sklearn does, on both paths
+    for rows in (1, n + 1):
+        X_nan = X_test[:rows].copy()
+        X_nan[0, 0] = np.nan
+        with pytest.raises(ValueError, match="NaN"):
+            compiled.predict_proba(X_nan)
+    with pytest.raises(ValueError, match="infinity"):
+        flat.predict_proba(np.full_like(X_test[:1], np.inf))
+
+def test_model_registry_reload(tmp_path):
+    """Test that the registry swaps in changed artifacts and can roll back."""
+    import shutil
+    from src.registry import ModelRegistry
+
+    model_path, transformer_path = tmp_path / "model.pkl", tmp_path / "transformer.pkl"
+    shutil.copy(DATA_PATHS["model"], model_path)
+    shutil.copy(DATA_PATHS["transformer"], transformer_path)
+    registry = ModelRegistry(str(model_path), str(transformer_path))
+    swaps = []
+    registry.add_listener(swaps.append)
+
+    assert registry.reload()
+    first = registry.current()
+    assert not registry.reload()  # unchanged on disk
+
+    model = joblib.load(DATA_PATHS["model"])
+    model.set_params(learning_rate=0.2)
+    joblib.dump(model, model_path)
+    assert registry.reload()
+    assert registry.current().version != first.version
+
+    # A broken artifact keeps the current model serving
+    model_path.write_bytes(b"not a pickle")
+    assert not registry.reload()
+    assert registry.last_error and registry.current() is swaps[-1]
+
+    assert registry.rollback()
+    assert registry.current() is first
+    assert len(swaps) == 3
+
+    # With a manifest, a half-written pair keeps serving the current one until the manifest is written
+    from src.features import STATE_CATEGORY_CODES
+    from src.registry import write_manifest
+
+    manifest_path = str(tmp_path / "model.json")
+    joblib.dump(joblib.load(DATA_PATHS["model"]), model_path)
+    registry = ModelRegistry(str(model_path), str(transformer_path), manifest_path=manifest_path)
+    version = write_manifest(manifest_path, str(model_path), str(transformer_path))
+    assert registry.reload() and registry.current().version == version
+    transformer = joblib.load(DATA_PATHS["transformer"])
+    transformer.default_state_category = STATE_CATEGORY_CODES["High"]
+    joblib.dump(transformer, transformer_path)
+    assert not registry.reload() and registry.current().version == version
+    joblib.dump(model, model_path)
+    assert not registry.reload() and registry.current().version == version
+    new_version = write_manifest(manifest_path, str(model_path), str(transformer_path))
+    assert registry.reload() and registry.current().version == new_version != version
+    assert registry.current().transformer.default_state_category == STATE_CATEGORY_CODES["High"]
+    assert not registry.reload()
+
+    # A rollback sticks with the watcher polling, until the manifest changes again
+    import time
+
+    registry.poll_interval = 0.05
+    registry.start_watching()
+    try:
+        assert registry.rollback() and registry.current().version == version
+        time.sleep(0.3)
+        assert registry.current().version == version
+        joblib.dump(joblib.load(DATA_PATHS["model"]), model_path)
+        latest = write_manifest(manifest_path, str(model_path), str(transformer_path))
+        deadline = time.time() + 5
+        while registry.current().version != latest and time.time() < deadline:
+            time.sleep(0.05)
+        assert registry.current().version == latest
+    finally:
+        registry.stop_watching()
+
+def test_micro_batcher():
+    """Test that concurrent submissions are coalesced and answered individually."""
+    from concurrent.futures import ThreadPoolExecutor
+    from src.batching import MicroBatcher
+
+    sizes = []
+
+    def batch_fn(key, items):
+        sizes.append(len(items))
+        if "bad" in items and len(items) > 1:
+            raise ValueError("bad item in batch")
+        if items == ["bad"]:
+            raise ValueError("bad item")
+        return [key * item for item in items]
+
+    batcher = MicroBatcher(batch_fn, max_batch_size=16, max_wait_ms=20).start()
+    with ThreadPoolExecutor(32) as pool:
+        results = list(pool.map(lambda i: batcher(2, i), range(64)))
+    assert results == [2 * i for i in range(64)]
+    assert len(sizes) < 64 and max(sizes) <= 16
+
+    futures = [batcher.submit(3, item) for item in (1, "bad", 2)]
+    assert futures[0].result() == 3 and futures[2].result() == 6
+    with pytest.raises(ValueError):
+        futures[1].result()
+    batcher.stop()
+
+def test_prediction_cache():
+    """Test LRU/TTL behaviour and that cached rows skip the model."""
+    import numpy as np
+    from src.cache import PredictionCache
+
+    now = [0.0]
+    cache = PredictionCache(maxsize=2, ttl=10.0, clock=lambda: now[0])
+    scored_rows = []
+
+    def score_fn(X):
+        scored_rows.append(len(X))
+        return np.zeros(len(X), dtype=int), X[:, 0] / 10.0
+
+    X = np.array([[1.0, 0.0], [2.0, 0.0], [1.0, 0.0]])
+    assert cache.score("v1", X, score_fn) == [(0, 0.1), (0, 0.2), (0, 0.1)]
+    assert scored_rows == [3]
+    assert cache.score("v1", X[:1], score_fn) == [(0, 0.1)] and scored_rows == [3]
+
+    # A new model version misses; the LRU bound evicts the oldest entries
+    cache.score("v2", X[:1], score_fn)
+    assert scored_rows == [3, 1]
+    assert len(cache) == 2 and cache.stats()["evictions"] == 1
+
+    now[0] = 11.0
+    assert cache.get(PredictionCache.key("v2", X[0])) is None
+    assert cache.stats()["expirations"] == 1
+
+    cache.clear()
+    assert len(cache) == 0
+
+    # The app only caches small calls; large batches go straight to the vectorized model
+    import app as flask_app
+    from src.registry import ModelRegistry
+
+    flask_app.registry = ModelRegistry(DATA_PATHS["model"], DATA_PATHS["transformer"])
+    assert flask_app.registry.reload()
+    app_cache = PredictionCache()
+    original = flask_app.cache
+    flask_app.cache = app_cache
+    try:
+        record = {field: 1.0 for field in flask_app.NUMERIC_FIELDS}
+        record['state'] = 'CA'
+        flask_app.score_records(flask_app.registry.current(), [record])
+        flask_app.score_records(flask_app.registry.current(), [record] * (flask_app.PREDICTION_CACHE_MAX_ROWS + 1))
+        assert app_cache.stats()["misses"] == 1 and app_cache.stats()["hits"] == 0
+    finally:
+        flask_app.cache = original
+
+def test_stage_cache(tmp_path):
+    """Test that stages are memoized by content key, resolved lazily and pruned to the newest output."""
+    from src.stage_cache import StageCache
+
+    data = tmp_path / "data.csv"
+    data.write_text("a\n1\n")
+    calls = []
+
+    def read(path):
+        calls.append("read")
+        return open(path).read()
+
+    def count(text, factor):
+        calls.append("count")
+        return len(text) * factor
+
+    def build(factor):
+        stages = StageCache(str(tmp_path / "cache"))
+        text = stages.stage("read", read, stages.source(str(data)))
+        return stages, stages.stage("count", count, text, factor=factor)
+
+    stages, result = build(2)
+    assert result.value == 8 and calls == ["read", "count"]
+
+    # Unchanged input and params: only the final stage is loaded
+    stages, result = build(2)
+    assert result.value == 8 and calls == ["read", "count"]
+    assert stages.hits == ["count"] and stages.misses == []
+
+    # A parameter change reruns only the affected stage
+    stages, result = build(3)
+    assert result.value == 12 and calls == ["read", "count", "count"]
+    assert stages.hits == ["read"]
+    # Only the newest output of a stage stays on disk
+    assert len(list((tmp_path / "cache").glob("count-*.pkl"))) == 1
+
+    # Changed file contents invalidate everything downstream
+    data.write_text("a\n12\n")
+    stages, result = build(3)
+    assert result.value == 15 and calls[-2:] == ["read", "count"]
+
+def test_columnar_store():
+    """Test that processed data round-trips through the memory-mapped .npy store."""
+    import numpy as np
+    import pandas as pd
+    from src.store import load_array, read_manifest
+
+    X_test = load_frame(DATA_PATHS["X_test"])
+    y_test = load_frame(DATA_PATHS["y_test"])
+    raw = pd.read_csv("data/data_churn.csv")
+    assert len(X_test) == len(y_test) and X_test.index.equals(y_test.index)
+    assert X_test.index.isin(raw.index).all()
+
+    schema = read_manifest(DATA_PATHS["X_test"])["X_test.npy"]
+    assert schema["columns"] == list(X_test.columns) and schema["dtype"] == "float64"
+    assert isinstance(load_array(DATA_PATHS["X_test"]), np.memmap)
+    assert np.shares_memory(X_test["Usage Score"].to_numpy(), X_test.to_numpy())
+
+    projected = load_frame(DATA_PATHS["X_test"], columns=["Usage Score", "Account length"])
+    assert list(projected.columns) == ["Usage Score", "Account length"]
+    np.testing.assert_array_equal(projected["Usage Score"], X_test["Usage Score"])
+
+def test_tune_model(tmp_path, monkeypatch):
+    """Test the successive-halving search, its resumable trial log and the params handed to train_model."""
+    from src.tune import tune_model, save_best_params
+    from sklearn.ensemble import GradientBoostingClassifier
+    from src.backends import load_best_params
+
+    X_train = load_frame(DATA_PATHS["X_train"])
+    y_train = load_frame(DATA_PATHS["y_train"])
+    subset = X_train.index[::8]
+    save_frame(X_train.loc[subset], str(tmp_path / "X.npy"))
+    save_frame(y_train.loc[subset], str(tmp_path / "y.npy"))
+
+    def tune():
+        return tune_model(str(tmp_path / "X.npy"), str(tmp_path / "y.npy"), str(tmp_path / "tuning"),
+                          n_candidates=4, n_splits=2, min_estimators=5, max_estimators=10, eta=2, n_workers=2)
+
+    best, best_f1 = tune()
+    log_path = tmp_path / "tuning" / "trials.jsonl"
+    trials = [json.loads(line) for line in log_path.read_text().splitlines()]
+    # 4 candidates at 5 trees, the best 2 at 10 trees
+    assert [t["n_estimators"] for t in trials].count(5) == 4
+    assert [t["n_estimators"] for t in trials].count(10) == 2
+    assert best["n_estimators"] == 10 and 0 <= best_f1 <= 1
+
+    # A rerun resumes from the log without fitting anything
+    assert tune() == (best, best_f1)
+    assert len(log_path.read_text().splitlines()) == len(trials)
+
+    # Interrupted in the middle of the first rung (and of a line): only the missing trials run again
+    lines = log_path.read_text().splitlines()
+    first_rung = [line for line in lines if json.loads(line)["n_estimators"] == 5]
+    log_path.write_text("\n".join(first_rung[:2]) + "\n" + first_rung[2][:20])
+    assert tune() == (best, best_f1)
+    rerun = [json.loads(line) for line in log_path.read_text().splitlines()[3:]]
+    assert len(rerun) == 4 and [t["n_estimators"] for t in rerun].count(5) == 2
+
+    save_best_params(best, str(tmp_path / "best_params.json"))
+    params = load_best_params(str(tmp_path / "best_params.json"))
+    assert params == best
+    monkeypatch.setitem(DATA_PATHS, "best_params", str(tmp_path / "best_params.json"))
+    assert load_best_params() == best
+
+    # Rows appended as part files are new data: new folds and trials
+    from src.store import append_frame
+    from src.tune import data_key
+
+    key = data_key(str(tmp_path / "X.npy"), str(tmp_path / "y.npy"), 2, 42)
+    append_frame(X_train.loc[subset[:10]], str(tmp_path / "X.npy"))
+    append_frame(y_train.loc[subset[:10]], str(tmp_path / "y.npy"))
+    assert data_key(str(tmp_path / "X.npy"), str(tmp_path / "y.npy"), 2, 42) != key
+    # Valid GradientBoostingClassifier arguments (train_model itself would overwrite the shared model)
+    assert GradientBoostingClassifier(**params).get_params()["n_estimators"] == 10
+
+def test_model_backends():
+    """Test that every backend trains and is reported by the benchmark harness."""
+    from sklearn.ensemble import HistGradientBoostingClassifier
+    from src.backends import BACKENDS, benchmark_backends, make_model
+
+    X_train = load_frame(DATA_PATHS["X_train"])
+    y_train = load_frame(DATA_PATHS["y_train"])
+    X_test = load_frame(DATA_PATHS["X_test"])
+    y_test = load_frame(DATA_PATHS["y_test"])
+
+    assert isinstance(make_model("hist"), HistGradientBoostingClassifier)
+    with pytest.raises(ValueError):
+        make_model("xgboost")
+
+    results = benchmark_backends(X_train, y_train, X_test, y_test, latency_rows=20)
+    assert set(results) == set(BACKENDS)
+    for backend, result in results.items():
+        assert result["fit_seconds"] > 0 and result["predict_row_p99_ms"] >= result["predict_row_p50_ms"]
+        assert result["f1_score"] > 0.5, backend
+    # Early stopping ends well before the iteration budget
+    assert results["hist"]["n_iter"] < 500
+
+def test_incremental_update(tmp_path, monkeypatch):
+    """Test warm-start growth on a delta and the full refit when a feature drifts."""
+    import shutil
+    import time
+    import pandas as pd
+    from src.incremental import update_model, write_state
+
+    processed = tmp_path / "processed"
+    processed.mkdir()
+    for name in ("X_train", "X_test", "y_train", "y_test", "manifest", "transformer", "model"):
+        target = processed / os.path.basename(DATA_PATHS[name])
+        shutil.copyfile(DATA_PATHS[name], target)
+        monkeypatch.setitem(DATA_PATHS, name, str(target))
+    for name in ("scaler", "prepare_key", "stage_cache", "deltas", "train_state", "best_params"):
+        monkeypatch.setitem(DATA_PATHS, name, str(processed / name))
+    now = time.time()
+    write_state({"last_full_refit": now, "increments": 0, "delta_rows": 0})
+    with open(DATA_PATHS["prepare_key"], "w") as f:
+        f.write("key of the prepared store")
+
+    n_history = len(load_frame(DATA_PATHS["X_train"]))
+    n_stages = joblib.load(DATA_PATHS["model"]).n_estimators_
+    raw = pd.read_csv("data/data_churn.csv")
+    raw.sample(300, random_state=1).to_csv(tmp_path / "delta.csv", index=False)
+
+    summary = update_model(str(tmp_path / "delta.csv"), extra_estimators=10, now=now + 3600)
+    assert summary["mode"] == "incremental" and summary["rows"] == 300
+    assert joblib.load(DATA_PATHS["model"]).n_estimators_ == n_stages + 10
+    X_train, y_train = load_frame(DATA_PATHS["X_train"]), load_frame(DATA_PATHS["y_train"])
+    assert len(X_train) == len(y_train) >= n_history + 300
+    assert (processed / "X_train.part00001.npy").exists()
+    # The appended store isn't prepare_data's output any more
+    assert not os.path.exists(DATA_PATHS["prepare_key"])
+
+    drifted = raw.sample(300, random_state=2)
+    drifted["Total day charge"] *= 3
+    drifted.to_csv(tmp_path / "drifted.csv", index=False)
+    summary = update_model(str(tmp_path / "drifted.csv"), now=now + 7200)
+    assert summary["mode"] == "full" and "Total day charge" in summary["reason"]
+    # The refit replays both archived deltas and compacts the store
+    assert len(os.listdir(DATA_PATHS["deltas"])) == 2
+    assert not (processed / "X_train.part00001.npy").exists()
+    assert joblib.load(DATA_PATHS["model"]).n_estimators_ == 100
+
+    # The stored training set has no class weights: a class-weight delta is refused, None keeps SMOTE
+    monkeypatch.setitem(DATA_PATHS, "w_train", str(processed / "w_train.npy"))
+    with pytest.raises(ValueError, match="without class weights"):
+        update_model(str(tmp_path / "delta.csv"), resample_strategy="class-weight", now=now + 7300)
+    assert update_model(str(tmp_path / "delta.csv"), now=now + 7400)["mode"] == "incremental"
+
+    # HistGradientBoosting grows through max_iter
+    from src.backends import make_model
+
+    X_train, y_train = load_frame(DATA_PATHS["X_train"]), load_frame(DATA_PATHS["y_train"])
+    hist = make_model("hist", {"max_iter": 15, "early_stopping": False, "random_state": 42}).fit(X_train, y_train)
+    joblib.dump(hist, DATA_PATHS["model"])
+    summary = update_model(str(tmp_path / "delta.csv"), extra_estimators=5, now=now + 7500)
+    assert summary["mode"] == "incremental" and summary["n_estimators"] == 20
+    grown = joblib.load(DATA_PATHS["model"])
+    assert grown.n_iter_ == 20 and not grown.warm_start
+
+def test_resampling_strategies(tmp_path, monkeypatch):
+    """Test the SMOTE, chunked on-disk SMOTE and class-weight resampling strategies."""
+    import numpy as np
+    from src.resample import resample
+    from src.train import load_sample_weight
+
+    X = load_frame(DATA_PATHS["X_test"], mmap_mode=None)
+    y = load_frame(DATA_PATHS["y_test"], mmap_mode=None)
+    n_major = np.bincount(y).max()
+
+    X_smote, y_smote, weights, report = resample(X, y, "smote")
+    assert weights is None and np.bincount(y_smote).tolist() == [n_major, n_major]
+    assert report["rows_out"] == len(X_smote) and report["peak_mb"] is None
+    # Peak memory only when traced
+    assert resample(X, y, "smote", trace_memory=True)[3]["peak_mb"] > 0
+
+    out_path = str(tmp_path / "resampled.npy")
+    X_chunked, y_chunked, _, report = resample(X, y, "smote-chunked", out_path=out_path)
+    assert np.bincount(y_chunked).tolist() == [n_major, n_major] and report["disk_mb"] > 0
+    np.testing.assert_array_equal(np.load(out_path), X_chunked.values)
+    np.testing.assert_array_equal(X_chunked.values[: len(X)], X.values)
+    # Synthetic rows lie between minority samples
+    synthetic = X_chunked.values[len(X):]
+    minority = X.values[y.values == 1]
+    assert (synthetic >= minority.min(axis=0) - 1e-9).all() and (synthetic <= minority.max(axis=0) + 1e-9).all()
+
+    X_weighted, y_weighted, weights, _ = resample(X, y, "class-weight")
+    assert len(X_weighted) == len(X) and weights.index.equals(y.index)
+    assert np.isclose(weights[y == 0].sum(), weights[y == 1].sum())
+
+    # --prepare --resample class-weight stores the weights and training uses them
+    for name in ("X_train", "X_test", "y_train", "y_test", "w_train", "model", "scaler", "transformer", "prepare_key"):
+        monkeypatch.setitem(DATA_PATHS, name, str(tmp_path / os.path.basename(DATA_PATHS[name])))
+    X_train, _, y_train, _ = prepare_data(resample_strategy="class-weight")
+    sample_weight = load_sample_weight()
+    assert len(sample_weight) == len(X_train) == len(y_train)
+    assert train_model(X_train, y_train, sample_weight=sample_weight) is not None
+    prepare_data()
+    assert load_sample_weight() is None
+
+def test_benchmark_suite(tmp_path):
+    """Test the synthetic data generator and the benchmark regression check."""
+    import pandas as pd
+    from benchmarks.synth import generate_churn_data
+    from benchmarks.run import compare_results
+
+    reference = pd.read_csv("data/data_churn.csv")
+    path = generate_churn_data(5000, str(tmp_path / "bench.csv"), chunk_rows=2000)
+    synthetic = pd.read_csv(path)
+    assert len(synthetic) == 5000 and synthetic.dtypes.equals(reference.dtypes)
+    assert abs(synthetic["Churn"].mean() - reference["Churn"].mean()) < 0.03
+    assert (synthetic["Total day charge"] == (synthetic["Total day minutes"] * 0.17).round(2)).all()
+    assert (synthetic.loc[synthetic["Voice mail plan"] == "No", "Number vmail messages"] == 0).all()
+
+    baseline = {"stages": {"train": {"seconds": 10.0, "rows_per_s": 1000.0, "f1_score": 0.8},
+                           "score_single": {"p99_ms": 2.0}}}
+    current = {"stages": {"train": {"seconds": 11.0, "rows_per_s": 500.0, "f1_score": 0.1},
+                          "score_single": {"p99_ms": 1.0}}}
+    changes, regressions = compare_results(baseline, current, threshold=0.25)
+    assert {(stage, metric) for stage, metric, *_ in changes} == {
+        ("train", "seconds"), ("train", "rows_per_s"), ("score_single", "p99_ms")
+    }
+    assert [(stage, metric) for stage, metric, *_ in regressions] == [("train", "rows_per_s")]
+
+def test_metrics(capsys, tmp_path, monkeypatch):
+    """Test the metrics registry, its no-op mode, the merge across workers and the /metrics endpoint."""
+    import app as flask_app
+    from src.metrics import MetricsRegistry, merge_saved
+    from src.registry import ModelRegistry
+    from src.main import report_metrics
+
+    metrics = MetricsRegistry()
+    latency = metrics.histogram("latency_seconds", "Latency", buckets=(0.1, 1.0))
+    for value in (0.05, 0.5, 5.0):
+        latency.observe(value, stage="a")
+    metrics.counter("rows_total", "Rows").inc(3)
+    text = metrics.render_prometheus()
+    assert 'latency_seconds_bucket{stage="a",le="0.1"} 1' in text
+    assert 'latency_seconds_bucket{stage="a",le="1.0"} 2' in text
+    assert 'latency_seconds_bucket{stage="a",le="+Inf"} 3' in text
+    assert 'latency_seconds_count{stage="a"} 3' in text and "rows_total 3" in text
+    assert metrics.summary()["latency_seconds"]['{stage="a"}']["max"] == 5.0
+
+    disabled = MetricsRegistry(enabled=False)
+    with disabled.histogram("t").time(stage="x"):
+        disabled.counter("c").inc()
+    assert disabled.summary() == {} and disabled.render_prometheus() == "\n"
+
+    # Counters and histograms saved by other workers add up; gauges stay those of this process
+    worker = MetricsRegistry()
+    worker.histogram("latency_seconds", "Latency", buckets=(0.1, 1.0)).observe(0.05, stage="a")
+    worker.counter("rows_total", "Rows").inc(2)
+    worker.gauge("cache_size", "Size").set(7)
+    metrics.gauge("cache_size", "Size").set(1)
+    worker.save(str(tmp_path / "metrics-1.json"))
+    metrics.save(str(tmp_path / "metrics-2.json"))
+    text = merge_saved(metrics, str(tmp_path), exclude=str(tmp_path / "metrics-2.json")).render_prometheus()
+    assert 'latency_seconds_bucket{stage="a",le="0.1"} 2' in text and "rows_total 5" in text
+    assert "cache_size 1" in text
+    monkeypatch.setattr(flask_app, "METRICS_DIR", str(tmp_path / "served"))
+
+    flask_app.registry = ModelRegistry(DATA_PATHS["model"], DATA_PATHS["transformer"])
+    assert flask_app.registry.reload()
+    client = flask_app.app.test_client()
+    record = {
+        'Account_length': 100, 'International_plan': 1, 'Number_vmail_messages': 25,
+        'Total_day_calls': 150, 'Total_day_charge': 45.5, 'Total_eve_calls': 130,
+        'Total_eve_charge': 35.7, 'Total_night_calls': 120, 'Total_night_charge': 30.2,
+        'Total_intl_calls': 30, 'Total_intl_charge': 10.5, 'Customer_service_calls': 2,
+        'state': 'CA'
+    }
+    assert client.post('/predict', data=record).status_code == 200
+    assert client.post('/predict/batch', json=[record] * 5).status_code == 200
+    body = client.get('/metrics').get_data(as_text=True)
+    for stage in ('parse', 'features', 'render', 'serialize'):
+        assert f'churn_stage_seconds_count{{stage="{stage}"}}' in body
+    assert 'churn_requests_total{endpoint="predict_batch",status="200"}' in body
+    assert 'churn_request_seconds_bucket{endpoint="predict",le="+Inf"}' in body
+
+    report_metrics()
+    assert '"churn_stage_seconds"' in capsys.readouterr().out
+
+def test_async_api_predict():
+    """Test the async JSON API, directly and through the micro-batcher."""
+    import app as flask_app
+    from src.batching import MicroBatcher
+    from src.registry import ModelRegistry
+
+    flask_app.registry = ModelRegistry(DATA_PATHS["model"], DATA_PATHS["transformer"])
+    assert flask_app.registry.reload()
+    model = joblib.load(DATA_PATHS["model"])
+    client = flask_app.app.test_client()
+    record = {
+        'Account_length': 100, 'International_plan': 1, 'Number_vmail_messages': 25,
+        'Total_day_calls': 150, 'Total_day_charge': 45.5, 'Total_eve_calls': 130,
+        'Total_eve_charge': 35.7, 'Total_night_calls': 120, 'Total_night_charge': 30.2,
+        'Total_intl_calls': 30, 'Total_intl_charge': 10.5, 'Customer_service_calls': 2,
+        'state': 'CA'
+    }
+    records = [record, dict(record, state='NY', Customer_service_calls=6)]
+    expected = model.predict(flask_app.build_features(records, joblib.load(DATA_PATHS["transformer"])))
+
+    single = client.post('/api/v1/predict', json=record).get_json()
+    assert single['prediction'] == expected[0] and 0.0 <= single['churn_probability'] <= 1.0
+    listed = client.post('/api/v1/predict', json=records).get_json()
+    assert [r['prediction'] for r in listed] == list(expected)
+    assert client.post('/api/v1/predict', json=[]).status_code == 400
+    assert client.post('/api/v1/predict', json={'state': 'CA'}).status_code == 400
+    nan_record = dict(record, Total_day_charge=float('nan'))
+    assert client.post('/api/v1/predict', json=nan_record).status_code == 400
+    assert client.post('/api/v1/predict', json=[nan_record] * 100).status_code == 400
+
+    original = flask_app.batcher
+    flask_app.batcher = MicroBatcher(flask_app.score_records, max_batch_size=8, max_wait_ms=5)
+    try:
+        batched = client.post('/api/v1/predict', json=record).get_json()
+        assert batched == listed[0]
+        assert flask_app.batcher.stats()['items'] == 1
+        # A list is scored as one matrix, not record by record through the batcher
+        assert client.post('/api/v1/predict', json=records).get_json() == listed
+        assert flask_app.batcher.stats()['items'] == 1
+    finally:
+        flask_app.batcher.stop()
+        flask_app.batcher = original
+
+
+def test_lazy_startup(tmp_path):
+    """Test that the CLI and prediction path start without the training stack."""
+    import subprocess
+    import numpy as np
+    from src.compiled import FlatEnsemble
+    from src.load import load_trained_model
+    from src.save import compiled_path, export_compiled
+
+    heavy = ("sklearn", "mlflow", "imblearn", "pandas")
+    check = f"import sys, src.main; print([m for m in {heavy!r} if m in sys.modules])"
+    assert subprocess.run([sys.executable, "-c", check], capture_output=True, text=True).stdout.strip() == "[]"
+    check = (f"import sys, joblib; joblib.load({DATA_PATHS['transformer']!r}); "
+             "print('sklearn' in sys.modules)")
+    assert subprocess.run([sys.executable, "-c", check], capture_output=True, text=True).stdout.strip() == "False"
+
+    # The flattened export is used while it is at least as new as the model
+    model = joblib.load(DATA_PATHS["model"])
+    model_path = str(tmp_path / "model.pkl")
+    joblib.dump(model, model_path)
+    assert export_compiled(model, compiled_path(model_path))
+    loaded = load_trained_model(model_path)
+    assert isinstance(loaded, FlatEnsemble)
+    X_test = load_frame(DATA_PATHS["X_test"]).to_numpy()[:20]
+    assert np.array_equal(loaded.predict_proba(X_test), model.predict_proba(X_test))
+    os.utime(model_path, ns=(os.stat(model_path).st_mtime_ns + 10**9,) * 2)
+    assert not isinstance(load_trained_model(model_path), FlatEnsemble)
+
+
+def test_evaluation_engine():
+    """Test the vectorized metrics, threshold sweep and bootstrap intervals against sklearn."""
+    import numpy as np
+    from sklearn.metrics import average_precision_score, f1_score, precision_recall_curve, roc_auc_score
+    from src.evaluate import bootstrap_intervals, threshold_sweep
+
+    model = joblib.load(DATA_PATHS["model"])
+    X_test = load_frame(DATA_PATHS["X_test"])
+    y_test = load_frame(DATA_PATHS["y_test"])
+    metrics = evaluate_model(model, X_test, y_test)
+    scores = model.predict_proba(X_test)[:, 1]
+
+    assert metrics["f1_score"] == pytest.approx(f1_score(y_test, model.predict(X_test)))
+    assert metrics["roc_auc"] == pytest.approx(roc_auc_score(y_test, scores))
+    assert metrics["average_precision"] == pytest.approx(average_precision_score(y_test, scores))
+    for name in ("accuracy", "precision", "recall", "f1_score"):
+        assert metrics[f"{name}_ci_low"] <= metrics[name] <= metrics[f"{name}_ci_high"]
+
+    precision, recall, thresholds = precision_recall_curve(y_test, scores)
+    f1 = 2 * precision * recall / np.maximum(precision + recall, 1e-12)
+    assert metrics["best_threshold_f1"] == pytest.approx(f1[:-1].max())
+    assert metrics["best_threshold_f1"] >= metrics["f1_score"]
+
+    # Ties share one threshold; counts are cumulative from the highest score
+    sweep_thresholds, tp, fp = threshold_sweep(np.array([1, 0, 1, 0]), np.array([0.9, 0.5, 0.5, 0.1]))
+    assert list(sweep_thresholds) == [0.9, 0.5, 0.1] and list(tp) == [1, 2, 2] and list(fp) == [0, 1, 2]
+    assert bootstrap_intervals(5, 0, 0, 5)["precision"] == (1.0, 1.0)
+
+
+def test_tracking_spool_and_replay(tmp_path, monkeypatch):
+    """Test that runs are spooled offline and replayed to MLflow in batches, nested runs included."""
+    from mlflow.tracking import MlflowClient
+    from src.tracking import EXPERIMENT, Tracker, pending_runs, replay
+
+    spool = str(tmp_path / "spool")
+    tracker = Tracker(spool_dir=spool)
+    with tracker.start_run(run_name="parent"):
+        tracker.log_params({"backend": "gbm", "data_version": "v1"})
+        with tracker.start_run(run_name="child", nested=True):
+            tracker.log_metrics({"f1_score": 0.8, "recall": 0.7})
+        tracker.log_model(DATA_PATHS["model"])
+    assert not tracker.flush(timeout=1)  # offline: nothing to send to
+    assert len(pending_runs(spool)) == 2
+
+    # A database store (MLflow 3 refuses new file stores); artifacts go to ./mlruns under the cwd
+    monkeypatch.chdir(tmp_path)
+    tracking_uri = f"sqlite:///{tmp_path / 'mlflow.db'}"
+    assert replay(tracking_uri, spool) == 7  # start, params, model, end + start, metrics, end
+    assert pending_runs(spool) == [] and replay(tracking_uri, spool) == 0
+
+    client = MlflowClient(tracking_uri)
+    runs = {r.info.run_name: r for r in client.search_runs([client.get_experiment_by_name(EXPERIMENT).experiment_id])}
+    assert runs["parent"].data.params == {"backend": "gbm", "data_version": "v1"}
+    assert runs["child"].data.metrics == {"f1_score": 0.8, "recall": 0.7}
+    assert runs["child"].data.tags["mlflow.parentRunId"] == runs["parent"].info.run_id
+    assert runs["parent"].info.status == "FINISHED"
+    assert "model/MLmodel" in [a.path for a in client.list_artifacts(runs["parent"].info.run_id, "model")]
+
+    # With a tracking URI the background flusher sends the runs
+    tracker = Tracker(tracking_uri, spool_dir=spool, flush_interval=60)
+    with tracker.start_run(run_name="synced"):
+        tracker.log_metrics({"accuracy": 0.9})
+    assert tracker.flush(timeout=60) and pending_runs(spool) == []
+
+    # A failed replay doesn't complete the flush: the runs stay spooled and flush() reports it
+    import src.tracking
+
+    def unavailable(*args):
+        raise ConnectionError("tracking server down")
+
+    monkeypatch.setattr(src.tracking, "replay", unavailable)
+    tracker = Tracker(tracking_uri, spool_dir=spool, flush_interval=60)
+    with tracker.start_run(run_name="offline"):
+        tracker.log_metrics({"accuracy": 0.9})
+    assert not tracker.flush(timeout=2) and len(pending_runs(spool)) == 1
+
+    # --replay-tracking reports the outage instead of waiting on the flusher
+    import argparse
+    from src.main import step_replay_tracking
+
+    assert step_replay_tracking(argparse.Namespace(replay_tracking=tracking_uri), None) is False
+
+    # Concurrent replays send a run once: the second waits for the run lock, then finds it sent
+    import threading
+    import time
+    from src.tracking import _run_lock
+
+    monkeypatch.setattr(src.tracking, "replay", replay)
+    sent = []
+    with _run_lock(pending_runs(spool)[0]):
+        replayers = [threading.Thread(target=lambda: sent.append(replay(tracking_uri, spool))) for _ in range(2)]
+        for t in replayers:
+            t.start()
+        time.sleep(0.5)
+        assert sent == []  # both wait for the lock
+    for t in replayers:
+        t.join(60)
+    assert sorted(sent) == [0, 3] and pending_runs(spool) == []
+    experiment_id = client.get_experiment_by_name(EXPERIMENT).experiment_id
+    assert len(client.search_runs([experiment_id], "attributes.run_name = 'offline'")) == 1
+
+
+def test_compact_schema(tmp_path):
+    """Test the compact dtypes, their range check and the categorical-safe feature encoding."""
+    import numpy as np
+    import pandas as pd
+    from src.schema import apply_schema, concat_frames, read_churn_csv
+
+    raw = pd.read_csv("data/data_churn.csv")
+    df = read_churn_csv("data/data_churn.csv", chunk_rows=1000)
+    assert df["State"].dtype == "category" and df["Churn"].dtype == bool
+    assert df["Total day calls"].dtype == np.int16 and df["Total day minutes"].dtype == np.float32
+    assert df.memory_usage(deep=True).sum() * 2 < raw.memory_usage(deep=True).sum()
+    assert (df["Churn"].to_numpy() == raw["Churn"].astype(str).eq("True").to_numpy()).all()
+
+    with pytest.raises(ValueError, match="int16"):
+        apply_schema(pd.DataFrame({"Total day calls": [1, 40000]}))
+
+    # Chunks with different states keep a categorical column over the union
+    merged = concat_frames([apply_schema(raw.iloc[:2].copy()), apply_schema(raw.iloc[-2:].copy())])
+    assert merged["State"].dtype == "category" and merged["State"].notna().all()
+
+    # Categorical and plain string inputs engineer to the same features
+    transformer = joblib.load(DATA_PATHS["transformer"])
+    compact = transformer.engineer(df.head(50))
+    plain = transformer.engineer(raw.head(50))
+    np.testing.assert_array_equal(compact.to_numpy(dtype=np.float64), plain.to_numpy(dtype=np.float64))
+
+    # Per-stage time always, peak memory when traced
+    import tracemalloc
+    from src.stage_cache import StageCache
+
+    stages = StageCache(str(tmp_path / "cache"), enabled=False, trace_memory=True)
+    tracemalloc.start()
+    try:
+        stages.stage("ones", np.ones, shape=1_000_000).value
+    finally:
+        tracemalloc.stop()
+    assert stages.stats["ones"]["seconds"] >= 0 and stages.stats["ones"]["peak_mb"] >= 7.5
+
+
+def test_out_of_core_prepare(tmp_path, monkeypatch):
+    """Test that the partitioned prepare merges to the same statistics as the in-memory fit."""
+    import numpy as np
+    import pandas as pd
+    from src.drift import DriftReference
+    from src.features import FEATURE_COLUMNS, FeatureTransformer
+    from src.ooc import Moments, QuantileSketch, prepare_partitions
+    from src.train import load_sample_weight
+
+    df = pd.read_csv("data/data_churn.csv")
+    for i, part in enumerate(np.array_split(np.arange(len(df)), 4)):
+        df.iloc[part].to_csv(tmp_path / f"part{i}.csv", index=False)
+    names = ("X_train", "X_test", "y_train", "y_test", "w_train", "scaler", "transformer", "prepare_key", "stage_cache")
+    for name in names:
+        monkeypatch.setitem(DATA_PATHS, name, str(tmp_path / "processed" / os.path.basename(DATA_PATHS[name])))
+    os.makedirs(tmp_path / "processed")
+
+    transformer, n_rows = prepare_partitions([str(tmp_path / "part*.csv")], n_workers=2)
+    reference = FeatureTransformer().fit(df)
+    assert n_rows == len(df)
+    assert transformer.clip_bounds == reference.clip_bounds
+    assert transformer.state_categories == reference.state_categories
+    assert transformer.plan_mapping == reference.plan_mapping
+    np.testing.assert_allclose(transformer.usage_weights, reference.usage_weights, atol=1e-12)
+
+    X_train, X_test = load_frame(DATA_PATHS["X_train"]), load_frame(DATA_PATHS["X_test"])
+    y_train = load_frame(DATA_PATHS["y_train"])
+    assert len(X_train) + len(X_test) == len(df) and not X_train.index.intersection(X_test.index).size
+    np.testing.assert_allclose(X_train.mean(), 0, atol=1e-9)
+    np.testing.assert_allclose(X_train.std(ddof=0), 1, atol=1e-9)
+    weights = load_sample_weight()
+    assert np.isclose(weights[y_train.values == 0].sum(), weights[y_train.values == 1].sum())
+    assert joblib.load(DATA_PATHS["transformer"]).scaler is not None
+    # Under SAMPLE_ROWS training rows the per-partition drift bins are those of the whole matrix
+    drift = DriftReference.from_features(X_train.to_numpy(), FEATURE_COLUMNS)
+    np.testing.assert_allclose(transformer.drift_reference.edges, drift.edges)
+    np.testing.assert_array_equal(transformer.drift_reference.counts, drift.counts)
+
+    # Merged summaries equal those of the whole column
+    values = np.random.default_rng(0).normal(size=10_000)
+    rounded = values.round(2)  # fewer distinct values than bins: exact
+    halves = QuantileSketch().update(rounded[:5000]).merge(QuantileSketch().update(rounded[5000:]))
+    assert halves.quantile(0.25) == pytest.approx(np.quantile(rounded, 0.25))
+    compact = QuantileSketch(max_bins=256).update(values)
+    assert abs((values < compact.quantile(0.5)).mean() - 0.5) < 0.01
+    moments = Moments(2).update(np.c_[values[:10], values[10:20]]).merge(Moments(2).update(np.c_[values[20:30],
+                                                                                                   values[30:40]]))
+    whole = np.c_[values[np.r_[0:10, 20:30]], values[np.r_[10:20, 30:40]]]
+    np.testing.assert_allclose(moments.var, whole.var(axis=0))
+    assert moments.corr(1)[0] == pytest.approx(np.corrcoef(whole.T)[0, 1])
+
+
+def test_state_index():
+    """Test the vectorized state code index against the fitted state categories."""
+    import numpy as np
+    import pandas as pd
+    from src.features import StateIndex
+
+    transformer = joblib.load(DATA_PATHS["transformer"])
+    states = pd.Series(list(transformer.state_categories) + ["ZZ", "ca", "CAL", None], dtype=object)
+    expected = states.map(transformer.state_categories).fillna(transformer.default_state_category).astype(np.int64)
+    np.testing.assert_array_equal(transformer.encode_states(states), expected)
+    np.testing.assert_array_equal(transformer.encode_states(list(states)), expected)
+    np.testing.assert_array_equal(transformer.encode_states(states.astype("category")), expected)
+    assert list(transformer.encode_states(pd.Series(["ZZ", "CAL"]), unknown_state="High")) == [2, 2]
+
+    with pytest.raises(ValueError, match="two capital letters"):
+        StateIndex({"California": 0}, 1)
+
+
+def test_drift_monitor(tmp_path, monkeypatch):
+    """Test the drift reference, the windowed monitor, saved-state merging and the /drift endpoint."""
+    import time
+    import numpy as np
+    import app as flask_app
+    from src.drift import DriftMonitor, compare, merge_saved
+    from src.registry import ModelRegistry
+
+    transformer = joblib.load(DATA_PATHS["transformer"])
+    reference = transformer.drift_reference
+    assert reference is not None and reference.columns == list(load_frame(DATA_PATHS["X_test"]).columns)
+    X_test = load_frame(DATA_PATHS["X_test"]).to_numpy()
+    np.testing.assert_array_equal(reference.bin_counts(X_test[:100]).sum(axis=1), 100)
+
+    # Held-out rows look like the training rows; shifted ones don't
+    monitor = DriftMonitor(reference)
+    for row in X_test:
+        monitor.update(row[None, :])
+    report = monitor.report()
+    assert report["rows"] == len(X_test) and report["status"] in ("stable", "moderate")
+    shifted = compare(reference, reference.bin_counts(X_test + np.r_[3.0, np.zeros(13)]))
+    assert shifted["features"]["Account length"]["status"] == "drift"
+    assert shifted["features"]["Account length"]["ks_significant"]
+
+    # Windows older than the horizon drop out; saved states merge when the reference matches
+    window = DriftMonitor(reference, window_seconds=60, n_windows=2)
+    window.update(X_test)
+    assert window.live_counts(now=time.time() + 180).sum() == 0
+    window.save(str(tmp_path / "serve-1.npz"))
+    merged = merge_saved(reference, str(tmp_path))
+    np.testing.assert_array_equal(merged, window.live_counts())
+
+    monkeypatch.setattr(flask_app, "DRIFT_DIR", str(tmp_path))
+    monkeypatch.setattr(flask_app, "DRIFT", True)
+    flask_app.registry = ModelRegistry(DATA_PATHS["model"], DATA_PATHS["transformer"])
+    assert flask_app.registry.reload()
+    flask_app.drift.reset(None)
+    flask_app.reset_drift(flask_app.registry.current())
+    client = flask_app.app.test_client()
+    record = {
+        'Account_length': 100, 'International_plan': 1, 'Number_vmail_messages': 25,
+        'Total_day_calls': 150, 'Total_day_charge': 45.5, 'Total_eve_calls': 130,
+        'Total_eve_charge': 35.7, 'Total_night_calls': 120, 'Total_night_charge': 30.2,
+        'Total_intl_calls': 30, 'Total_intl_charge': 10.5, 'Customer_service_calls': 2,
+        'state': 'CA'
+    }
+    assert client.post('/api/v1/predict', json=[record] * 5).status_code == 200
+    drift = client.get('/drift').get_json()
+    assert drift["rows"] == 5 + len(X_test) and set(drift["features"]) == set(reference.columns)
+
+    # A state whose newest window left the horizon (an exited process) is removed by the next report
+    assert merge_saved(reference, str(tmp_path), n_windows=2, now=time.time() + 180).sum() == 0
+    assert not (tmp_path / "serve-1.npz").exists()